@@ -1,20 +1,5 @@
 #!/bin/bash
 
+# Все программы компилируются в одном процессе Python (см. batch в pdp11_compiler.py)
 testdir=pdp11_tests
-pushd $testdir
-echo
-pwd
-for dirname in `(ls)`; do
-  echo "dirname=$dirname";
-  pdpfilename=`ls $dirname/*.pdp`
-  pdpfilename=`basename $pdpfilename`
-  echo "pdpfilename=$pdpfilename"
-
-  echo "PYTHON pdp11_compiler.py pdp11_tests/$dirname/${pdpfilename}"
-  python ../pdp11_compiler.py ../pdp11_tests/$dirname/${pdpfilename}
-
-  echo ""
-  echo ""
-done;
-
-popd
\ No newline at end of file
+python pdp11_compiler.py batch $testdir
@@ -0,0 +1,543 @@
+from collections.abc import Iterator
+from pathlib import Path
+from random import Random
+from tempfile import TemporaryDirectory
+from time import perf_counter
+import json
+import click
+from disasm import disassemble
+from funcs import recognize_arg, register_number
+from lexer import fast_recognize_arg
+from pdp11_compiler import LEXERS, OUTPUTS, PDP11_Parser
+from profiling import compile_with_stats
+from symbols import parse_expression
+
+
+TESTS_DIR = Path(__file__).parent / "pdp11_tests"
+
+# Размеры синтетических программ по умолчанию, строк
+BENCH_SIZES = (1000, 10000, 100000, 1000000)
+# Файлы базовых результатов, с которыми сравниваются бенчмарки сборки и разбора
+BASELINE_FILE = Path(__file__).parent / "bench_baseline.json"
+PARSE_BASELINE_FILE = Path(__file__).parent / "bench_parse_baseline.json"
+# Запоминающие функции разбора: перед каждым замером они очищаются,
+# чтобы способ разбора не пользовался разбором, сделанным до замера
+PARSE_CACHES = (recognize_arg, register_number, fast_recognize_arg, parse_expression)
+
+# Синтетическая программа делится на блоки ".=" по BLOCK_LINES строк,
+# в каждой LABEL_EVERY-й строке блока стоит метка. Строка занимает не больше 4 слов,
+# поэтому ветвления на 2 метки вперёд или назад всегда достают до цели,
+# а блок помещается в BLOCK_SIZE байт. Адреса блоков идут подряд, поэтому
+# в больших программах выходят за 16 бит: ассемблер их не проверяет
+BLOCK_LINES = 1024
+BLOCK_SIZE = 0o20000
+LABEL_EVERY = 8
+BRANCH_REACH = 2
+
+DOUBLE_COMMANDS = ("mov", "movb", "add", "sub", "cmp", "bic", "bis", "bit")
+SINGLE_COMMANDS = ("clr", "inc", "dec", "tst", "com", "neg", "asl", "asr", "tstb")
+BRANCHES = ("br", "bne", "beq", "bpl", "bmi", "bcc", "bcs", "bge", "blt", "bhi")
+# Режимы адресации: регистр, косвенные, автоинкремент и автодекремент, индексный,
+# непосредственный, абсолютный и относительный (метка)
+SOURCE_MODES = (
+    "R{r}",
+    "@R{r}",
+    "(R{r})+",
+    "-(R{r})",
+    "{n}(R{r})",
+    "#{n}",
+    "@#{a}",
+    "{label}",
+)
+DEST_MODES = ("R{r}", "@R{r}", "(R{r})+", "-(R{r})", "{n}(R{r})", "@#{a}", "{label}")
+# Виды строк и их доли в программе
+LINE_KINDS = {
+    "double": 35,
+    "single": 20,
+    "branch": 20,
+    "sob": 3,
+    "jsr": 4,
+    "rts": 2,
+    "word": 10,
+    "asciz": 4,
+    "comment": 2,
+}
+
+
+def corpus_lines() -> list[str]:
+    """
+    Собирает непустые строки всех программ из pdp11_tests
+    :return:
+        ['\t.= 1000;', '\tmov \t#2, R0;', ...]
+    """
+    lines = []
+    for filename in sorted(TESTS_DIR.glob("*/*.pdp")):
+        with open(filename) as file:
+            for file_string_ in file:
+                file_string_ = file_string_.rstrip()
+                if file_string_:
+                    lines.append(file_string_)
+    return lines
+
+
+def bench_parse(lines: list[str], lexer: str = "fast", repeat: int = 3) -> float:
+    """
+    Прогоняет строки через разбор строки и аргументов (для команд),
+    как это делает PDP11_Parser, repeat раз, каждый раз с пустыми PARSE_CACHES
+    Возвращает лучшую скорость разбора в строках в секунду
+    :param lines: строки программы
+    :param lexer: способ разбора (см. LEXERS)
+        'fast'
+    :param repeat: число замеров
+        3
+    :return:
+        12345.6
+    """
+    parse_line, recognize_args = LEXERS[lexer]
+    best = float("inf")
+    for _ in range(repeat):
+        for func in PARSE_CACHES:
+            func.cache_clear()
+        start = perf_counter()
+        for text in lines:
+            line = parse_line(text)
+            if line.name and line.args:
+                recognize_args(line.args)
+        best = min(best, perf_counter() - start)
+    return len(lines) / best
+
+
+def check_lexers(lines: list[str]) -> list[str]:
+    """
+    Сверяет разбор строк и аргументов всеми способами из LEXERS с грамматикой
+    Возвращает строки, которые разобраны иначе
+    :param lines: строки программы
+    :return:
+        []
+    """
+    parse_line, recognize_args = LEXERS["grammar"]
+    mismatches = []
+    for text in lines:
+        expected = parse_line(text)
+        for other_parse_line, other_recognize_args in LEXERS.values():
+            line = other_parse_line(text)
+            if line != expected or (
+                line.name
+                and other_recognize_args(line.args) != recognize_args(line.args)
+            ):
+                mismatches.append(text)
+                break
+    return mismatches
+
+
+def generate_program(n_lines: int, seed: int = 0) -> Iterator[str]:
+    """
+    Строит синтетическую программу из n_lines непустых строк: команды со всеми
+    режимами адресации, метки, ветвления вперёд и назад, sob, jsr/rts,
+    данные .WORD и .ASCIZ и блоки ".=" (см. BLOCK_LINES)
+    Одинаковый seed даёт одинаковую программу
+    :param n_lines: число строк
+        1000
+    :param seed: начальное значение генератора случайных чисел
+        0
+    :return: строки программы
+        '\t.=1000', 'L0:\tmov\t#17, R2', '\tbne\tL2', ...
+    """
+    rng = Random(seed)
+    kinds, weights = list(LINE_KINDS), list(LINE_KINDS.values())
+    last_group = max(0, (n_lines - 2) // LABEL_EVERY)
+
+    for line_num in range(n_lines):
+        block, position = divmod(line_num, BLOCK_LINES)
+        if position == 0:
+            yield f"\t.={0o1000 + block * BLOCK_SIZE:o}"
+            continue
+
+        group = line_num // LABEL_EVERY
+        first = block * BLOCK_LINES // LABEL_EVERY
+        last = min(first + BLOCK_LINES // LABEL_EVERY - 1, last_group)
+
+        def label(reach: int = BRANCH_REACH) -> str:
+            target = group + rng.randint(-reach, reach)
+            return f"L{min(max(target, first), last)}"
+
+        def operand(modes: tuple[str, ...]) -> str:
+            return rng.choice(modes).format(
+                r=rng.randrange(6),
+                n=f"{rng.randrange(0o1000):o}",
+                a=f"{rng.randrange(0o160000, 0o200000, 2):o}",
+                label=label(last - first),
+            )
+
+        labeled = position % LABEL_EVERY == 1
+        kind = rng.choices(kinds, weights)[0]
+        if labeled and kind == "comment":
+            kind = "single"
+
+        match kind:
+            case "double":
+                name = rng.choice(DOUBLE_COMMANDS)
+                text = f"{name}\t{operand(SOURCE_MODES)}, {operand(DEST_MODES)}"
+            case "single":
+                text = f"{rng.choice(SINGLE_COMMANDS)}\t{operand(DEST_MODES)}"
+            case "branch":
+                text = f"{rng.choice(BRANCHES)}\t{label()}"
+            case "sob":
+                # sob ветвится только назад - на метку своей группы строк
+                text = f"sob\tR{rng.randrange(6)}, L{group}"
+            case "jsr":
+                text = f"jsr\tPC, {label()}"
+            case "rts":
+                text = "rts\tPC"
+            case "word":
+                values = [f"{rng.randrange(0o200000):o}", label(), "."]
+                text = ".WORD\t" + ", ".join(values[: rng.randint(1, 3)])
+            case "asciz":
+                # Нечётная длина строки с нулём в конце сохраняет чётность адресов
+                size = rng.choice((1, 3, 5))
+                chars = "".join(chr(rng.randrange(0x41, 0x5B)) for _ in range(size))
+                text = f".ASCIZ\t/{chars}/"
+            case _:
+                text = f"; строка {line_num}"
+
+        if labeled:
+            yield f"L{group}:\t{text}"
+        else:
+            yield f"\t{text}"
+
+
+def write_program(filename: str | Path, n_lines: int, seed: int = 0) -> None:
+    """
+    Записывает синтетическую программу (см. generate_program) в файл
+    :param filename: имя файла
+        'synthetic_1000.pdp'
+    :param n_lines: число строк
+        1000
+    :param seed: начальное значение генератора случайных чисел
+    """
+    with open(filename, mode="w") as file:
+        file.writelines(line + "\n" for line in generate_program(n_lines, seed))
+
+
+def bench_compile(
+    filename: str, lexer: str = "fast", repeat: int = 3, outputs: str = "both"
+) -> dict:
+    """
+    Компилирует файл целиком (PDP11_Parser.compile без кэша) repeat раз
+    и ещё раз со статистикой фаз и памяти (см. profiling.compile_with_stats)
+    :param filename: имя файла-исходника
+        'synthetic_1000.pdp'
+    :param lexer: способ разбора (см. LEXERS)
+        'fast'
+    :param repeat: число замеров, берётся лучший
+        3
+    :param outputs: что записывает сборка (см. OUTPUTS)
+        'obj'
+    :return: результаты
+        {'outputs': 'obj', 'lines': 1000, 'seconds': 0.05, 'lines_per_second': 20000.0, 'bytes': 4000,
+         'peak_memory': 450000, 'phases': {...}}
+    """
+    best = float("inf")
+    for _ in range(repeat):
+        start = perf_counter()
+        PDP11_Parser(lexer=lexer, outputs=outputs).compile(filename)
+        best = min(best, perf_counter() - start)
+
+    record = compile_with_stats(PDP11_Parser(lexer=lexer, outputs=outputs), filename)
+    return {
+        "outputs": outputs,
+        "lines": record["lines"],
+        "seconds": best,
+        "lines_per_second": record["lines"] / best,
+        "bytes": record["bytes"],
+        "peak_memory": record["peak_memory"],
+        "phases": record["phases"],
+    }
+
+
+def bench_disasm(blocks: list[tuple[int, bytes]], repeat: int = 3) -> dict:
+    """
+    Дизассемблирует блоки целиком (disasm.disassemble) repeat раз, берётся лучший замер
+    :param blocks: адреса блоков и их байты
+        [(0o1000, b'\xc0\x15\x02\x00')]
+    :param repeat: число замеров
+        3
+    :return: результаты
+        {'bytes': 4194304, 'lines': 3559054, 'seconds': 0.9, 'megabytes_per_second': 4.4}
+    """
+    size = sum(len(data) for _, data in blocks)
+    best = float("inf")
+    for _ in range(repeat):
+        start = perf_counter()
+        lines = sum(text.count("\n") for text in disassemble(blocks))
+        best = min(best, perf_counter() - start)
+    return {
+        "bytes": size,
+        "lines": lines,
+        "seconds": best,
+        "megabytes_per_second": size / best / (1 << 20),
+    }
+
+
+def missing_baseline(baseline: str | Path) -> None:
+    """
+    Завершает бенчмарк с кодом 1, если базовых результатов нет: они снимаются
+    на этой машине (--save-baseline), в репозитории их нет, а замер без сравнения
+    не должен выглядеть как пройденная проверка (--no-baseline - только замер)
+    :param baseline: файл базовых результатов
+        'bench_baseline.json'
+    """
+    click.echo(
+        f"no baseline {baseline}: save one on the tree to compare against "
+        "with --save-baseline, or measure without comparing with --no-baseline",
+        err=True,
+    )
+    raise SystemExit(1)
+
+
+def regressions(results: dict, baseline: dict, tolerance: float) -> list[str]:
+    """
+    Сравнивает результаты бенчмарка сборки с базовыми
+    Регрессия - скорость ниже базовой или пик памяти выше базового больше чем на tolerance
+    Результаты с другими --outputs, чем у базовых, не сравниваются
+    :param results: результаты по размерам программ
+        {'1000': {'lines_per_second': 20000.0, 'peak_memory': 450000, ...}}
+    :param baseline: базовые результаты в том же виде
+    :param tolerance: допустимое отклонение, доля
+        0.2
+    :return: описания регрессий
+        ['1000 lines: 15000 lines/s < 20000 lines/s']
+    """
+    found = []
+    for size, result in results.items():
+        base = baseline.get(size)
+        if base is None or base.get("outputs", "both") != result["outputs"]:
+            continue
+        speed, base_speed = result["lines_per_second"], base["lines_per_second"]
+        if speed < base_speed * (1 - tolerance):
+            found.append(
+                f"{size} lines: {speed:.0f} lines/s < {base_speed:.0f} lines/s"
+            )
+        memory, base_memory = result["peak_memory"], base["peak_memory"]
+        if memory > base_memory * (1 + tolerance):
+            found.append(f"{size} lines: peak memory {memory} > {base_memory} bytes")
+    return found
+
+
+@click.group()
+def bench():
+    """Бенчмарки ассемблера"""
+
+
+@bench.command("parse")
+@click.option(
+    "--lines",
+    "n_lines",
+    default=20000,
+    show_default=True,
+    help="Число разбираемых строк",
+)
+@click.option("--repeat", default=3, show_default=True, help="Число замеров разбора")
+@click.option(
+    "--seed", default=0, show_default=True, help="Начальное значение генератора"
+)
+@click.option(
+    "--baseline", default=str(PARSE_BASELINE_FILE), help="Файл базовых результатов"
+)
+@click.option("--save-baseline", is_flag=True, help="Записать результаты как базовые")
+@click.option(
+    "--no-baseline",
+    is_flag=True,
+    help="Только замерить, не сравнивая с базовыми результатами",
+)
+@click.option(
+    "--tolerance",
+    default=0.2,
+    show_default=True,
+    help="Допустимое отклонение от базовых результатов, доля",
+)
+def bench_parse_lines(
+    n_lines: int,
+    repeat: int,
+    seed: int,
+    baseline: str,
+    save_baseline: bool,
+    no_baseline: bool,
+    tolerance: float,
+):
+    """
+    Сверяет способы разбора на строках pdp11_tests и замеряет их скорость
+    на строках синтетической программы (почти все строки разные), сравнивая с базовой
+    """
+    mismatches = check_lexers(corpus_lines())
+    for text in mismatches:
+        click.echo(f"lexer mismatch: {text!r}")
+
+    compare = not (save_baseline or no_baseline)
+    if compare and not Path(baseline).exists():
+        missing_baseline(baseline)
+
+    lines = list(generate_program(n_lines, seed))
+    base = {}
+    if compare:
+        with open(baseline) as file:
+            base = json.load(file)
+
+    results, found = {}, []
+    for lexer in LEXERS:
+        speed = bench_parse(lines, lexer, repeat)
+        results[lexer] = {"lines": len(lines), "lines_per_second": speed}
+        message = f"parse ({lexer}): {len(lines)} lines, {speed:.0f} lines/s"
+        base_speed = base.get(lexer, {}).get("lines_per_second")
+        if base_speed:
+            change = 100 * (speed / base_speed - 1)
+            message += f", baseline {base_speed:.0f} lines/s ({change:+.1f}%)"
+            if speed < base_speed * (1 - tolerance):
+                found.append(
+                    f"parse ({lexer}): {speed:.0f} lines/s < {base_speed:.0f} lines/s"
+                )
+        elif compare:
+            message += ", no baseline"
+        click.echo(message)
+
+    if save_baseline:
+        with open(baseline, mode="w") as file:
+            json.dump(results, file, indent=2)
+        click.echo(f"baseline saved to {baseline}")
+    for regression in found:
+        click.echo(f"regression: {regression}")
+    if mismatches or found:
+        raise SystemExit(1)
+
+
+@bench.command("compile")
+@click.option(
+    "--sizes",
+    default=",".join(map(str, BENCH_SIZES)),
+    show_default=True,
+    help="Размеры синтетических программ через запятую, строк",
+)
+@click.option("--lexer", type=click.Choice(list(LEXERS)), default="fast")
+@click.option("--repeat", default=3, show_default=True, help="Число замеров сборки")
+@click.option(
+    "--outputs",
+    type=click.Choice(OUTPUTS),
+    default="both",
+    show_default=True,
+    help="Что записывает сборка: .o и .l, только .o или только .l",
+)
+@click.option(
+    "--seed", default=0, show_default=True, help="Начальное значение генератора"
+)
+@click.option("--baseline", default=str(BASELINE_FILE), help="Файл базовых результатов")
+@click.option("--save-baseline", is_flag=True, help="Записать результаты как базовые")
+@click.option(
+    "--no-baseline",
+    is_flag=True,
+    help="Только замерить, не сравнивая с базовыми результатами",
+)
+@click.option(
+    "--tolerance",
+    default=0.2,
+    show_default=True,
+    help="Допустимое отклонение от базовых результатов, доля",
+)
+def bench_compile_sizes(
+    sizes: str,
+    lexer: str,
+    repeat: int,
+    outputs: str,
+    seed: int,
+    baseline: str,
+    save_baseline: bool,
+    no_baseline: bool,
+    tolerance: float,
+):
+    """
+    Собирает синтетические программы и сравнивает скорость и память с базовыми
+    """
+    compare = not (save_baseline or no_baseline)
+    if compare and not Path(baseline).exists():
+        missing_baseline(baseline)
+
+    results = {}
+    with TemporaryDirectory() as directory:
+        for n_lines in map(int, sizes.split(",")):
+            filename = str(Path(directory) / f"synthetic_{n_lines}.pdp")
+            write_program(filename, n_lines, seed)
+            result = bench_compile(filename, lexer, repeat, outputs)
+            results[str(n_lines)] = result
+            phases = ", ".join(
+                f"{name} {phase['seconds']:.3f}s"
+                for name, phase in result["phases"].items()
+            )
+            click.echo(
+                f"compile ({outputs}): {n_lines} lines, {result['seconds']:.3f}s, "
+                f"{result['lines_per_second']:.0f} lines/s, {result['bytes']} bytes, "
+                f"peak memory {result['peak_memory'] / 1024:.1f} KiB"
+            )
+            click.echo(f"  phases: {phases}")
+
+    if save_baseline:
+        with open(baseline, mode="w") as file:
+            json.dump(results, file, indent=2)
+        click.echo(f"baseline saved to {baseline}")
+    if not compare:
+        return
+
+    with open(baseline) as file:
+        found = regressions(results, json.load(file), tolerance)
+    for regression in found:
+        click.echo(f"regression: {regression}")
+    if found:
+        raise SystemExit(1)
+
+
+@bench.command("disasm")
+@click.option(
+    "--lines",
+    "n_lines",
+    default=100000,
+    show_default=True,
+    help="Число строк синтетической программы, образ которой дизассемблируется",
+)
+@click.option(
+    "--megabytes",
+    default=4,
+    show_default=True,
+    help="Размер образа из случайных слов, МБ",
+)
+@click.option("--repeat", default=3, show_default=True, help="Число замеров")
+@click.option(
+    "--seed", default=0, show_default=True, help="Начальное значение генератора"
+)
+def bench_disasm_images(n_lines: int, megabytes: int, repeat: int, seed: int):
+    """
+    Замеряет дизассемблирование образа собранной синтетической программы
+    и образа из случайных слов (почти все слова разные)
+    """
+    parser = PDP11_Parser(outputs="obj", workers=1)
+    with TemporaryDirectory() as directory:
+        filename = str(Path(directory) / f"synthetic_{n_lines}.pdp")
+        write_program(filename, n_lines, seed)
+        parser.assemble(filename)
+    images = {
+        f"program ({n_lines} lines)": [
+            (address, bytes(data))
+            for address, data in parser.object_lines.items()
+            if data
+        ],
+        f"random words ({megabytes} MB)": [
+            (0, Random(seed).randbytes(megabytes << 20))
+        ],
+    }
+    for name, blocks in images.items():
+        result = bench_disasm(blocks, repeat)
+        click.echo(
+            f"disasm {name}: {result['bytes']} bytes, {result['lines']} lines, "
+            f"{result['seconds']:.3f}s, {result['megabytes_per_second']:.2f} MB/s"
+        )
+
+
+if __name__ == "__main__":
+    bench()
@@ -0,0 +1,241 @@
+from collections.abc import Iterable
+from functools import lru_cache
+from hashlib import sha256
+from pathlib import Path
+import marshal
+import os
+import shutil
+import sys
+from funcs import CodedLine
+
+# Каталог кэша по умолчанию - общий для всех проектов пользователя, по XDG:
+# $XDG_CACHE_HOME/pdp11 или ~/.cache/pdp11 (записи не зависят от каталога программы,
+# а в текущем каталоге кэш появлялся бы там, откуда запущен компилятор)
+CACHE_DIR = str(
+    Path(os.environ.get("XDG_CACHE_HOME") or Path.home() / ".cache") / "pdp11"
+)
+# Ограничение размера кэша по умолчанию, байт
+CACHE_SIZE = 64 << 20
+# До какой доли max_size prune сокращает переполненный кэш: запас до следующего
+# переполнения, чтобы полный кэш не обходился заново при каждой записи
+PRUNE_TARGET = 0.75
+# Модули, код которых формирует .o, .l и .map: изменение любого из них сбрасывает кэш.
+# emulator.py, devices.py, server.py и profiling.py в сборке не участвуют
+ASSEMBLER_SOURCES = (
+    "pdp11_compiler.py",
+    "funcs.py",
+    "lexer.py",
+    "cache.py",
+    "commands.py",
+    "symbols.py",
+    "macros.py",
+    "includes.py",
+    "symmap.py",
+    "objfile.py",
+)
+
+
+@lru_cache(maxsize=1)
+def assembler_version() -> str:
+    """
+    Возвращает хэш исходников ассемблера, которым помечаются все записи кэша
+    :return:
+        '3f2a...'
+    """
+    digest = sha256(sys.version.encode())
+    for name in ASSEMBLER_SOURCES:
+        digest.update((Path(__file__).parent / name).read_bytes())
+    return digest.hexdigest()
+
+
+class AssemblyCache:
+    """
+    Кэш результатов сборки на диске:
+    files/<ключ>.o и .l - готовые .o и .l по хэшу исходника, версии ассемблера и параметров,
+    lines/<хэш пути> - закодированные строки последней сборки файла по их тексту.
+    Закодированная строка (CodedLine) зависит только от своего текста,
+    адреса и имена подставляются при размещении, поэтому её можно переиспользовать
+    в изменённом файле. Самые давно использованные записи удаляются,
+    когда кэш больше max_size байт
+    """
+
+    def __init__(self, directory: str | Path = CACHE_DIR, max_size: int = CACHE_SIZE):
+        self.directory = Path(directory)
+        self.max_size = max_size
+        # Размер кэша по последнему обходу каталога плюс записанное этим процессом
+        # после него (None - каталог ещё не обходили): каталог обходится заново,
+        # только когда размер превышает max_size, а не при каждой записи
+        self.size: int | None = None
+
+    def file_key(
+        self,
+        filename: str | Path,
+        options: dict,
+        dependencies: Iterable[str | Path] = (),
+    ) -> str:
+        """
+        Возвращает ключ результата сборки файла
+        :param filename: имя файла-исходника
+            '01_sum.pdp'
+        :param options: параметры PDP11_Parser, влияющие на сборку
+            {'lexer': 'fast'}
+        :param dependencies: файлы, которые вставляет исходник (.INCLUDE)
+            [Path('/root/package/pdp11_tests/common/devices.inc')]
+        :return:
+            '9b1c...'
+        """
+        digest = sha256(assembler_version().encode())
+        digest.update(repr(sorted(options.items())).encode())
+        digest.update(Path(filename).read_bytes())
+        for path in dependencies:
+            digest.update(str(path).encode())
+            try:
+                digest.update(Path(path).read_bytes())
+            except FileNotFoundError:
+                pass
+        return digest.hexdigest()
+
+    def restore(self, key: str, *targets: str | Path) -> bool:
+        """
+        Копирует сохранённые под ключом key файлы в targets (по суффиксу)
+        :param key: ключ результата сборки
+        :param targets: имена файлов .o и .l
+            '01_sum.pdp.o', '01_sum.pdp.l'
+        :return: True, если все файлы нашлись в кэше
+            True
+        """
+        entries = [self.directory / "files" / (key + Path(t).suffix) for t in targets]
+        try:
+            for entry, target in zip(entries, targets):
+                shutil.copyfile(entry, target)
+                # Отмечаем использование записи для LRU
+                os.utime(entry)
+        except FileNotFoundError:
+            return False
+        return True
+
+    def store(self, key: str, *sources: str | Path) -> None:
+        """
+        Сохраняет файлы sources под ключом key
+        :param key: ключ результата сборки
+        :param sources: имена файлов .o и .l
+            '01_sum.pdp.o', '01_sum.pdp.l'
+        """
+        written = 0
+        for source in sources:
+            path = self.directory / "files" / (key + Path(source).suffix)
+            written += self.write(path, source)
+        self.grow(written)
+
+    def lines_path(self, filename: str | Path, options: dict) -> Path:
+        """
+        Возвращает путь записи закодированных строк файла
+        :param filename: имя файла-исходника
+            '01_sum.pdp'
+        :param options: параметры PDP11_Parser, влияющие на сборку
+            {'lexer': 'fast'}
+        :return:
+            Path('/home/user/.cache/pdp11/lines/5d0e...')
+        """
+        digest = sha256(str(Path(filename).resolve()).encode())
+        digest.update(repr(sorted(options.items())).encode())
+        name = digest.hexdigest()
+        return self.directory / "lines" / name
+
+    def load_lines(self, filename: str | Path, options: dict) -> dict[str, tuple]:
+        """
+        Возвращает закодированные строки прошлой сборки файла
+        (пустой словарь, если их нет или они собраны другой версией ассемблера)
+        Строки хранятся простыми кортежами в порядке полей CodedLine,
+        PDP11_Parser.place_line распаковывает их так же, как CodedLine
+        :param filename: имя файла-исходника
+            '01_sum.pdp'
+        :param options: параметры PDP11_Parser
+            {'lexer': 'fast'}
+        :return:
+            {'\tmov \t#2, R0;': (None, None, None, None, 16, (0o012700, 0o000002), ()), ...}
+        """
+        path = self.lines_path(filename, options)
+        try:
+            version, lines = marshal.loads(path.read_bytes())
+            os.utime(path)
+        except (OSError, EOFError, ValueError, TypeError):
+            return {}
+        return lines if version == assembler_version() else {}
+
+    def store_lines(
+        self, filename: str | Path, options: dict, lines: dict[str, CodedLine]
+    ) -> None:
+        """
+        Сохраняет закодированные строки сборки файла
+        :param filename: имя файла-исходника
+            '01_sum.pdp'
+        :param options: параметры PDP11_Parser
+            {'lexer': 'fast'}
+        :param lines: закодированные строки по их тексту
+            {'\tmov \t#2, R0;': CodedLine(words=(0o012700, 0o000002)), ...}
+        """
+        # marshal быстрее pickle, но принимает только встроенные типы
+        flat = {
+            text: (*coded[:-1], tuple(map(tuple, coded[-1])))
+            for text, coded in lines.items()
+        }
+        data = marshal.dumps((assembler_version(), flat))
+        self.grow(self.write(self.lines_path(filename, options), data))
+
+    @classmethod
+    def write(cls, path: Path, source: str | Path | bytes) -> int:
+        """
+        Атомарно записывает в path байты или копию файла source,
+        чтобы параллельные сборки не видели недописанных записей
+        :param path: путь записи в кэше
+        :param source: байты или имя копируемого файла
+        :return: размер записи, байт
+            1234
+        """
+        path.parent.mkdir(parents=True, exist_ok=True)
+        temp = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+        if isinstance(source, bytes):
+            temp.write_bytes(source)
+        else:
+            shutil.copyfile(source, temp)
+        size = temp.stat().st_size
+        os.replace(temp, path)
+        return size
+
+    def grow(self, written: int) -> None:
+        """
+        Учитывает записанные байты и обходит каталог (prune), только если кэш,
+        возможно, стал больше max_size или ещё не обходился этим процессом
+        :param written: сколько байт записано
+            1234
+        """
+        if self.size is None or self.size + written > self.max_size:
+            self.prune()
+        else:
+            self.size += written
+
+    def prune(self) -> None:
+        """
+        Удаляет самые давно использованные записи, если кэш больше max_size байт,
+        пока он не станет не больше PRUNE_TARGET от max_size
+        """
+        entries = []
+        for path in self.directory.glob("*/*"):
+            # Недописанные записи других процессов не трогаем
+            if path.suffix == ".tmp":
+                continue
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+
+        total = sum(size for _, size, _ in entries)
+        if total > self.max_size:
+            for _, size, path in sorted(entries):
+                if total <= self.max_size * PRUNE_TARGET:
+                    break
+                path.unlink(missing_ok=True)
+                total -= size
+        self.size = total
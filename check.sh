@@ -1,22 +1,6 @@
 #!/bin/bash
 
+# Программы компилируются в памяти и сверяются с exp_*.pdp.o и exp_*.pdp.l
+# без записи файлов (см. verify в pdp11_compiler.py)
 testdir=pdp11_tests
-pushd $testdir
-echo
-pwd
-for dirname in `(ls)`; do
-  echo "dirname=$dirname";
-  pdpfilename=`ls $dirname/*.pdp`
-  pdpfilename=`basename $pdpfilename`
-  echo "pdpfilename=$pdpfilename"
-
-  echo "DIFF $dirname/${pdpfilename}.o"
-  diff $dirname/${pdpfilename}.o $dirname/exp_${pdpfilename}.o  --ignore-trailing-space
-  echo "DIFF $dirname/${pdpfilename}.l"
-  diff $dirname/${pdpfilename}.l $dirname/exp_${pdpfilename}.l  --ignore-trailing-space
-
-  echo ""
-  echo ""
-done;
-
-popd
\ No newline at end of file
+python pdp11_compiler.py verify $testdir
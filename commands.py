@@ -0,0 +1,157 @@
+from dataclasses import dataclass
+
+# Форматы команд и биты, которые занимают их поля:
+# "" - без аргументов; SSDD - SS 6-11, DD 0-5; DD - 0-5; RDD - R 6-8, DD 0-5;
+# R - 0-2; RNN - R 6-8, NN (смещение sob назад) 0-5; XX - смещение ветвления 0-7;
+# N3, N6, N8 - число в младших 3, 6 или 8 битах (spl, mark, emt/trap)
+FORMAT_FIELDS = {
+    "": 0,
+    "SSDD": 0o7777,
+    "DD": 0o77,
+    "RDD": 0o777,
+    "R": 0o7,
+    "RNN": 0o777,
+    "XX": 0o377,
+    "N3": 0o7,
+    "N6": 0o77,
+    "N8": 0o377,
+}
+
+# Базовый набор команд PDP-11 (LSI-11, без EIS и FIS): формат -> {мнемоника: код}
+# Для команд из BYTE_VARIANTS есть байтовый вариант <мнемоника>b с кодом | 0o100000
+ISA = {
+    "SSDD": {
+        "mov": 0o010000,
+        "cmp": 0o020000,
+        "bit": 0o030000,
+        "bic": 0o040000,
+        "bis": 0o050000,
+        "add": 0o060000,
+        "sub": 0o160000,
+    },
+    "DD": {
+        "jmp": 0o000100,
+        "swab": 0o000300,
+        "clr": 0o005000,
+        "com": 0o005100,
+        "inc": 0o005200,
+        "dec": 0o005300,
+        "neg": 0o005400,
+        "adc": 0o005500,
+        "sbc": 0o005600,
+        "tst": 0o005700,
+        "ror": 0o006000,
+        "rol": 0o006100,
+        "asr": 0o006200,
+        "asl": 0o006300,
+        "sxt": 0o006700,
+        "mtps": 0o106400,
+        "mfps": 0o106700,
+    },
+    "RDD": {"jsr": 0o004000, "xor": 0o074000},
+    "R": {"rts": 0o000200},
+    "RNN": {"sob": 0o077000},
+    "XX": {
+        "br": 0o000400,
+        "bne": 0o001000,
+        "beq": 0o001400,
+        "bge": 0o002000,
+        "blt": 0o002400,
+        "bgt": 0o003000,
+        "ble": 0o003400,
+        "bpl": 0o100000,
+        "bmi": 0o100400,
+        "bhi": 0o101000,
+        "blos": 0o101400,
+        "bvc": 0o102000,
+        "bvs": 0o102400,
+        "bcc": 0o103000,
+        "bhis": 0o103000,
+        "bcs": 0o103400,
+        "blo": 0o103400,
+    },
+    "N3": {"spl": 0o000230},
+    "N6": {"mark": 0o006400},
+    "N8": {"emt": 0o104000, "trap": 0o104400},
+    "": {
+        "halt": 0o000000,
+        "wait": 0o000001,
+        "rti": 0o000002,
+        "bpt": 0o000003,
+        "iot": 0o000004,
+        "reset": 0o000005,
+        "rtt": 0o000006,
+        "nop": 0o000240,
+        "clc": 0o000241,
+        "clv": 0o000242,
+        "clz": 0o000244,
+        "cln": 0o000250,
+        "ccc": 0o000257,
+        "sec": 0o000261,
+        "sev": 0o000262,
+        "sez": 0o000264,
+        "sen": 0o000270,
+        "scc": 0o000277,
+    },
+}
+
+BYTE_VARIANTS = (
+    "mov",
+    "cmp",
+    "bit",
+    "bic",
+    "bis",
+    "clr",
+    "com",
+    "inc",
+    "dec",
+    "neg",
+    "adc",
+    "sbc",
+    "tst",
+    "ror",
+    "rol",
+    "asr",
+    "asl",
+)
+
+
+@dataclass(frozen=True)
+class Command:
+    name: str
+    opcode: int
+    # Формат из FORMAT_FIELDS
+    fmt: str = ""
+    # Байтовый вариант команды (movb, clrb, ...)
+    byte: bool = False
+
+    @property
+    def mask(self) -> int:
+        """
+        Возвращает маску неизменяемых битов команды (всё, кроме полей аргументов):
+        слово word кодирует эту команду, если word & mask == opcode
+        :return:
+            0o170000
+        """
+        return 0o177777 & ~FORMAT_FIELDS[self.fmt]
+
+
+def build_commands() -> dict[str, Command]:
+    """
+    Разворачивает таблицу ISA в команды, добавляя байтовые варианты
+    :return:
+        {'mov': Command(name='mov', opcode=0o010000, fmt='SSDD'),
+         'movb': Command(name='movb', opcode=0o110000, fmt='SSDD', byte=True), ...}
+    """
+    commands = {}
+    for fmt, opcodes in ISA.items():
+        for name, opcode in opcodes.items():
+            commands[name] = Command(name=name, opcode=opcode, fmt=fmt)
+            if name in BYTE_VARIANTS:
+                commands[name + "b"] = Command(
+                    name=name + "b", opcode=opcode | 0o100000, fmt=fmt, byte=True
+                )
+    return commands
+
+
+COMMANDS = build_commands()
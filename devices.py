@@ -0,0 +1,119 @@
+from typing import BinaryIO
+
+# Начало страницы ввода-вывода: регистры устройств лежат по адресам 160000-177777
+IO_PAGE = 0o160000
+# Бит готовности в регистре состояния
+READY = 0o200
+
+
+class Device:
+    """
+    Устройство на странице ввода-вывода
+    Эмулятор передаёт устройству обращения к его регистрам (адреса слов из registers)
+    """
+
+    # Адреса регистров устройства
+    registers: tuple[int, ...] = ()
+
+    def __init__(self):
+        self.emulator = None
+
+    def attach(self, emulator) -> None:
+        """
+        Подключает устройство к эмулятору: по emulator.steps устройство отсчитывает время
+        """
+        self.emulator = emulator
+
+    def read(self, address: int) -> int:
+        """
+        Читает слово регистра
+        :param address: адрес регистра
+            0o177564
+        :return:
+            0o200
+        """
+        return 0
+
+    def write(self, address: int, value: int) -> None:
+        """
+        Пишет в регистр слово или байт (для байта - младший байт регистра)
+        :param address: адрес регистра
+            0o177566
+        :param value: значение
+            0o52
+        """
+
+    def flush(self) -> None:
+        """
+        Дописывает накопленный вывод
+        """
+
+
+class Console(Device):
+    """
+    Консоль: приёмник (RCSR, RBUF) и передатчик (XCSR, XBUF)
+    Вывод копится в буфере и пишется в output крупными кусками.
+    Передатчик после символа не готов delay команд, приёмник готов, пока есть ввод
+    """
+
+    RCSR = 0o177560
+    RBUF = 0o177562
+    XCSR = 0o177564
+    XBUF = 0o177566
+    registers = (RCSR, RBUF, XCSR, XBUF)
+
+    def __init__(
+        self,
+        output: BinaryIO | None = None,
+        input_data: bytes = b"",
+        delay: int = 0,
+        buffer_size: int = 1 << 16,
+    ):
+        super().__init__()
+        self.output = output
+        self.input_data = input_data
+        self.input_pos = 0
+        self.delay = delay
+        self.buffer_size = buffer_size
+        # Ещё не записанный в output вывод
+        self.buffer = bytearray()
+        # Номер команды, с которой передатчик снова готов
+        self.ready_at = 0
+
+    def transmitter_ready(self) -> bool:
+        emulator = self.emulator
+        if emulator.steps >= self.ready_at:
+            return True
+        # Программа ждёт готовности в цикле опроса - пропускаем его целиком
+        return emulator.skip_polling(self.ready_at - emulator.steps)
+
+    def read(self, address: int) -> int:
+        if address == self.XCSR:
+            return READY if self.transmitter_ready() else 0
+        if address == self.RCSR:
+            return READY if self.input_pos < len(self.input_data) else 0
+        if address == self.RBUF and self.input_pos < len(self.input_data):
+            self.input_pos += 1
+            return self.input_data[self.input_pos - 1]
+        return 0
+
+    def write(self, address: int, value: int) -> None:
+        if address != self.XBUF:
+            return
+        self.buffer.append(value & 0o377)
+        self.ready_at = self.emulator.steps + self.delay
+        if len(self.buffer) >= self.buffer_size:
+            self.flush()
+
+    def flush(self) -> None:
+        if self.output is not None and self.buffer:
+            self.output.write(self.buffer)
+            self.output.flush()
+            self.buffer.clear()
+
+    @property
+    def text(self) -> str:
+        """
+        Ещё не записанный вывод как текст (для вывода без output)
+        """
+        return self.buffer.decode("latin-1")
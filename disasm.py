@@ -0,0 +1,507 @@
+from collections.abc import Iterable, Iterator
+from array import array
+from functools import lru_cache
+import sys
+from commands import COMMANDS, Command
+from funcs import listing_comm, word2oct
+
+# numpy необязателен: без него блоки разбираются циклом Python (см. block_text).
+# Импортируется при первом разборе (load_numpy), а не с модулем: pdp11_compiler
+# импортирует этот модуль при каждом запуске
+np = None
+
+# Дизассемблер .o любого формата: слова блока разбираются по таблице из 65536 записей,
+# построенной по COMMANDS (build_decode_table), в строки листинга целым блоком.
+# Слова, которые не кодируют команду, и команды, которым не хватило слов
+# до конца блока, выводятся как .WORD, нечётный последний байт блока - как .BYTE.
+# Команда: python pdp11_compiler.py disasm FILENAME
+
+WORD_MASK = 0o177777
+BYTE_MASK = 0o377
+BYTE_SIGN = 0o200
+
+REGISTER_NAMES = ("R0", "R1", "R2", "R3", "R4", "R5", "SP", "PC")
+
+
+def operand(mode: int, reg: int) -> tuple[str, tuple[str, ...]]:
+    """
+    Запись операнда по режиму адресации и регистру, с местами {} для значений
+    из дополнительных слов и их видами: "word" - само слово,
+    "rel" - адрес, на который указывает смещение относительно PC
+    :param mode: режим адресации
+        2
+    :param reg: регистр
+        7
+    :return:
+        ('#{}', ('word',))
+    """
+    name = REGISTER_NAMES[reg]
+    if reg == 7 and mode in (2, 3):
+        return ("#{}", "@#{}")[mode - 2], ("word",)
+    if reg == 7 and mode in (6, 7):
+        return ("{}", "@{}")[mode - 6], ("rel",)
+    match mode:
+        case 0:
+            return name, ()
+        case 1:
+            return f"({name})", ()
+        case 2:
+            return f"({name})+", ()
+        case 3:
+            return f"@({name})+", ()
+        case 4:
+            return f"-({name})", ()
+        case 5:
+            return f"@-({name})", ()
+        case 6:
+            return "{}" + f"({name})", ("word",)
+    return "@{}" + f"({name})", ("word",)
+
+
+def decode_text(command: Command, word: int) -> tuple[str, tuple]:
+    """
+    Текст команды, закодированной словом word, с местами {} для значений
+    и виды этих значений: "word", "rel" (см. operand) или число - смещение
+    адреса ветвления в байтах от адреса после слова команды
+    :param command: команда из COMMANDS
+        Command(name='br', opcode=0o000400, fmt='XX')
+    :param word: слово команды
+        0o000777
+    :return:
+        ('\\tbr\\t{}', (-2,))
+    """
+    name = command.name
+    match command.fmt:
+        case "SSDD":
+            source, source_fills = operand((word >> 9) & 7, (word >> 6) & 7)
+            destination, destination_fills = operand((word >> 3) & 7, word & 7)
+            return (
+                f"\t{name}\t{source}, {destination}",
+                source_fills + destination_fills,
+            )
+        case "DD":
+            destination, fills = operand((word >> 3) & 7, word & 7)
+            return f"\t{name}\t{destination}", fills
+        case "RDD":
+            destination, fills = operand((word >> 3) & 7, word & 7)
+            return f"\t{name}\t{REGISTER_NAMES[(word >> 6) & 7]}, {destination}", fills
+        case "R":
+            return f"\t{name}\t{REGISTER_NAMES[word & 7]}", ()
+        case "RNN":
+            register = REGISTER_NAMES[(word >> 6) & 7]
+            return f"\t{name}\t{register}, {{}}", (-2 * (word & 0o77),)
+        case "XX":
+            offset = word & BYTE_MASK
+            offset = offset - 0o400 if offset & BYTE_SIGN else offset
+            return f"\t{name}\t{{}}", (2 * offset,)
+        case "":
+            return f"\t{name}", ()
+    # N3, N6, N8 - число в полях команды
+    return f"\t{name}\t{word & ~command.mask & WORD_MASK:o}", ()
+
+
+def build_decode_table() -> list[tuple[str, tuple]]:
+    """
+    Строит таблицу разбора всех 65536 слов (как emulator.build_dispatch):
+    текст команды с местами для значений и их виды (см. decode_text);
+    слова, которые не кодируют команду, - данные .WORD.
+    Из синонимов (bcc и bhis) берётся первый
+    :return:
+        [('\\thalt', ()), ('\\twait', ()), ...]
+    """
+    table = [None] * (WORD_MASK + 1)
+    for command in COMMANDS.values():
+        fields = WORD_MASK & ~command.mask
+        # Перебираем все значения полей: подмножества битов fields
+        sub = fields
+        while True:
+            word = command.opcode | sub
+            if table[word] is None:
+                table[word] = decode_text(command, word)
+            if sub == 0:
+                break
+            sub = (sub - 1) & fields
+    for word, entry in enumerate(table):
+        if entry is None:
+            table[word] = (f"\t.WORD\t{word:o}", ())
+    return table
+
+
+@lru_cache(maxsize=1)
+def python_tables() -> tuple[list, list[str], list[str]]:
+    """
+    Таблицы разбора по словам для цикла Python (decode_block): строятся при первом
+    разборе, а не при импорте - на это уходят десятые доли секунды
+    :return: таблица разбора (см. build_decode_table), строки листинга со словом
+        (см. funcs.listing_comm) и восьмеричные тексты слов
+        ([('\\thalt', ()), ...], ['\\t000000', ...], ['0', ...])
+    """
+    return (
+        build_decode_table(),
+        ["\t" + word2oct(word) for word in range(WORD_MASK + 1)],
+        [f"{word:o}" for word in range(WORD_MASK + 1)],
+    )
+
+
+# По сколько слов decode_block_numpy разбирает за раз (память - десятки байт на слово)
+DECODE_CHUNK = 1 << 16
+# Кусок слов в instruction_starts: куски проходятся по слову циклом Python,
+# а цепочка кусков - по куску, при кусках по 64 слова оба цикла коротки.
+# Блок не больше 64 кусков проходится прямо по словам
+STARTS_PIECE = 64
+# Младшие три цифры адреса с отступом строки листинга
+ADDRESS_LOWS = [f"{low:03o}:\t\t" for low in range(0o1000)]
+
+# Виды значений в таблицах numpy_tables: нет значения, слово, адрес по смещению
+# относительно PC ("rel"), адрес ветвления, само слово команды (.WORD без слов)
+NO_FILL, WORD_FILL, REL_FILL, BRANCH_FILL, SELF_FILL = range(5)
+# Строки numpy_tables сверх слов: команда, которой не хватило слов до конца блока,
+# и пустая строка для слов, с которых команда не начинается
+SHORT_ENTRY = WORD_MASK + 1
+BLANK_ENTRY = WORD_MASK + 2
+
+
+@lru_cache(maxsize=1)
+def load_numpy() -> bool:
+    """
+    Импортирует numpy в np этого модуля
+    :return: есть ли numpy
+        True
+    """
+    global np
+    try:
+        import numpy
+    except ImportError:
+        return False
+    np = numpy
+    return True
+
+
+def text_columns(texts: list[bytes]) -> "np.ndarray":
+    """
+    Тексты элементами одной ширины (np.void), дополненными нулями
+    :param texts: тексты
+        [b'\\tmov\\t#', b'\\thalt']
+    :return: массив из len(texts) элементов шириной в самый длинный текст
+        array([b'\\x09\\x6d\\x6f\\x76\\x09\\x23', b'\\x09\\x68\\x61\\x6c\\x74\\x00'], dtype='|V6')
+    """
+    width = max(map(len, texts))
+    return np.frombuffer(
+        b"".join(text.ljust(width, b"\0") for text in texts), f"V{width}"
+    )
+
+
+@lru_cache(maxsize=1)
+def numpy_tables() -> dict[str, "np.ndarray"]:
+    """
+    Таблицы для decode_block_numpy (строки байт, дополненные нулями - нули потом
+    выбрасываются): текст каждого слова, разрезанный местами для значений на три куска
+    (в конце последнего - перевод строки), виды значений (см. NO_FILL), число
+    дополнительных слов команды и смещение ветвления; восьмеричные тексты чисел,
+    строки листинга со словом и младшие три цифры адреса с отступом
+    :return: массивы по именам
+        {'seg0': array([[9, 104, 97, 108, 116, ...]]), 'kind0': array([0, ...]), ...}
+    """
+    kinds = {"word": WORD_FILL, "rel": REL_FILL}
+    segments: list[list[bytes]] = [[], [], []]
+    fill_kinds = np.zeros((2, BLANK_ENTRY + 1), "u1")
+    offsets = np.zeros(BLANK_ENTRY + 1, "i8")
+    entries = [*python_tables()[0], ("\t.WORD\t{}", (SELF_FILL,))]
+    for word, (text, fills) in enumerate(entries):
+        pieces = text.encode().split(b"{}")
+        pieces += [b""] * (3 - len(pieces))
+        pieces[2] += b"\n"
+        for segment, piece in zip(segments, pieces):
+            segment.append(piece)
+        for number, fill in enumerate(fills):
+            if type(fill) is int and word != SHORT_ENTRY:
+                fill_kinds[number, word] = BRANCH_FILL
+                offsets[word] = fill
+            else:
+                fill_kinds[number, word] = kinds.get(fill, fill)
+    for segment in segments:
+        segment.append(b"")
+    extra = (fill_kinds == WORD_FILL).sum(axis=0) + (fill_kinds == REL_FILL).sum(axis=0)
+    # Текст команды - запись из кусков и мест для значений (заполняются при разборе)
+    seg0, seg1, seg2 = map(text_columns, segments)
+    numbers = text_columns(
+        [f"{word:o}".encode() for word in range(WORD_MASK + 1)] + [b""]
+    )
+    texts = np.zeros(
+        BLANK_ENTRY + 1,
+        [
+            ("seg0", seg0.dtype),
+            ("number0", numbers.dtype),
+            ("seg1", seg1.dtype),
+            ("number1", numbers.dtype),
+            ("seg2", seg2.dtype),
+        ],
+    )
+    texts["seg0"], texts["seg1"], texts["seg2"] = seg0, seg1, seg2
+    return {
+        "texts": texts,
+        "kind0": fill_kinds[0],
+        "kind1": fill_kinds[1],
+        "extra": extra.astype("i8"),
+        "offset": offsets,
+        # Последняя строка - пустая, для мест без значения
+        "numbers": numbers,
+        "word_lines": text_columns(
+            [f"\t{word2oct(word)}\n".encode() for word in range(WORD_MASK + 1)]
+        ),
+        "lows": text_columns([low.encode() for low in ADDRESS_LOWS] + [b""]),
+    }
+
+
+def block_words(data: bytes | memoryview) -> Iterable[int]:
+    """
+    Слова блока (младший байт первым) без копирования, если порядок байт машины тот же
+    :param data: байты блока
+        b'\\xc0\\x15\\x02\\x00'
+    :return:
+        [0o012700, 0o000002]
+    """
+    data = memoryview(data)[: len(data) & ~1]
+    if sys.byteorder == "little":
+        return data.cast("H")
+    words = array("H", data)
+    words.byteswap()
+    return words
+
+
+def block_text(address: int, data: bytes | memoryview) -> Iterator[str]:
+    """
+    Разбирает блок в текст листинга того же вида, что и листинг ассемблера
+    (funcs.listing_comm): адрес и текст команды, затем её слова.
+    С numpy блок разбирается массивами (decode_block_numpy), без него - циклом
+    Python по словам (decode_block), в разы медленнее на больших образах
+    :param address: адрес блока
+        0o1000
+    :param data: байты блока
+        b'\\xc0\\x15\\x02\\x00\\x00\\x00'
+    :return: куски текста из целых строк
+        '001000:\\t\\t\\tmov\\t#2, R0\\n\\t012700\\n\\t000002\\n001004:\\t\\t\\thalt\\n\\t000000\\n'
+    """
+    if load_numpy():
+        yield from decode_block_numpy(
+            address, np.frombuffer(data, "<u2", len(data) // 2)
+        )
+    elif len(data) > 1:
+        yield "\n".join(decode_block(address, block_words(data).tolist())) + "\n"
+
+    if len(data) & 1:
+        byte = data[-1]
+        lines = listing_comm(f"\t.BYTE\t{byte:o}", (byte,), address + len(data) - 1, 8)
+        yield "\n".join(lines) + "\n"
+
+
+def disassemble_block(address: int, data: bytes | memoryview) -> list[str]:
+    """
+    Разбирает блок в строки листинга (см. block_text)
+    :param address: адрес блока
+        0o1000
+    :param data: байты блока
+        b'\\xc0\\x15\\x02\\x00\\x00\\x00'
+    :return:
+        ['001000:\\t\\t\\tmov\\t#2, R0', '\\t012700', '\\t000002', '001004:\\t\\t\\thalt', '\\t000000']
+    """
+    return "".join(block_text(address, data)).split("\n")[:-1]
+
+
+def decode_block(address: int, words: list[int]) -> list[str]:
+    """
+    Разбирает слова блока в строки листинга циклом Python по словам.
+    Тексты адресов, чисел и слов берутся из таблиц, а не форматируются заново
+    :param address: адрес блока
+        0o1000
+    :param words: слова блока
+        [0o012700, 0o000002, 0o000000]
+    :return:
+        ['001000:\\t\\t\\tmov\\t#2, R0', '\\t012700', '\\t000002', '001004:\\t\\t\\thalt', '\\t000000']
+    """
+    table, word_lines, numbers = python_tables()
+    lows = ADDRESS_LOWS
+    size = len(words)
+    # Старшие цифры адреса меняются раз в 256 слов
+    base = address >> 9
+    highs = [f"{high:03o}" for high in range(base, ((address + 2 * size) >> 9) + 1)]
+    lines = []
+    append = lines.append
+    position = 0
+    while position < size:
+        word = words[position]
+        counter = address + 2 * position
+        prefix = highs[(counter >> 9) - base] + lows[counter & 0o777]
+        text, fills = table[word]
+        if not fills:
+            append(prefix + text)
+            append(word_lines[word])
+            position += 1
+            continue
+
+        fill = fills[0]
+        if type(fill) is int:
+            # Ветвление: адрес цели по смещению в слове команды
+            append(prefix + text.format(numbers[(counter + 2 + fill) & WORD_MASK]))
+            append(word_lines[word])
+            position += 1
+            continue
+
+        values = []
+        following = position + 1
+        for fill in fills:
+            if following == size:
+                break
+            value = words[following]
+            following += 1
+            if fill == "rel":
+                # Смещение считается от адреса после своего слова
+                value = (address + 2 * following + value) & WORD_MASK
+            values.append(numbers[value])
+        else:
+            append(prefix + text.format(*values))
+            for value in words[position:following]:
+                append(word_lines[value])
+            position = following
+            continue
+
+        # Дополнительных слов не хватило до конца блока
+        append(f"{prefix}\t.WORD\t{word:o}")
+        append(word_lines[word])
+        position += 1
+    return lines
+
+
+def instruction_starts(lengths: "np.ndarray") -> "np.ndarray":
+    """
+    Отмечает слова, с которых начинаются команды, если первая команда - в слове 0,
+    а каждая следующая - сразу после предыдущей.
+    Проход по словам последователен, поэтому слова делятся на куски, и все куски
+    проходятся разом для каждого из трёх состояний на входе (сколько слов осталось
+    до следующей команды: 0, 1 или 2); затем по цепочке кусков выбирается настоящее
+    :param lengths: длины команд в словах (1-3), если команда начинается в этом слове
+        array([2, 1, 1, 3, 1, 1])
+    :return:
+        array([True, False, True, True, False, False])
+    """
+    size = len(lengths)
+    if size <= STARTS_PIECE * STARTS_PIECE:
+        # Короткий блок быстрее пройти по словам
+        starts = np.zeros(size, bool)
+        position = 0
+        steps = lengths.tolist()
+        while position < size:
+            starts[position] = True
+            position += steps[position]
+        return starts
+
+    width = STARTS_PIECE
+    count = -(-size // width)
+    padded = np.ones(count * width, "i1")
+    padded[:size] = lengths
+    columns = padded.reshape(count, width)
+
+    states = np.empty((3, count, width), "i1")
+    state = np.repeat(np.arange(3, dtype="i1")[:, None], count, axis=1)
+    for column in range(width):
+        states[:, :, column] = state
+        state = np.where(state == 0, columns[:, column] - 1, state - 1)
+
+    ends = state.tolist()
+    entries = []
+    entry = 0
+    for piece in range(count):
+        entries.append(entry)
+        entry = ends[entry][piece]
+    chosen = states[np.array(entries), np.arange(count)]
+    return chosen.ravel()[:size] == 0
+
+
+def decode_block_numpy(address: int, words: "np.ndarray") -> Iterator[str]:
+    """
+    Разбирает слова блока в текст листинга массивами numpy: начала команд
+    (instruction_starts), затем по DECODE_CHUNK слов - запись на слово из кусков
+    таблиц numpy_tables (адрес, куски текста и значения команды, если она
+    начинается в этом слове, и строка со словом). Нули, которыми дополнены
+    куски, выбрасываются
+    :param address: адрес блока
+        0o1000
+    :param words: слова блока
+        array([0o012700, 0o000002, 0o000000], dtype=uint16)
+    :return: куски текста из целых строк
+        '001000:\\t\\t\\tmov\\t#2, R0\\n\\t012700\\n\\t000002\\n001004:\\t\\t\\thalt\\n\\t000000\\n'
+    """
+    size = len(words)
+    if size == 0:
+        return
+    tables = numpy_tables()
+    words = words.astype("i8")
+    positions = np.arange(size)
+    extra = tables["extra"][words]
+    # Дополнительных слов не хватает до конца блока - команда выводится как .WORD
+    short = positions + extra >= size
+    starts = instruction_starts(np.where(short, 1, extra + 1))
+    entries = np.where(short, SHORT_ENTRY, words)
+    entries[~starts] = BLANK_ENTRY
+
+    # Старшие цифры адреса (все, кроме трёх младших) меняются раз в 256 слов
+    base = address >> 9
+    top = (address + 2 * (size - 1)) >> 9
+    highs = text_columns(
+        [f"{high:03o}".encode() for high in range(base, top + 1)] + [b""]
+    )
+    record = np.dtype(
+        [
+            ("high", highs.dtype),
+            ("low", tables["lows"].dtype),
+            ("text", tables["texts"].dtype),
+            ("word", tables["word_lines"].dtype),
+        ]
+    )
+
+    for first in range(0, size, DECODE_CHUNK):
+        chunk = slice(first, first + DECODE_CHUNK)
+        entry = entries[chunk]
+        begins = starts[chunk]
+        counters = address + 2 * positions[chunk]
+        records = np.empty(len(entry), record)
+        records["high"] = highs.take(
+            np.where(begins, (counters >> 9) - base, top + 1 - base)
+        )
+        records["low"] = tables["lows"].take(
+            np.where(begins, counters & 0o777, len(ADDRESS_LOWS))
+        )
+        texts = records["text"]
+        texts[...] = tables["texts"].take(entry)
+        for number in range(2):
+            kind = tables[f"kind{number}"].take(entry)
+            if not kind.any():
+                continue
+            following = np.minimum(positions[chunk] + 1 + number, size - 1)
+            value = words.take(following)
+            value = np.where(
+                kind == REL_FILL, address + 2 * following + 2 + value, value
+            )
+            value = np.where(
+                kind == BRANCH_FILL, counters + 2 + tables["offset"].take(entry), value
+            )
+            value = np.where(kind == SELF_FILL, words[chunk], value) & WORD_MASK
+            value[kind == NO_FILL] = WORD_MASK + 1
+            texts[f"number{number}"] = tables["numbers"].take(value)
+        records["word"] = tables["word_lines"].take(words[chunk])
+        yield records.tobytes().translate(None, b"\0").decode("ascii")
+
+
+def disassemble(blocks: Iterable[tuple[int, bytes | memoryview]]) -> Iterator[str]:
+    """
+    Текст листинга блоков: перед каждым блоком строка ".=адрес".
+    Текст идёт кусками из целых строк, а не по строке: строка на слово для образа
+    в несколько МБ - миллионы объектов str
+    :param blocks: адреса блоков и их байты (см. objfile.read_object)
+        [(0o1000, b'\\xc0\\x15\\x02\\x00')]
+    :return: куски текста листинга
+        '001000:\\t\\t\\t.=1000\\n', '001000:\\t\\t\\tmov\\t#2, R0\\n\\t012700\\n\\t000002\\n'
+    """
+    for address, data in blocks:
+        yield "\n".join(listing_comm(f"\t.={address:o}", (), address, 16)) + "\n"
+        yield from block_text(address, data)
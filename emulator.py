@@ -0,0 +1,820 @@
+from collections.abc import Callable, Iterable
+from time import perf_counter
+import sys
+import click
+from commands import COMMANDS, FORMAT_FIELDS, Command
+from devices import IO_PAGE, Console, Device
+from objfile import read_object
+
+# Размер памяти PDP-11 и маски слова и байта
+MEMORY_SIZE = 1 << 16
+WORD_MASK = 0o177777
+BYTE_MASK = 0o377
+# Знаковые биты слова и байта
+WORD_SIGN = 0o100000
+BYTE_SIGN = 0o200
+# Адрес запуска по умолчанию (программы корпуса кладут код с 1000)
+START_ADDRESS = 0o1000
+
+SP = 6
+PC = 7
+
+
+class Emulator:
+    """
+    Исполняет команды из COMMANDS над образом памяти 64 КБ
+    Операнд - адрес в памяти или ~номер регистра (отрицательное число) для моды 0
+    Обращения к регистрам устройств на странице ввода-вывода передаются устройствам
+    """
+
+    def __init__(self, devices: Iterable[Device] = (), fast_forward: bool = True):
+        self.memory = bytearray(MEMORY_SIZE)
+        # Устройства по адресам их регистров
+        self.devices = list(devices)
+        self.io: dict[int, Device] = {}
+        for device in self.devices:
+            device.attach(self)
+            for address in device.registers:
+                self.io[address] = device
+        # Пропускать циклы опроса готовности устройства одним шагом
+        self.fast_forward = fast_forward
+        # R0-R5, SP, PC
+        self.registers = [0] * 8
+        # Флаги N, Z, V, C и приоритет процессора (биты 5-7 PSW)
+        self.n = self.z = self.v = self.c = False
+        self.priority = 0
+        self.halted = False
+        # Число исполненных команд и номер команды, на которой run остановится
+        # (None - без ограничения)
+        self.steps = 0
+        self.step_limit: int | None = None
+
+    def load(self, blocks: Iterable[tuple[int, bytes]]) -> None:
+        """
+        Кладёт блоки объектного файла в память
+        :param blocks: адреса блоков и их байты (см. objfile.read_object)
+            [(0o1000, b'\\xc0\\x15\\x02\\x00')]
+        """
+        for address, data in blocks:
+            end = address + len(data)
+            if end > MEMORY_SIZE:
+                raise ValueError(
+                    f"Блок {address:06o} длиной {len(data)} не помещается в память"
+                )
+            self.memory[address:end] = data
+
+    def load_file(self, filename: str, start: int = START_ADDRESS) -> None:
+        """
+        Загружает объектный файл любого формата и ставит PC на адрес запуска
+        :param filename: имя объектного файла
+            '01_sum.pdp.o'
+        :param start: адрес запуска
+            0o1000
+        """
+        self.load(read_object(filename))
+        self.registers[PC] = start
+
+    # Адреса без устройства на странице ввода-вывода работают как обычная память
+
+    def read_word(self, address: int) -> int:
+        address &= 0o177776
+        if address >= IO_PAGE and address in self.io:
+            return self.io[address].read(address)
+        return self.memory[address] | (self.memory[address + 1] << 8)
+
+    def write_word(self, address: int, value: int) -> None:
+        address &= 0o177776
+        if address >= IO_PAGE and address in self.io:
+            self.io[address].write(address, value & WORD_MASK)
+            return
+        self.memory[address] = value & BYTE_MASK
+        self.memory[address + 1] = (value >> 8) & BYTE_MASK
+
+    def read_byte(self, address: int) -> int:
+        address &= WORD_MASK
+        if address >= IO_PAGE and address & 0o177776 in self.io:
+            word = self.io[address & 0o177776].read(address & 0o177776)
+            return (word >> 8) & BYTE_MASK if address & 1 else word & BYTE_MASK
+        return self.memory[address]
+
+    def write_byte(self, address: int, value: int) -> None:
+        address &= WORD_MASK
+        if address >= IO_PAGE and address & 0o177776 in self.io:
+            # Старшие байты регистров устройств не используются
+            if not address & 1:
+                self.io[address].write(address, value & BYTE_MASK)
+            return
+        self.memory[address] = value & BYTE_MASK
+
+    def fetch(self) -> int:
+        """
+        Читает слово по PC и сдвигает PC на следующее
+        """
+        registers = self.registers
+        word = self.read_word(registers[PC])
+        registers[PC] = (registers[PC] + 2) & WORD_MASK
+        return word
+
+    def operand(self, mode: int, reg: int, byte: bool = False) -> int:
+        """
+        Вычисляет операнд по моде и регистру, изменяя регистры как при исполнении
+        :param mode: мода
+            2
+        :param reg: номер регистра
+            1
+        :param byte: байтовая команда (автоинкремент на 1, кроме SP и PC)
+            False
+        :return: адрес в памяти или ~reg для моды 0
+            0o1000
+        """
+        if mode == 0:
+            return ~reg
+        registers = self.registers
+        if mode == 1:
+            return registers[reg]
+        if mode == 2:
+            address = registers[reg]
+            registers[reg] = (address + (1 if byte and reg < SP else 2)) & WORD_MASK
+            return address
+        if mode == 3:
+            address = registers[reg]
+            registers[reg] = (address + 2) & WORD_MASK
+            return self.read_word(address)
+        if mode == 4:
+            address = (registers[reg] - (1 if byte and reg < SP else 2)) & WORD_MASK
+            registers[reg] = address
+            return address
+        if mode == 5:
+            address = (registers[reg] - 2) & WORD_MASK
+            registers[reg] = address
+            return self.read_word(address)
+        # Моды 6 и 7: смещение лежит за командой, PC - уже после него
+        shift = self.fetch()
+        address = (registers[reg] + shift) & WORD_MASK
+        if mode == 6:
+            return address
+        return self.read_word(address)
+
+    def get(self, location: int, byte: bool = False) -> int:
+        if location < 0:
+            value = self.registers[~location]
+            return value & BYTE_MASK if byte else value
+        return self.read_byte(location) if byte else self.read_word(location)
+
+    def put(self, location: int, value: int, byte: bool = False) -> None:
+        if location < 0:
+            if byte:
+                # Байтовые команды меняют только младший байт регистра
+                value = (self.registers[~location] & 0o177400) | (value & BYTE_MASK)
+            self.registers[~location] = value & WORD_MASK
+        elif byte:
+            self.write_byte(location, value)
+        else:
+            self.write_word(location, value)
+
+    def push(self, value: int) -> None:
+        registers = self.registers
+        registers[SP] = (registers[SP] - 2) & WORD_MASK
+        self.write_word(registers[SP], value)
+
+    def pop(self) -> int:
+        registers = self.registers
+        value = self.read_word(registers[SP])
+        registers[SP] = (registers[SP] + 2) & WORD_MASK
+        return value
+
+    def set_nz(self, value: int, sign: int = WORD_SIGN) -> None:
+        self.n = bool(value & sign)
+        self.z = value == 0
+
+    @property
+    def psw(self) -> int:
+        """
+        Слово состояния процессора: приоритет, N, Z, V, C
+        """
+        return (
+            (self.priority << 5)
+            | (self.n << 3)
+            | (self.z << 2)
+            | (self.v << 1)
+            | int(self.c)
+        )
+
+    @psw.setter
+    def psw(self, value: int) -> None:
+        self.priority = (value >> 5) & 7
+        self.n, self.z = bool(value & 0o10), bool(value & 0o4)
+        self.v, self.c = bool(value & 0o2), bool(value & 0o1)
+
+    def interrupt(self, vector: int) -> None:
+        """
+        Прерывание по вектору: PSW и PC - в стек, новые PC и PSW - из вектора
+        :param vector: адрес вектора
+            0o34
+        """
+        self.push(self.psw)
+        self.push(self.registers[PC])
+        self.registers[PC] = self.read_word(vector)
+        self.psw = self.read_word(vector + 2)
+
+    # Команды. Аргументы - поля слова команды, разобранные заранее (см. decode):
+    # ss_mode, ss_reg, dd_mode, dd_reg - моды и регистры операндов,
+    # byte - байтовый вариант команды (movb, clrb, ...), word - слово команды
+
+    def do_halt(self, word: int) -> None:
+        self.halted = True
+
+    # Прерываний нет, поэтому ожидание прерывания останавливает программу
+    do_wait = do_halt
+
+    def do_reset(self, word: int) -> None:
+        pass
+
+    def do_cc(self, word: int) -> None:
+        """
+        nop, clc, sec, ccc, scc, ...: бит 4 - установить (иначе сбросить)
+        флаги, выбранные битами 0-3
+        """
+        value = bool(word & 0o20)
+        if word & 0o10:
+            self.n = value
+        if word & 0o4:
+            self.z = value
+        if word & 0o2:
+            self.v = value
+        if word & 0o1:
+            self.c = value
+
+    do_nop = do_clc = do_clv = do_clz = do_cln = do_ccc = do_cc
+    do_sec = do_sev = do_sez = do_sen = do_scc = do_cc
+
+    def do_mov(
+        self, ss_mode: int, ss_reg: int, dd_mode: int, dd_reg: int, byte: bool
+    ) -> None:
+        value = self.get(self.operand(ss_mode, ss_reg, byte), byte)
+        location = self.operand(dd_mode, dd_reg, byte)
+        if byte and location < 0:
+            # movb в регистр расширяет байт знаком на всё слово
+            self.registers[~location] = value | 0o177400 if value & BYTE_SIGN else value
+        else:
+            self.put(location, value, byte)
+        self.set_nz(value, BYTE_SIGN if byte else WORD_SIGN)
+        self.v = False
+
+    def do_cmp(
+        self, ss_mode: int, ss_reg: int, dd_mode: int, dd_reg: int, byte: bool
+    ) -> None:
+        sign = BYTE_SIGN if byte else WORD_SIGN
+        source = self.get(self.operand(ss_mode, ss_reg, byte), byte)
+        destination = self.get(self.operand(dd_mode, dd_reg, byte), byte)
+        result = (source - destination) & (BYTE_MASK if byte else WORD_MASK)
+        self.set_nz(result, sign)
+        # Переполнение: операнды разных знаков, а знак разности - не как у source
+        self.v = bool((source ^ destination) & (source ^ result) & sign)
+        self.c = source < destination
+
+    def do_bit(
+        self, ss_mode: int, ss_reg: int, dd_mode: int, dd_reg: int, byte: bool
+    ) -> None:
+        source = self.get(self.operand(ss_mode, ss_reg, byte), byte)
+        destination = self.get(self.operand(dd_mode, dd_reg, byte), byte)
+        self.set_nz(source & destination, BYTE_SIGN if byte else WORD_SIGN)
+        self.v = False
+
+    def do_bic(
+        self, ss_mode: int, ss_reg: int, dd_mode: int, dd_reg: int, byte: bool
+    ) -> None:
+        source = self.get(self.operand(ss_mode, ss_reg, byte), byte)
+        location = self.operand(dd_mode, dd_reg, byte)
+        result = self.get(location, byte) & ~source & WORD_MASK
+        self.put(location, result, byte)
+        self.set_nz(result, BYTE_SIGN if byte else WORD_SIGN)
+        self.v = False
+
+    def do_bis(
+        self, ss_mode: int, ss_reg: int, dd_mode: int, dd_reg: int, byte: bool
+    ) -> None:
+        source = self.get(self.operand(ss_mode, ss_reg, byte), byte)
+        location = self.operand(dd_mode, dd_reg, byte)
+        result = self.get(location, byte) | source
+        self.put(location, result, byte)
+        self.set_nz(result, BYTE_SIGN if byte else WORD_SIGN)
+        self.v = False
+
+    def do_add(
+        self, ss_mode: int, ss_reg: int, dd_mode: int, dd_reg: int, byte: bool
+    ) -> None:
+        source = self.get(self.operand(ss_mode, ss_reg))
+        location = self.operand(dd_mode, dd_reg)
+        destination = self.get(location)
+        result = source + destination
+        self.c = result > WORD_MASK
+        result &= WORD_MASK
+        # Переполнение: слагаемые одного знака, а сумма другого
+        self.v = bool((source ^ result) & (destination ^ result) & WORD_SIGN)
+        self.set_nz(result)
+        self.put(location, result)
+
+    def do_sub(
+        self, ss_mode: int, ss_reg: int, dd_mode: int, dd_reg: int, byte: bool
+    ) -> None:
+        source = self.get(self.operand(ss_mode, ss_reg))
+        location = self.operand(dd_mode, dd_reg)
+        destination = self.get(location)
+        result = (destination - source) & WORD_MASK
+        self.c = destination < source
+        # Переполнение: операнды разных знаков, а знак разности - как у source
+        self.v = bool((source ^ destination) & (destination ^ result) & WORD_SIGN)
+        self.set_nz(result)
+        self.put(location, result)
+
+    def do_clr(self, dd_mode: int, dd_reg: int, byte: bool) -> None:
+        self.put(self.operand(dd_mode, dd_reg, byte), 0, byte)
+        self.n = self.v = self.c = False
+        self.z = True
+
+    def do_com(self, dd_mode: int, dd_reg: int, byte: bool) -> None:
+        location = self.operand(dd_mode, dd_reg, byte)
+        result = ~self.get(location, byte) & (BYTE_MASK if byte else WORD_MASK)
+        self.put(location, result, byte)
+        self.set_nz(result, BYTE_SIGN if byte else WORD_SIGN)
+        self.v, self.c = False, True
+
+    def do_inc(self, dd_mode: int, dd_reg: int, byte: bool) -> None:
+        sign = BYTE_SIGN if byte else WORD_SIGN
+        location = self.operand(dd_mode, dd_reg, byte)
+        result = (self.get(location, byte) + 1) & (BYTE_MASK if byte else WORD_MASK)
+        self.put(location, result, byte)
+        self.set_nz(result, sign)
+        # Переполнение: наибольшее положительное стало отрицательным
+        self.v = result == sign
+
+    def do_dec(self, dd_mode: int, dd_reg: int, byte: bool) -> None:
+        sign = BYTE_SIGN if byte else WORD_SIGN
+        location = self.operand(dd_mode, dd_reg, byte)
+        result = (self.get(location, byte) - 1) & (BYTE_MASK if byte else WORD_MASK)
+        self.put(location, result, byte)
+        self.set_nz(result, sign)
+        # Переполнение: наименьшее отрицательное стало положительным
+        self.v = result == sign - 1
+
+    def do_neg(self, dd_mode: int, dd_reg: int, byte: bool) -> None:
+        sign = BYTE_SIGN if byte else WORD_SIGN
+        location = self.operand(dd_mode, dd_reg, byte)
+        result = -self.get(location, byte) & (BYTE_MASK if byte else WORD_MASK)
+        self.put(location, result, byte)
+        self.set_nz(result, sign)
+        self.v = result == sign
+        self.c = result != 0
+
+    def do_adc(self, dd_mode: int, dd_reg: int, byte: bool) -> None:
+        sign = BYTE_SIGN if byte else WORD_SIGN
+        mask = BYTE_MASK if byte else WORD_MASK
+        location = self.operand(dd_mode, dd_reg, byte)
+        value = self.get(location, byte)
+        result = (value + self.c) & mask
+        self.put(location, result, byte)
+        self.set_nz(result, sign)
+        self.v = self.c and value == sign - 1
+        self.c = self.c and value == mask
+
+    def do_sbc(self, dd_mode: int, dd_reg: int, byte: bool) -> None:
+        sign = BYTE_SIGN if byte else WORD_SIGN
+        location = self.operand(dd_mode, dd_reg, byte)
+        value = self.get(location, byte)
+        result = (value - self.c) & (BYTE_MASK if byte else WORD_MASK)
+        self.put(location, result, byte)
+        self.set_nz(result, sign)
+        self.v = self.c and value == sign
+        self.c = self.c and value == 0
+
+    def do_tst(self, dd_mode: int, dd_reg: int, byte: bool) -> None:
+        value = self.get(self.operand(dd_mode, dd_reg, byte), byte)
+        self.set_nz(value, BYTE_SIGN if byte else WORD_SIGN)
+        self.v = self.c = False
+
+    def shift(
+        self, dd_mode: int, dd_reg: int, byte: bool, right: bool, fill: int | None
+    ) -> None:
+        """
+        Сдвиг операнда на бит: выдвинутый бит - в C, V = N xor C
+        :param right: сдвиг вправо (иначе влево)
+            True
+        :param fill: вдвигаемый бит (None - повторить знаковый, для asr)
+            1
+        """
+        sign = BYTE_SIGN if byte else WORD_SIGN
+        location = self.operand(dd_mode, dd_reg, byte)
+        value = self.get(location, byte)
+        if right:
+            self.c = bool(value & 1)
+            result = (value >> 1) | (value & sign if fill is None else fill * sign)
+        else:
+            self.c = bool(value & sign)
+            result = ((value << 1) | fill) & (BYTE_MASK if byte else WORD_MASK)
+        self.put(location, result, byte)
+        self.set_nz(result, sign)
+        self.v = self.n != self.c
+
+    def do_ror(self, dd_mode: int, dd_reg: int, byte: bool) -> None:
+        self.shift(dd_mode, dd_reg, byte, True, int(self.c))
+
+    def do_rol(self, dd_mode: int, dd_reg: int, byte: bool) -> None:
+        self.shift(dd_mode, dd_reg, byte, False, int(self.c))
+
+    def do_asr(self, dd_mode: int, dd_reg: int, byte: bool) -> None:
+        self.shift(dd_mode, dd_reg, byte, True, None)
+
+    def do_asl(self, dd_mode: int, dd_reg: int, byte: bool) -> None:
+        self.shift(dd_mode, dd_reg, byte, False, 0)
+
+    def do_swab(self, dd_mode: int, dd_reg: int, byte: bool) -> None:
+        location = self.operand(dd_mode, dd_reg)
+        value = self.get(location)
+        result = ((value >> 8) | (value << 8)) & WORD_MASK
+        self.put(location, result)
+        # N и Z - по младшему байту результата
+        self.set_nz(result & BYTE_MASK, BYTE_SIGN)
+        self.v = self.c = False
+
+    def do_sxt(self, dd_mode: int, dd_reg: int, byte: bool) -> None:
+        self.put(self.operand(dd_mode, dd_reg), WORD_MASK if self.n else 0)
+        self.z = not self.n
+        self.v = False
+
+    def do_mfps(self, dd_mode: int, dd_reg: int, byte: bool) -> None:
+        value = self.psw
+        location = self.operand(dd_mode, dd_reg, True)
+        if location < 0:
+            self.registers[~location] = value | 0o177400 if value & BYTE_SIGN else value
+        else:
+            self.put(location, value, True)
+        self.set_nz(value, BYTE_SIGN)
+        self.v = False
+
+    def do_mtps(self, dd_mode: int, dd_reg: int, byte: bool) -> None:
+        self.psw = self.get(self.operand(dd_mode, dd_reg, True), True)
+
+    def do_jmp(self, dd_mode: int, dd_reg: int, byte: bool) -> None:
+        location = self.operand(dd_mode, dd_reg)
+        if location < 0:
+            raise ValueError(f"jmp на регистр R{~location}")
+        self.registers[PC] = location
+
+    def do_xor(self, reg: int, dd_mode: int, dd_reg: int) -> None:
+        location = self.operand(dd_mode, dd_reg)
+        result = self.get(location) ^ self.registers[reg]
+        self.put(location, result)
+        self.set_nz(result)
+        self.v = False
+
+    def do_jsr(self, reg: int, dd_mode: int, dd_reg: int) -> None:
+        location = self.operand(dd_mode, dd_reg)
+        if location < 0:
+            raise ValueError(f"jsr на регистр R{~location}")
+        registers = self.registers
+        self.push(registers[reg])
+        registers[reg] = registers[PC]
+        registers[PC] = location
+
+    def do_rts(self, reg: int) -> None:
+        registers = self.registers
+        registers[PC] = registers[reg]
+        registers[reg] = self.pop()
+
+    def do_sob(self, reg: int, nn: int) -> None:
+        registers = self.registers
+        registers[reg] = (registers[reg] - 1) & WORD_MASK
+        if registers[reg]:
+            registers[PC] = (registers[PC] - 2 * nn) & WORD_MASK
+
+    def do_mark(self, nn: int) -> None:
+        registers = self.registers
+        registers[SP] = (registers[PC] + 2 * nn) & WORD_MASK
+        registers[PC] = registers[5]
+        registers[5] = self.pop()
+
+    def do_spl(self, n: int) -> None:
+        self.priority = n
+
+    def do_emt(self, n: int) -> None:
+        self.interrupt(0o30)
+
+    def do_trap(self, n: int) -> None:
+        self.interrupt(0o34)
+
+    def do_iot(self, word: int) -> None:
+        self.interrupt(0o20)
+
+    def do_bpt(self, word: int) -> None:
+        self.interrupt(0o14)
+
+    def do_rti(self, word: int) -> None:
+        self.registers[PC] = self.pop()
+        self.psw = self.pop()
+
+    do_rtt = do_rti
+
+    # Ветвления: offset - смещение в байтах со знаком
+
+    def branch(self, offset: int) -> None:
+        registers = self.registers
+        registers[PC] = (registers[PC] + offset) & WORD_MASK
+
+    def do_br(self, offset: int) -> None:
+        self.branch(offset)
+
+    def do_bne(self, offset: int) -> None:
+        if not self.z:
+            self.branch(offset)
+
+    def do_beq(self, offset: int) -> None:
+        if self.z:
+            self.branch(offset)
+
+    def do_bge(self, offset: int) -> None:
+        if self.n == self.v:
+            self.branch(offset)
+
+    def do_blt(self, offset: int) -> None:
+        if self.n != self.v:
+            self.branch(offset)
+
+    def do_bgt(self, offset: int) -> None:
+        if not self.z and self.n == self.v:
+            self.branch(offset)
+
+    def do_ble(self, offset: int) -> None:
+        if self.z or self.n != self.v:
+            self.branch(offset)
+
+    def do_bpl(self, offset: int) -> None:
+        if not self.n:
+            self.branch(offset)
+
+    def do_bmi(self, offset: int) -> None:
+        if self.n:
+            self.branch(offset)
+
+    def do_bhi(self, offset: int) -> None:
+        if not self.c and not self.z:
+            self.branch(offset)
+
+    def do_blos(self, offset: int) -> None:
+        if self.c or self.z:
+            self.branch(offset)
+
+    def do_bvc(self, offset: int) -> None:
+        if not self.v:
+            self.branch(offset)
+
+    def do_bvs(self, offset: int) -> None:
+        if self.v:
+            self.branch(offset)
+
+    def do_bcc(self, offset: int) -> None:
+        if not self.c:
+            self.branch(offset)
+
+    def do_bcs(self, offset: int) -> None:
+        if self.c:
+            self.branch(offset)
+
+    do_bhis = do_bcc
+    do_blo = do_bcs
+
+    def skip_polling(self, wait: int) -> bool:
+        """
+        Вызывается устройством, которое будет готово только через wait команд.
+        Если текущая команда - tstb регистра устройства в цикле опроса
+        "tstb @#адрес (или tstb адрес); bpl на этот tstb", пропускает нужное число
+        оборотов цикла, сдвигая счётчик команд.
+        Пропуск не заходит за step_limit: если обороты до готовности не помещаются
+        в оставшиеся команды, пропускаются только помещающиеся, а остаток цикла
+        исполняется честно - run останавливается на том же числе команд, что и без пропуска
+        :param wait: через сколько команд устройство будет готово
+            100
+        :return: True, если цикл пропущен и устройство уже готово
+            True
+        """
+        if not self.fast_forward:
+            return False
+        pc = self.registers[PC]
+        # За tstb должен идти bpl назад на него
+        branch = self.read_word(pc)
+        if branch & 0o177400 != 0o100000:
+            return False
+        offset = branch & BYTE_MASK
+        target = (
+            pc + 2 + 2 * (offset - 0o400 if offset & BYTE_SIGN else offset)
+        ) & WORD_MASK
+        # tstb @#адрес или tstb адрес(PC): два слова перед bpl
+        if target + 4 != pc or self.read_word(target) not in (0o105737, 0o105767):
+            return False
+
+        # Оборот цикла - две команды
+        skip = wait + wait % 2
+        if self.step_limit is not None:
+            # Сам tstb ещё не посчитан
+            remaining = self.step_limit - self.steps - 1
+            if skip > remaining:
+                self.steps += max(0, remaining - remaining % 2)
+                return False
+        self.steps += skip
+        return True
+
+    def run(self, max_steps: int | None = None) -> int:
+        """
+        Исполняет программу до halt (или max_steps команд)
+        :param max_steps: наибольшее число команд (None - без ограничения)
+            1000000
+        :return: число исполненных команд (с пропущенными циклами опроса)
+            17
+        """
+        registers = self.registers
+        memory = self.memory
+        dispatch = DISPATCH
+        start = self.steps
+        limit = None if max_steps is None else start + max_steps
+        self.step_limit = limit
+        try:
+            while not self.halted and (limit is None or self.steps < limit):
+                pc = registers[PC] & 0o177776
+                word = memory[pc] | (memory[pc + 1] << 8)
+                registers[PC] = (pc + 2) & WORD_MASK
+                entry = dispatch[word]
+                if entry is None:
+                    raise ValueError(
+                        f"Неизвестная команда {word:06o} по адресу {pc:06o}"
+                    )
+                handler, args = entry
+                handler(self, *args)
+                self.steps += 1
+        finally:
+            self.step_limit = None
+            for device in self.devices:
+                device.flush()
+        return self.steps - start
+
+    def status(self, steps: int, elapsed: float) -> str:
+        """
+        Возвращает регистры, флаги и скорость исполнения
+        :param steps: число исполненных команд
+            17
+        :param elapsed: время исполнения в секундах
+            0.001
+        :return:
+            'R0=000133 ... PC=001020 -Z--\nhalted: 17 instructions, 0.001s, 17000 instructions/s'
+        """
+        registers = " ".join(
+            f"{name}={value:06o}"
+            for name, value in zip(
+                ("R0", "R1", "R2", "R3", "R4", "R5", "SP", "PC"), self.registers
+            )
+        )
+        flags = "".join(
+            flag if value else "-"
+            for flag, value in zip("NZVC", (self.n, self.z, self.v, self.c))
+        )
+        state = "halted" if self.halted else "stopped"
+        speed = steps / elapsed if elapsed else 0
+        return (
+            f"{registers} {flags}\n"
+            f"{state}: {steps} instructions, {elapsed:.3f}s, {speed:.0f} instructions/s"
+        )
+
+
+def decode(command: Command, word: int) -> tuple:
+    """
+    Разбирает поля слова команды в аргументы Emulator.do_<имя> по формату команды
+    :param command: команда из COMMANDS
+        Command(name='mov', opcode=0o010000, fmt='SSDD')
+    :param word: слово команды
+        0o012700
+    :return:
+        (2, 7, 0, 0, False)
+    """
+    fmt = command.fmt
+    if fmt == "SSDD":
+        return (word >> 9) & 7, (word >> 6) & 7, (word >> 3) & 7, word & 7, command.byte
+    if fmt == "DD":
+        return (word >> 3) & 7, word & 7, command.byte
+    if fmt == "RDD":
+        return (word >> 6) & 7, (word >> 3) & 7, word & 7
+    if fmt == "R":
+        return (word & 7,)
+    if fmt == "RNN":
+        return (word >> 6) & 7, word & 0o77
+    if fmt == "XX":
+        # Смещение в словах со знаком -> в байтах
+        offset = word & BYTE_MASK
+        return (2 * (offset - 0o400 if offset & BYTE_SIGN else offset),)
+    if fmt == "":
+        return (word,)
+    # N3, N6, N8 - число в полях команды
+    return (word & FORMAT_FIELDS[fmt],)
+
+
+def build_dispatch() -> list[tuple[Callable, tuple] | None]:
+    """
+    Строит таблицу разбора всех 65536 слов: обработчик команды и её аргументы
+    (None - слово не кодирует команду из COMMANDS).
+    Байтовые варианты исполняет обработчик основной команды с byte=True
+    :return:
+        [(Emulator.do_halt, (0,)), (Emulator.do_wait, (1,)), ...]
+    """
+    dispatch = [None] * MEMORY_SIZE
+    for name, command in COMMANDS.items():
+        handler = getattr(Emulator, f"do_{name[:-1] if command.byte else name}")
+        fields = WORD_MASK & ~command.mask
+        # Перебираем все значения полей: подмножества битов fields
+        sub = fields
+        while True:
+            word = command.opcode | sub
+            dispatch[word] = (handler, decode(command, word))
+            if sub == 0:
+                break
+            sub = (sub - 1) & fields
+    return dispatch
+
+
+DISPATCH = build_dispatch()
+
+
+# Общие для emulator.py и pdp11_compiler.py run параметры исполнения
+def run_options(func: Callable) -> Callable:
+    """
+    Параметры адреса запуска, числа команд и консоли
+    """
+    options = [
+        click.option(
+            "--start",
+            default=f"{START_ADDRESS:o}",
+            show_default=True,
+            help="Адрес запуска (восьмеричный)",
+        ),
+        click.option(
+            "--max-steps", type=int, default=None, help="Наибольшее число команд"
+        ),
+        click.option(
+            "--input",
+            "input_file",
+            type=click.File("rb"),
+            default=None,
+            help="Файл с вводом консоли",
+        ),
+        click.option(
+            "--delay",
+            type=int,
+            default=0,
+            show_default=True,
+            help="Сколько команд передатчик консоли не готов после символа",
+        ),
+        click.option(
+            "--fast-forward/--no-fast-forward",
+            default=True,
+            show_default=True,
+            help="Пропускать циклы опроса готовности консоли одним шагом",
+        ),
+    ]
+    for option in reversed(options):
+        func = option(func)
+    return func
+
+
+def execute(
+    blocks: Iterable[tuple[int, bytes]],
+    start: str,
+    max_steps: int | None,
+    input_file,
+    delay: int,
+    fast_forward: bool,
+) -> None:
+    """
+    Исполняет блоки программы с консолью на stdout, печатая в stderr регистры и скорость
+    Параметры - как у run_options
+    """
+    input_data = input_file.read() if input_file is not None else b""
+    console = Console(sys.stdout.buffer, input_data=input_data, delay=delay)
+    emulator = Emulator([console], fast_forward=fast_forward)
+    emulator.load(blocks)
+    emulator.registers[PC] = int(start, 8)
+
+    begin = perf_counter()
+    steps = emulator.run(max_steps)
+    click.echo(emulator.status(steps, perf_counter() - begin), err=True)
+
+
+@click.command()
+@click.argument("filename")
+@run_options
+def emulate(filename: str, **run_params):
+    """
+    Исполняет объектный файл FILENAME: вывод консоли - в stdout,
+    регистры и скорость - в stderr
+    """
+    execute(read_object(filename), **run_params)
+
+
+if __name__ == "__main__":
+    emulate()
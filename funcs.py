@@ -1,182 +1,358 @@
 import pyparsing as pp
+import re
+from collections.abc import Iterable, Iterator
+from functools import lru_cache
 from re import VERBOSE
+from typing import NamedTuple
+from symbols import (
+    Expression,
+    check_not_register,
+    is_simple,
+    parse_expression,
+    parse_number,
+)
+
+# Грамматики строятся один раз при импорте модуля и переиспользуются для каждой строки.
+# Packrat pyparsing на таких коротких строках только замедляет разбор,
+# поэтому кэшируем целиком результаты разбора аргументов (см. recognize_arg)
+
+
+# ----- Грамматика строки программы (parse_line) -----
+
+_pseudo_comm_name = pp.Combine(
+    pp.Literal(".")
+    + (pp.Suppress(pp.Optional(" ")) + (pp.Literal("=")) | pp.Word(pp.alphas))
+)("pseudo")
+
+_line_variable_name = pp.Combine(
+    pp.Char(pp.alphas) + pp.Optional(pp.Word(pp.alphas + pp.nums + "_"))
+)("variable")
+_variable_module = _line_variable_name + pp.Suppress("=")
+_label_name = _line_variable_name("label") + pp.Suppress(":")
+
+_argument_name = pp.Word(pp.printables, excludeChars=",;")
+_full_argument_name = _argument_name + pp.ZeroOrMore(
+    pp.Suppress(",") + _argument_name
+)
+
+_command_name = _variable_module | _pseudo_comm_name | pp.Word(pp.alphas)("name")
+_command_module = (
+    _command_name
+    + pp.Optional(_full_argument_name)("arg")
+    + pp.Optional(pp.Suppress(";"))
+)
+
+_comment_module = pp.Regex(r".+$")("comm")
+
+LINE_GRAMMAR = (
+    pp.Optional(_label_name) + pp.Optional(_command_module) + pp.Optional(_comment_module)
+)
+
+
+# ----- Грамматика определения моды аргумента (recognize_args) -----
+
+# Регистры Rn
+_mode_register_name = pp.Regex(
+    r"""(([rR]+[0-7]))|(pc) | (PC)|(sp) | (SP)""", flags=VERBOSE
+)
+# Символы ASCII
+_mode_symbol_name = "'" + pp.Word(pp.printables)
+# Константы
+_mode_const_name = pp.Optional("-") + pp.Word(pp.nums) + pp.Optional(".")
+# Переменные и/или метки
+_mode_variable_name = pp.Combine(
+    pp.Char(pp.alphas) + pp.Optional(pp.Word(pp.alphas + pp.nums + "_"))
+)
+# Общий модуль для констант
+_mode_const_var_name = _mode_symbol_name | _mode_const_name | _mode_variable_name
+# Сдвиги
+_shift_name = pp.Combine(pp.Optional("-") + pp.Word(pp.nums))
+
+# Шаблоны для определения моды
+_modes_list = [
+    ("@" + _shift_name + "(" + _mode_register_name + ")").setParseAction(
+        pp.replaceWith("7")
+    ),
+    (_shift_name + "(" + _mode_register_name + ")").setParseAction(pp.replaceWith("6")),
+    ("#" + _mode_const_var_name).setParseAction(pp.replaceWith("2")),
+    ("@#" + _mode_const_var_name).setParseAction(pp.replaceWith("3")),
+    ("@" + _mode_const_var_name).setParseAction(pp.replaceWith("7")),
+    ("@-(" + _mode_register_name + ")").setParseAction(pp.replaceWith("5")),
+    ("-(" + _mode_register_name + ")").setParseAction(pp.replaceWith("4")),
+    ("@(" + _mode_register_name + ")+").setParseAction(pp.replaceWith("3")),
+    ("(" + _mode_register_name + ")+").setParseAction(pp.replaceWith("2")),
+    ("(" + _mode_register_name + ")").setParseAction(pp.replaceWith("1")),
+    _mode_register_name.setParseAction(pp.replaceWith("0")),
+    _mode_const_var_name.setParseAction(pp.replaceWith("6")),
+]
+
+MODES_GRAMMAR = pp.MatchFirst(_modes_list)("mode")
+
+# Опредение "имени" аргумента
+
+_register_name = pp.Regex(
+    r"""(([rR]+[0-7]))|(pc) | (PC)|(sp) | (SP)""", flags=VERBOSE
+)("reg")
+
+_full_reg_name = (
+    pp.Optional(pp.Suppress(pp.Word("@-+(")))
+    + _register_name
+    + pp.Optional(pp.Suppress(pp.Word("+)")))
+)
+
+_mode_6 = _shift_name("shift") + pp.Suppress("(") + _register_name + pp.Suppress(")")
+
+_mode_7 = pp.Suppress("@") + _mode_6
+
+# Символы ASCII
+_symbol_name = "'" + pp.Word(pp.printables)("symbol")
+# Константы
+_const_name = pp.Combine(pp.Optional("-") + pp.Word(pp.nums) + pp.Optional("."))
+# Переменные и/или метки
+_variable_name = pp.Combine(
+    pp.Char(pp.alphas) + pp.Optional(pp.Word(pp.alphas + pp.nums + "_"))
+)
+# Общий модуль для констант
+_const_var_name = pp.Suppress(pp.Optional("@") + pp.Optional("#")) + (
+    _symbol_name | _const_name("const") | _variable_name("variable")
+)
+
+NAMES_GRAMMAR = _mode_7 | _mode_6 | _full_reg_name | _const_var_name
+
+
+# ----- Грамматика номера регистра (register_number) -----
+
+_spec_reg_pc = pp.Regex(r"(pc) | (PC)", flags=VERBOSE)
+_spec_reg_sp = pp.Regex(r"(sp) | (SP)", flags=VERBOSE)
+_code_register_name = (
+    pp.Suppress(pp.Literal("r") | pp.Literal("R")) + pp.Word("01234567")
+    | _spec_reg_pc
+    | _spec_reg_sp
+)
+
+REGISTER_GRAMMAR = pp.MatchFirst(
+    [
+        _spec_reg_sp.setParseAction(pp.replaceWith("6")),
+        _spec_reg_pc.setParseAction(pp.replaceWith("7")),
+        _code_register_name,
+    ]
+)
 
 
-def parse_line(text: str) -> dict:
-    """
-    Принимает строку с командой
-    Возвращает саму строку, а также выделенное имя команды, аргументы и комментарий
-    :param  text: строка с командой
-        "LOOP: mov 	#2, R0;"
-        ".= 1000; some comment"
-    :return:
-        {"label": "LOOP", "name": "mov", "arg": ["#2", "R0"], "text": "LOOP: mov\t#2, R0;"}
-        {"pseudo": ".=", "arg": ["1000"], "comm": "some comment", "text": ".= 1000; some comment"}
-    """
-
-    pseudo_comm_name = pp.Combine(
-        pp.Literal(".")
-        + (pp.Suppress(pp.Optional(" ")) + (pp.Literal("=")) | pp.Word(pp.alphas))
-    )("pseudo")
-
-    variable_name = pp.Combine(
-        pp.Char(pp.alphas) + pp.Optional(pp.Word(pp.alphas + pp.nums + "_"))
-    )("variable")
-    variable_module = variable_name + pp.Suppress("=")
-    label_name = variable_name("label") + pp.Suppress(":")
-
-    argument_name = pp.Word(pp.printables, excludeChars=",;")
-    full_argument_name = argument_name + pp.ZeroOrMore(pp.Suppress(",") + argument_name)
-
-    command_name = variable_module | pseudo_comm_name | pp.Word(pp.alphas)("name")
-    command_module = (
-        command_name
-        + pp.Optional(full_argument_name)("arg")
-        + pp.Optional(pp.Suppress(";"))
-    )
-
-    comment_name = pp.Regex(r".+$")
-    comment_module = comment_name("comm")
+# ----- Аргументы с выражениями (expression_operand) -----
 
-    full_parse_module = (
-        pp.Optional(label_name)
-        + pp.Optional(command_module)
-        + pp.Optional(comment_module)
-    )
+# Аргументы мод 0-5: регистр, (R), (R)+, -(R) и косвенные @(R)+, @-(R)
+REGISTER_OPERAND_RE = re.compile(
+    r"@?(?:-?\((?:[rR][0-7]|pc|PC|sp|SP)\)\+?)|[rR][0-7]|pc|PC|sp|SP"
+)
+# [@# | # | @] выражение [(регистр)]
+EXPRESSION_OPERAND_RE = re.compile(
+    r"(?P<prefix>@#|#|@)?(?P<expr>.+?)(?:\((?P<reg>[rR][0-7]|pc|PC|sp|SP)\))?"
+)
 
-    result = full_parse_module.parseString(text).as_dict()
-    if not result.get("arg") and not result.get("label"):
-        result["arg"] = []
 
-    result["text"] = text
+# ----- Грамматика строки текста (get_ascii_text) -----
 
-    return result
+# Здесь (.) - один символ, который запомнили
+# (.*?) - символы между
+# \1 - на конце первый, который запомнили
+SAME_CHAR_STRING = pp.Regex(r"(.)(.*?)\1")("string")
 
 
-def recognize_args(args: list[str]) -> list[dict]:
+class SourceLine(NamedTuple):
     """
-    Принимает список имен аргументов
-    Возвращает для каждого отдельного аргумента
-    словарь с нумером моды и именем аргумента по порядку.
-    :param  args: список аргументов
-        '['#2', 'R0']'
-    :return:
-        [{'mode': ['2'], 'const': '2'}, {'mode': ['0'], 'reg': 'R0'}]
+    Разобранная строка программы
     """
 
-    res = []
-    # Регистры Rn
-    register_name = pp.Regex(
-        r"""(([rR]+[0-7]))|(pc) | (PC)|(sp) | (SP)""", flags=VERBOSE
-    )
-    # Символы ASCII
-    symbol_name = "'" + pp.Word(pp.printables)
-    # Константы
-    const_name = pp.Optional("-") + pp.Word(pp.nums) + pp.Optional(".")
-    # Переменные и/или метки
-    variable_name = pp.Combine(
-        pp.Char(pp.alphas) + pp.Optional(pp.Word(pp.alphas + pp.nums + "_"))
-    )
-    # Общий модуль для констант
-    const_var_name = symbol_name | const_name | variable_name
-    # Сдвиги
-    shift_name = pp.Combine(pp.Optional("-") + pp.Word(pp.nums))
-
-    # Шаблоны для определения моды
-    modes_list = [
-        ("@" + shift_name + "(" + register_name + ")").setParseAction(
-            pp.replaceWith("7")
-        ),
-        (shift_name + "(" + register_name + ")").setParseAction(pp.replaceWith("6")),
-        ("#" + const_var_name).setParseAction(pp.replaceWith("2")),
-        ("@#" + const_var_name).setParseAction(pp.replaceWith("3")),
-        ("@" + const_var_name).setParseAction(pp.replaceWith("7")),
-        ("@-(" + register_name + ")").setParseAction(pp.replaceWith("5")),
-        ("-(" + register_name + ")").setParseAction(pp.replaceWith("4")),
-        ("@(" + register_name + ")+").setParseAction(pp.replaceWith("3")),
-        ("(" + register_name + ")+").setParseAction(pp.replaceWith("2")),
-        ("(" + register_name + ")").setParseAction(pp.replaceWith("1")),
-        register_name.setParseAction(pp.replaceWith("0")),
-        const_var_name.setParseAction(pp.replaceWith("6")),
-    ]
-
-    modes_to_search = pp.MatchFirst(modes_list)("mode")
-
-    # Опредение "имени" аргумента
-
-    register_name = pp.Regex(
-        r"""(([rR]+[0-7]))|(pc) | (PC)|(sp) | (SP)""", flags=VERBOSE
-    )("reg")
+    text: str
+    label: str | None = None
+    # Имя команды, псевдокоманды или переменной (для "имя = значение")
+    name: str | None = None
+    pseudo: str | None = None
+    variable: str | None = None
+    args: tuple[str, ...] = ()
+    comm: str | None = None
+    # Место строки в исходниках: вставляемый файл (None - сам файл программы)
+    # и номер строки в нём, считая пустые (0 - не известен)
+    file: str | None = None
+    file_line: int = 0
+
+
+class Operand(NamedTuple):
+    """
+    Разобранный аргумент команды
+    Неизменяемый, поэтому результат разбора можно кэшировать и переиспользовать
+    """
 
-    full_reg_name = (
-        pp.Optional(pp.Suppress(pp.Word("@-+(")))
-        + register_name
-        + pp.Optional(pp.Suppress(pp.Word("+)")))
-    )
+    # Номер моды и регистра (7 - PC для констант, символов и меток)
+    mode: int
+    reg: int
+    # Значение дополнительного слова: сдвиг для мод 6, 7 или константа
+    value: int | None = None
+    # Ещё не подставленное имя метки или переменной либо выражение с именами
+    symbol: Expression | None = None
+    # Слово кодируется смещением относительно PC (моды 6, 7 без явного регистра)
+    relative: bool = False
+
+    @property
+    def code(self) -> int:
+        """
+        Возвращает 6-битную кодировку для аргумента (мода << 3 | регистр)
+        :return:
+            0o27
+        """
+        return (self.mode << 3) | self.reg
+
+
+class Reference(NamedTuple):
+    """
+    Зависимость слова строки от адреса: имя метки или переменной
+    либо константа, смещение до которой считается относительно PC
+    """
 
-    mode_6 = shift_name("shift") + pp.Suppress("(") + register_name + pp.Suppress(")")
+    # "xx" - смещение ветвления, "nn" - смещение sob,
+    # "abs" - слово с адресом, "rel" - слово со смещением относительно PC
+    kind: str
+    # Номер слова в строке
+    word_num: int
+    # Имя или выражение (см. symbols.parse_expression), значение которого подставляется в слово
+    symbol: Expression | None = None
+    # Адрес, если вместо имени записана константа
+    target: int | None = None
 
-    mode_7 = pp.Suppress("@") + mode_6
 
-    # Символы ASCII
-    symbol_name = "'" + pp.Word(pp.printables)("symbol")
-    # Константы
-    const_name = pp.Combine(pp.Optional("-") + pp.Word(pp.nums) + pp.Optional("."))
-    # Переменные и/или метки
-    variable_name = pp.Combine(
-        pp.Char(pp.alphas) + pp.Optional(pp.Word(pp.alphas + pp.nums + "_"))
-    )
-    # Общий модуль для констант
-    const_var_name = pp.Suppress(pp.Optional("@") + pp.Optional("#")) + (
-        symbol_name | const_name("const") | variable_name("variable")
-    )
-
-    names_to_search = mode_7 | mode_6 | full_reg_name | const_var_name
+class CodedLine(NamedTuple):
+    """
+    Закодированная строка программы, не зависящая от своего адреса и значений имён
+    Всё, что от них зависит, перечислено в refs и дописывается при размещении строки,
+    поэтому запись можно переиспользовать для любой строки с тем же текстом
+    """
 
-    # Перебираем аргументы из args
-    for arg in args:
-        val_name = names_to_search.parseString(arg).as_dict()
-        val_mode = modes_to_search.parseString(arg).as_dict()
-        res.append({**val_mode, **val_name})
-    return res
+    label: str | None = None
+    # Переменная "имя = значение" и её значение (число или выражение)
+    variable: str | None = None
+    value: Expression | None = None
+    # Новый адрес размещения для ".=" (число или выражение)
+    origin: Expression | None = None
+    # Ширина слов строки и сами слова (с заполнителями на месте ссылок)
+    width: int = 16
+    words: tuple[int, ...] = ()
+    refs: tuple[Reference, ...] = ()
 
 
-def code_arg(arg_dict: dict) -> str:
+def parse_line(text: str) -> SourceLine:
     """
-    Принимает словарь с ключами 'mode' и 'reg'|'const'|'symbol'
-    Возвращает кодировку для аргумента
-    :param  arg_dict: словарь характеристик аргумента
-        {'mode': ['2'], 'const': '2'}
+    Принимает строку с командой
+    Возвращает саму строку, а также выделенное имя команды, аргументы и комментарий
+    :param  text: строка с командой
+        "LOOP: mov 	#2, R0;"
+        ".= 1000; some comment"
     :return:
-        '010111'
+        SourceLine(text="LOOP: mov\t#2, R0;", label="LOOP", name="mov", args=("#2", "R0"))
+        SourceLine(text=".= 1000; some comment", pseudo=".=", args=("1000",), comm="some comment")
     """
 
-    spec_reg_pc = pp.Regex(r"(pc) | (PC)", flags=VERBOSE)
-    spec_reg_sp = pp.Regex(r"(sp) | (SP)", flags=VERBOSE)
-    register_name = (
-        pp.Suppress(pp.Literal("r") | pp.Literal("R")) + pp.Word("01234567")
-        | spec_reg_pc
-        | spec_reg_sp
+    result = LINE_GRAMMAR.parseString(text).as_dict()
+    return SourceLine(
+        text=text,
+        label=result.get("label"),
+        name=result.get("name"),
+        pseudo=result.get("pseudo"),
+        variable=result.get("variable"),
+        args=tuple(result.get("arg", ())),
+        comm=result.get("comm"),
     )
 
-    spec_regs = [
-        spec_reg_sp.setParseAction(pp.replaceWith("6")),
-        spec_reg_pc.setParseAction(pp.replaceWith("7")),
-        register_name,
-    ]
-    spec_to_search = pp.MatchFirst(spec_regs)
 
-    mode_code = f"{int(arg_dict['mode'][0]):03b}"
+def recognize_args(args: Iterable[str]) -> list[Operand]:
+    """
+    Принимает список имен аргументов
+    Возвращает для каждого отдельного аргумента его разбор по порядку.
+    :param  args: список аргументов
+        '['#2', 'R0']'
+    :return:
+        [Operand(mode=2, reg=7, value=2), Operand(mode=0, reg=0)]
+    """
+    return [recognize_arg(arg) for arg in args]
 
-    if arg_dict.get("const") or arg_dict.get("symbol"):
-        name_code = f"{7:03b}"
-    elif arg_dict.get("reg"):
-        name_code = f"{int(spec_to_search.parse_string(arg_dict['reg'])[0]):03b}"
-    # Заполнитель для необработанной переменной
-    elif arg_dict.get("variable"):
-        return "0" * 6
 
-    return mode_code + name_code
+@lru_cache(maxsize=4096)
+def recognize_arg(arg: str) -> Operand:
+    """
+    Разбирает один аргумент
+    :param  arg: имя аргумента
+        '#2'
+    :return:
+        Operand(mode=2, reg=7, value=2)
+    """
+    operand = expression_operand(arg)
+    if operand is not None:
+        return operand
+
+    val_name = NAMES_GRAMMAR.parseString(arg).as_dict()
+    val_mode = MODES_GRAMMAR.parseString(arg).as_dict()
+    mode = int(val_mode["mode"][0])
+
+    if val_name.get("reg"):
+        # Сдвиг для мод 6 и 7
+        shift = parse_number(val_name["shift"]) if val_name.get("shift") else None
+        return Operand(mode=mode, reg=register_number(val_name["reg"]), value=shift)
+
+    # Константы, символы и переменные адресуются через PC
+    relative = mode in (6, 7)
+    if val_name.get("variable"):
+        check_not_register(val_name["variable"], arg)
+        return Operand(mode=mode, reg=7, symbol=val_name["variable"], relative=relative)
+    if val_name.get("symbol"):
+        value = ord(val_name["symbol"][0])
+    else:
+        value = parse_number(val_name["const"])
+    return Operand(mode=mode, reg=7, value=value, relative=relative)
+
+
+def expression_operand(arg: str) -> Operand | None:
+    """
+    Разбирает аргумент, значение которого записано выражением
+    :param  arg: имя аргумента
+        '#BUF+2*N'
+        '.+10(R1)'
+    :return: None, если в аргументе нет выражения
+        Operand(mode=2, reg=7, symbol=('BUF', 2, 'N', '*', '+'))
+        Operand(mode=6, reg=1, symbol=('.', 8, '+'))
+    """
+    if REGISTER_OPERAND_RE.fullmatch(arg):
+        return None
+    match = EXPRESSION_OPERAND_RE.fullmatch(arg)
+    prefix, text, reg = match.group("prefix", "expr", "reg")
+    # Одно число, символ или имя без регистра разбирают лексеры сами,
+    # а смещение моды 6 и 7 - любое, поэтому 'BUF(R1)' и '10.(R1)' разбираются здесь
+    if reg is None and is_simple(text):
+        return None
+
+    expression = parse_expression(text)
+    if reg is not None:
+        # Индексные моды 6 и 7: выражение - смещение относительно регистра
+        if prefix in ("#", "@#"):
+            raise ValueError(f"Неверный аргумент {arg!r}")
+        mode, number, relative = 7 if prefix else 6, register_number(reg), False
+    else:
+        mode = {"#": 2, "@#": 3, "@": 7, None: 6}[prefix]
+        number, relative = 7, mode in (6, 7)
+    if type(expression) is int:
+        return Operand(mode=mode, reg=number, value=expression, relative=relative)
+    return Operand(mode=mode, reg=number, symbol=expression, relative=relative)
+
+
+@lru_cache(maxsize=64)
+def register_number(name: str) -> int:
+    """
+    Возвращает номер регистра по его имени
+    :param  name: имя регистра
+        'SP'
+    :return:
+        6
+    """
+    return int(REGISTER_GRAMMAR.parse_string(name)[0])
 
 
 def get_ascii_text(name: str, text: str) -> str:
@@ -190,14 +366,65 @@ def get_ascii_text(name: str, text: str) -> str:
 
     # Аргумент ищем после команды
     start = text.find(name) + len(name)
-    # Выражение для поиска
-    # Здесь (.) - один символ, который запомнили
-    # (.*?) - символы между
-    # \1 - на конце первый, который запомнили
-    same_char_string = pp.Regex(r"(.)(.*?)\1")("string")
     # Область поиска
     text_to_search = text[start:]
 
-    result = same_char_string.parseString(text_to_search)[0]
+    try:
+        result = SAME_CHAR_STRING.parseString(text_to_search)[0]
+    except pp.ParseException:
+        raise ValueError(
+            f"У {name} должна быть строка между одинаковыми символами, например /abc/"
+        ) from None
     # Барьерные символы игнорируются
     return result[1:-1]
+
+
+def word2oct(word: int, width: int = 16) -> str:
+    """
+    Принимает слово или байт и возвращает
+    его восьмеричное представление для листинга
+    :param  word: слово или байт
+        5568
+    :param width: ширина в битах
+        16
+    :return:
+        '012700'
+    """
+    if width == 16:
+        return f"{word:06o}"
+    return f"{word:03o}"
+
+
+def listing_comm(
+    text: str, commands: Iterable[int], current_counter: int, width: int
+) -> Iterator[str]:
+    """
+    Из строки программы и её слов делает 1+ строк листинга
+    (общая запись листинга ассемблера и дизассемблера)
+    :param text: строка программы
+        '	mov 	#2, R0; R0 = 2'
+    :param commands:
+        []
+        [0o012700, 0o000002]
+    :param current_counter: PC строки
+        0o1000
+    :param width: ширина слов строки
+        16
+    :return: строки листинга
+    000000:		. =		1000
+    001000:		mov		#2, R0
+        012700
+        000002
+    """
+    if text != "":
+        # В каком адресе лежит какая команда
+        yield f"{current_counter:06o}:\t\t" + text
+
+    # Печатаем байты "лесенкой"
+    tabulation_for_byte = 0
+    for cmd in commands:
+        tabulation_for_byte = 0 if tabulation_for_byte else 1
+        if width == 8 and tabulation_for_byte:
+            yield f"\t\t{word2oct(cmd, width)}"
+        else:
+            yield f"\t{word2oct(cmd, width)}"
@@ -0,0 +1,125 @@
+import re
+from collections.abc import Callable, Iterable, Iterator
+from pathlib import Path
+from funcs import SourceLine, get_ascii_text
+
+# Вставка файлов: .INCLUDE "имя" (ограничитель - любой символ, как в .ASCII).
+# Путь считается от каталога файла со строкой .INCLUDE.
+# Вставляемый файл разбирается один раз на процесс: разобранные строки хранятся
+# в INCLUDED_FILES и переиспользуются всеми программами, которые его вставляют
+# (в batch и verify - всеми программами одного процесса пула)
+
+INCLUDE_RE = re.compile(r"[ \t]*\.INCLUDE\b")
+
+# (путь, функция разбора строки) -> ((время изменения, размер), разобранные строки)
+INCLUDED_FILES: dict[
+    tuple[str, Callable], tuple[tuple[int, int], tuple[SourceLine, ...]]
+] = {}
+
+
+def include_path(text: str, directory: Path) -> Path:
+    """
+    Путь вставляемого файла из строки .INCLUDE
+    :param text: строка программы
+        '\t.INCLUDE "devices.inc"'
+    :param directory: каталог файла со строкой .INCLUDE
+        Path('pdp11_tests/08_hello')
+    :return:
+        Path('/root/package/pdp11_tests/08_hello/devices.inc')
+    """
+    return (directory / get_ascii_text(name=".INCLUDE", text=text)).resolve()
+
+
+def parsed_file(
+    path: Path, parse_line: Callable[[str], SourceLine]
+) -> tuple[SourceLine, ...]:
+    """
+    Возвращает разобранные непустые строки файла, разбирая файл только
+    при первом обращении или после его изменения
+    :param path: путь файла
+        Path('/root/package/pdp11_tests/common/devices.inc')
+    :param parse_line: функция разбора строки (см. pdp11_compiler.LEXERS)
+    :return: строки с их местом в файле
+        (SourceLine(text='ostat = 177564', variable='ostat', args=('177564',),
+                    file='/root/package/pdp11_tests/common/devices.inc', file_line=1), ...)
+    """
+    stat = path.stat()
+    version = (stat.st_mtime_ns, stat.st_size)
+    key = (str(path), parse_line)
+    cached = INCLUDED_FILES.get(key)
+    if cached is not None and cached[0] == version:
+        return cached[1]
+
+    with open(path) as file:
+        lines = tuple(
+            parse_line(text)._replace(file=str(path), file_line=file_line)
+            for file_line, text in enumerate(map(str.rstrip, file), 1)
+            if text
+        )
+    INCLUDED_FILES[key] = (version, lines)
+    return lines
+
+
+def expand_includes(
+    items: Iterable[str | SourceLine],
+    directory: Path,
+    parse_line: Callable[[str], SourceLine],
+    stack: tuple[Path, ...] = (),
+) -> Iterator[str | SourceLine]:
+    """
+    Заменяет строки .INCLUDE строками вставляемых файлов (вложенные вставки тоже)
+    Строка .INCLUDE остаётся в листинге, но не кодируется
+    :param items: строки программы
+        '\t.INCLUDE "devices.inc"', '\tmov #1, R0', ...
+    :param directory: каталог файла, из которого строки
+        Path('pdp11_tests/08_hello')
+    :param parse_line: функция разбора строки
+    :param stack: файлы, которые сейчас вставляются (для поиска циклов)
+    :return:
+        SourceLine(text='\t.INCLUDE "devices.inc"'), SourceLine(text='ostat = 177564', ...), ...
+    """
+    for item in items:
+        text = item if type(item) is str else item.text
+        if ".INCLUDE" not in text or INCLUDE_RE.match(text) is None:
+            yield item
+            continue
+
+        path = include_path(text, directory)
+        if path in stack:
+            raise ValueError(f"Файл {path} вставляет сам себя")
+        if type(item) is str:
+            yield SourceLine(text=text)
+        else:
+            yield SourceLine(text=text, file=item.file, file_line=item.file_line)
+        yield from expand_includes(
+            parsed_file(path, parse_line), path.parent, parse_line, (*stack, path)
+        )
+
+
+def included_files(filename: str | Path) -> list[Path]:
+    """
+    Все файлы, которые вставляет filename (и вложенные), без разбора строк:
+    от них зависит результат сборки filename
+    :param filename: имя файла-исходника
+        '08_hello.pdp'
+    :return:
+        [Path('/root/package/pdp11_tests/08_hello/devices.inc')]
+    """
+    found = []
+    pending = [Path(filename).resolve()]
+    while pending:
+        current = pending.pop()
+        try:
+            with open(current) as file:
+                texts = [text for text in file if ".INCLUDE" in text]
+        except FileNotFoundError:
+            # Отсутствующий файл найдёт сама сборка
+            continue
+        for text in texts:
+            if INCLUDE_RE.match(text) is None:
+                continue
+            path = include_path(text.rstrip(), current.parent)
+            if path not in found:
+                found.append(path)
+                pending.append(path)
+    return found
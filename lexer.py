@@ -0,0 +1,146 @@
+import re
+from collections.abc import Iterable
+from functools import lru_cache
+from funcs import Operand, SourceLine, parse_line, parse_number, recognize_arg
+
+# Быстрый разбор самых частых форм строк и аргументов на регулярных выражениях.
+# Всё, что не подходит под эти формы (или разбирается грамматикой иначе),
+# отдаётся обратно в грамматику pyparsing из funcs.py
+
+# Имена команд, меток и переменных
+_NAME = r"[A-Za-z][A-Za-z0-9_]*"
+
+# Строка: [метка:] [команда | псевдокоманда | переменная =] [аргументы] [; комментарий]
+LINE_RE = re.compile(
+    rf"""[ \t]*
+    (?:(?P<label>{_NAME})[ \t]*:[ \t]*)?
+    (?:
+        (?P<variable>{_NAME})[ \t]*=
+        | (?P<pseudo>\.(?:\ ?=|[A-Za-z]+))
+        | (?P<name>[A-Za-z]+)
+    )?
+    (?P<rest>.*)""",
+    flags=re.VERBOSE,
+)
+
+# Регистры Rn, PC и SP
+_REG = r"(?P<reg>[rR][0-7]|pc|PC|sp|SP)"
+# Имя, которое грамматика приняла бы за регистр (например, 'spam' или 'r5x')
+REG_PREFIX_RE = re.compile(r"[rR]+[0-7]|pc|PC|sp|SP")
+# Сдвиг для мод 6 и 7
+_SHIFT = r"(?P<shift>-?[0-7]+)"
+# Константа, символ ASCII или имя
+_VALUE = rf"(?:(?P<const>-?[0-7]+|-?[0-9]+\.)|'(?P<char>\S)|(?P<symbol>{_NAME}))"
+
+# Шаблоны аргументов по модам, порядок как в funcs.MODES_GRAMMAR
+OPERAND_PATTERNS = [
+    (re.compile(rf"@{_SHIFT}\({_REG}\)"), 7),
+    (re.compile(rf"{_SHIFT}\({_REG}\)"), 6),
+    (re.compile(rf"#{_VALUE}"), 2),
+    (re.compile(rf"@#{_VALUE}"), 3),
+    (re.compile(rf"@{_VALUE}"), 7),
+    (re.compile(rf"@-\({_REG}\)"), 5),
+    (re.compile(rf"-\({_REG}\)"), 4),
+    (re.compile(rf"@\({_REG}\)\+"), 3),
+    (re.compile(rf"\({_REG}\)\+"), 2),
+    (re.compile(rf"\({_REG}\)"), 1),
+    (re.compile(_REG), 0),
+    (re.compile(_VALUE), 6),
+]
+
+REGISTERS = {"pc": 7, "PC": 7, "sp": 6, "SP": 6}
+
+
+def fast_parse_line(text: str) -> SourceLine:
+    """
+    Разбирает строку программы регулярным выражением,
+    при необычной записи передаёт её в funcs.parse_line
+    :param  text: строка с командой
+        "LOOP: mov 	#2, R0;"
+    :return:
+        SourceLine(text="LOOP: mov\t#2, R0;", label="LOOP", name="mov", args=("#2", "R0"))
+    """
+    match = LINE_RE.fullmatch(text)
+    if match is None:
+        return parse_line(text)
+
+    label, variable, pseudo, name, rest = match.group(
+        "label", "variable", "pseudo", "name", "rest"
+    )
+    # После имени команды сразу должен идти пробел или ';' ('mov#2' разбирает грамматика)
+    if (name or (pseudo and pseudo[-1] != "=")) and rest and rest[0] not in " \t;":
+        return parse_line(text)
+    rest = rest.lstrip(" \t")
+
+    # Строка из одного комментария, как и в грамматике, сохраняет ';'
+    if not (variable or pseudo or name):
+        return SourceLine(text=text, label=label, comm=rest or None)
+
+    # Аргументы до ';', комментарий после
+    arguments, semicolon, comment = rest.partition(";")
+    args = ()
+    if arguments:
+        args = tuple(arg.strip(" \t") for arg in arguments.split(","))
+        # Пустые аргументы и аргументы с пробелами внутри разбирает грамматика
+        if not all(args) or any(" " in arg or "\t" in arg for arg in args):
+            return parse_line(text)
+
+    return SourceLine(
+        text=text,
+        label=label,
+        name=name,
+        pseudo=".=" if pseudo in (".=", ". =") else pseudo,
+        variable=variable,
+        args=args,
+        comm=comment.lstrip(" \t") or None,
+    )
+
+
+def fast_recognize_args(args: Iterable[str]) -> list[Operand]:
+    """
+    Аналог funcs.recognize_args на регулярных выражениях
+    :param  args: список аргументов
+        '['#2', 'R0']'
+    :return:
+        [Operand(mode=2, reg=7, value=2), Operand(mode=0, reg=0)]
+    """
+    return [fast_recognize_arg(arg) for arg in args]
+
+
+@lru_cache(maxsize=4096)
+def fast_recognize_arg(arg: str) -> Operand:
+    """
+    Разбирает один аргумент регулярными выражениями,
+    при необычной записи передаёт его в funcs.recognize_arg
+    :param  arg: имя аргумента
+        '#2'
+    :return:
+        Operand(mode=2, reg=7, value=2)
+    """
+    for pattern, mode in OPERAND_PATTERNS:
+        match = pattern.fullmatch(arg)
+        if match is None:
+            continue
+        fields = match.groupdict()
+
+        if fields.get("reg"):
+            reg = fields["reg"]
+            number = REGISTERS[reg] if reg in REGISTERS else int(reg[1])
+            shift = parse_number(fields["shift"]) if fields.get("shift") else None
+            return Operand(mode=mode, reg=number, value=shift)
+
+        relative = mode in (6, 7)
+        if fields["symbol"]:
+            # Имя вроде 'spam' грамматика считает регистром SP
+            if REG_PREFIX_RE.match(fields["symbol"]):
+                break
+            return Operand(mode=mode, reg=7, symbol=fields["symbol"], relative=relative)
+        if fields["char"]:
+            return Operand(
+                mode=mode, reg=7, value=ord(fields["char"]), relative=relative
+            )
+        return Operand(
+            mode=mode, reg=7, value=parse_number(fields["const"]), relative=relative
+        )
+
+    return recognize_arg(arg)
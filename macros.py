@@ -0,0 +1,241 @@
+import re
+from collections.abc import Callable, Iterable, Iterator
+from typing import NamedTuple
+from funcs import SourceLine
+
+# Расширение макросов и повторяемых блоков перед разбором программы:
+#   .MACRO имя [параметр, ...] ... .ENDM - определение макроса,
+#   имя [аргумент, ...] - вызов макроса,
+#   .REPT число ... .ENDR - повторение блока,
+#   .IRP параметр, <значение, ...> ... .ENDR - блок для каждого значения.
+# Строки определений и заголовков блоков остаются в листинге, но не кодируются.
+# Тела разбираются один раз при определении, при расширении в разобранных строках
+# только подставляются аргументы; расширенные строки остаются на месте строк тела
+# в исходнике (SourceLine.file, file_line)
+
+# Метка и первое слово строки (имя команды, макроса или псевдокоманды)
+FIRST_WORD_RE = re.compile(
+    r"[ \t]*(?:(?P<label>[A-Za-z][A-Za-z0-9_]*)[ \t]*:[ \t]*)?(?P<word>\.?[A-Za-z][A-Za-z0-9_]*)"
+)
+
+# Начала и концы блоков
+BLOCK_STARTS = (".MACRO", ".REPT", ".IRP")
+BLOCK_ENDS = (".ENDM", ".ENDR")
+# Быстрая проверка: пока макросов нет, разбирать первое слово нужно только у строк с ними
+BLOCK_WORD_RE = re.compile(r"\.(?:MACRO|REPT|IRP|ENDM|ENDR)")
+
+
+class BodyLine(NamedTuple):
+    """
+    Разобранная строка тела макроса или блока
+    """
+
+    line: SourceLine
+    # Регулярное выражение параметров, которые встречаются в строке (None - таких нет)
+    params: re.Pattern | None = None
+
+
+class Macro(NamedTuple):
+    """
+    Определённый макрос: имя, параметры и подготовленные строки тела
+    """
+
+    name: str
+    params: tuple[str, ...]
+    body: tuple[BodyLine, ...]
+
+
+class MacroExpander:
+    """
+    Ленивое расширение макросов и блоков в потоке строк программы
+    Строки без макросов проходят как есть (текстом), остальные отдаются
+    разобранными (SourceLine)
+    """
+
+    def __init__(
+        self, parse_line: Callable[[str], SourceLine], evaluate: Callable[[str], int]
+    ):
+        # Разбор строки (строки текстом - из самого файла программы, разобранная
+        # строка получает их место в файле) и вычисление числа повторений .REPT
+        self.parse_line = parse_line
+        self.evaluate = evaluate
+        # Определённые макросы по имени
+        self.macros: dict[str, Macro] = {}
+
+    def expand(self, items: Iterable[str | SourceLine]) -> Iterator[str | SourceLine]:
+        """
+        Расширяет макросы и блоки в строках программы
+        :param items: строки программы (текстом или разобранные)
+            '\tPUSH R1', ...
+        :return: строки программы без макросов и блоков
+            SourceLine(text='\tPUSH R1'), SourceLine(text='\tmov R1, -(SP)', name='mov', ...)
+        """
+        items = iter(items)
+        macros = self.macros
+        block_word = BLOCK_WORD_RE.search
+        for item in items:
+            text = item if type(item) is str else item.text
+            if not macros and ("." not in text or block_word(text) is None):
+                yield item
+                continue
+            match = FIRST_WORD_RE.match(text)
+            word = match and match.group("word")
+
+            if word in BLOCK_STARTS:
+                body, end = self.collect(items)
+                # Определение блока остаётся в листинге, но не кодируется
+                yield self.listed(item, match.group("label"))
+                yield from map(self.listed, body)
+                yield self.listed(end)
+                yield from self.expand_block(word, arguments(text, match), body)
+            elif word in BLOCK_ENDS:
+                raise ValueError(f"{word} без начала блока: {text!r}")
+            elif word in macros:
+                # Строка вызова остаётся в листинге, её метка - адрес расширения
+                yield self.listed(item, match.group("label"))
+                args = split_arguments(arguments(text, match))
+                yield from self.expand(self.call(macros[word], args))
+            else:
+                yield item
+
+    def collect(self, items: Iterator[str | SourceLine]) -> tuple[list, SourceLine]:
+        """
+        Разбирает строки тела блока до его конца (с учётом вложенных блоков)
+        :param items: строки программы после начала блока
+        :return: строки тела и строка конца блока
+            ([SourceLine(text='\tmov R1, -(SP)', ...)], SourceLine(text='\t.ENDM', ...))
+        """
+        body = []
+        depth = 0
+        for item in items:
+            line = self.parse_line(item) if type(item) is str else item
+            match = FIRST_WORD_RE.match(line.text)
+            word = match and match.group("word")
+            if word in BLOCK_STARTS:
+                depth += 1
+            elif word in BLOCK_ENDS:
+                if depth == 0:
+                    return body, line
+                depth -= 1
+            body.append(line)
+        raise ValueError("Блок .MACRO, .REPT или .IRP не закрыт")
+
+    def listed(self, item: str | SourceLine, label: str | None = None) -> SourceLine:
+        """
+        Строка, которая остаётся в листинге, но не кодируется, на месте строки item
+        :param item: строка программы (текстом или разобранная)
+            '\t.REPT 3'
+        :param label: метка строки
+        :return:
+            SourceLine(text='\t.REPT 3', file_line=4)
+        """
+        line = self.parse_line(item) if type(item) is str else item
+        return SourceLine(
+            text=line.text, label=label, file=line.file, file_line=line.file_line
+        )
+
+    def expand_block(
+        self, word: str, rest: str, body: list[SourceLine]
+    ) -> Iterator[SourceLine]:
+        """
+        Определяет макрос или расширяет блок .REPT, .IRP
+        :param word: начало блока
+            '.REPT'
+        :param rest: аргументы начала блока
+            '3'
+        :param body: строки тела
+        """
+        match word:
+            case ".MACRO":
+                if not rest:
+                    raise ValueError("У макроса нет имени")
+                name, *params = split_arguments(
+                    rest, separators=r"[ \t]*,[ \t]*|[ \t]+"
+                )
+                self.macros[name] = Macro(name, tuple(params), prepare(body, params))
+            case ".REPT":
+                for _ in range(self.evaluate(rest)):
+                    yield from self.expand(body)
+            case ".IRP":
+                param, _, values = rest.partition(",")
+                param = param.strip()
+                prepared = prepare(body, (param,))
+                for value in split_arguments(values.strip(" \t<>")):
+                    yield from self.expand(substitute(prepared, {param: value}))
+
+    def call(self, macro: Macro, args: list[str]) -> Iterator[SourceLine]:
+        """
+        Строки расширения вызова макроса
+        :param macro: макрос
+        :param args: аргументы вызова (недостающие - пустые)
+            ['R1']
+        """
+        if len(args) > len(macro.params):
+            raise ValueError(
+                f"Макрос {macro.name} принимает {len(macro.params)} аргументов"
+            )
+        values = dict.fromkeys(macro.params, "")
+        values.update(zip(macro.params, args))
+        return substitute(macro.body, values)
+
+
+def arguments(text: str, match: re.Match) -> str:
+    """
+    Аргументы строки после первого слова, без комментария
+    :param text: строка программы
+        'LOOP: PUSH R1, R2 ; сохранить'
+    :param match: совпадение FIRST_WORD_RE
+    :return:
+        'R1, R2'
+    """
+    return text[match.end() :].partition(";")[0].strip(" \t")
+
+
+def split_arguments(text: str, separators: str = r"[ \t]*,[ \t]*") -> list[str]:
+    """
+    Делит аргументы по запятым (и пробелам для separators с ними)
+    :param text: аргументы
+        'R1, R2'
+    :return:
+        ['R1', 'R2']
+    """
+    return re.split(separators, text) if text else []
+
+
+def prepare(body: list[SourceLine], params: Iterable[str]) -> tuple[BodyLine, ...]:
+    """
+    Отмечает в строках тела параметры, которые нужно подставлять
+    :param body: строки тела
+    :param params: имена параметров
+        ('R',)
+    :return:
+        (BodyLine(line=SourceLine(...), params=re.compile('\\b(?:R)\\b')), ...)
+    """
+    prepared = []
+    for line in body:
+        used = [param for param in params if re.search(rf"\b{param}\b", line.text)]
+        pattern = re.compile(rf"\b(?:{'|'.join(used)})\b") if used else None
+        prepared.append(BodyLine(line, pattern))
+    return tuple(prepared)
+
+
+def substitute(
+    body: Iterable[BodyLine], values: dict[str, str]
+) -> Iterator[SourceLine]:
+    """
+    Подставляет значения параметров в разобранные строки тела без повторного разбора
+    :param body: подготовленные строки тела (см. prepare)
+    :param values: значения параметров
+        {'R': 'R1'}
+    """
+    replace = lambda match: values[match.group()]
+    for line, pattern in body:
+        if pattern is None:
+            yield line
+            continue
+        yield line._replace(
+            text=pattern.sub(replace, line.text),
+            label=line.label and pattern.sub(replace, line.label),
+            variable=line.variable and pattern.sub(replace, line.variable),
+            args=tuple(pattern.sub(replace, arg) for arg in line.args),
+        )
@@ -0,0 +1,172 @@
+from collections.abc import Iterable
+from pathlib import Path
+import mmap
+import struct
+from typing import BinaryIO
+
+# Форматы объектного файла:
+# text - по байту в строке (два hex-символа), перед блоком строка "адрес длина";
+# lda - блоки абсолютного загрузчика PDP-11: 001 000, счётчик, адрес, данные, контрольная сумма;
+# raw - заголовок RAW_MAGIC, затем блоки: адрес и длина (RAW_BLOCK), байты блока как есть
+OBJ_FORMATS = ("text", "lda", "raw")
+
+RAW_MAGIC = b"PDP11RAW"
+RAW_BLOCK = struct.Struct("<HI")
+# Заголовок блока LDA: 001 000, счётчик байт (с заголовком), адрес загрузки
+LDA_BLOCK = struct.Struct("<BBHH")
+# Наибольшая длина данных в одном блоке LDA (счётчик 16-битный)
+LDA_CHUNK = 0o100000
+# Адрес в последнем блоке LDA: нечётный - загрузчик останавливается, не запуская программу
+LDA_NO_START = 1
+
+
+def write_lda(
+    file: BinaryIO, blocks: Iterable[tuple[int, bytes]], start: int = LDA_NO_START
+) -> None:
+    """
+    Записывает блоки в формате абсолютного загрузчика PDP-11 (LDA)
+    :param file: файл, открытый на запись в двоичном режиме
+    :param blocks: адреса блоков и их байты
+        [(0o1000, bytearray(b'\\xc0\\x15\\x02\\x00'))]
+    :param start: адрес запуска в последнем блоке
+        1
+    """
+    for address, data in blocks:
+        view = memoryview(data)
+        for offset in range(0, len(view), LDA_CHUNK):
+            chunk = view[offset : offset + LDA_CHUNK]
+            # Адрес 16-битный, как и память PDP-11
+            header = LDA_BLOCK.pack(1, 0, len(chunk) + 6, (address + offset) & 0o177777)
+            file.write(header)
+            file.write(chunk)
+            # Сумма всех байт блока вместе с контрольной равна нулю
+            file.write(bytes([-(sum(header) + sum(chunk)) & 0o377]))
+
+    header = LDA_BLOCK.pack(1, 0, 6, start)
+    file.write(header)
+    file.write(bytes([-sum(header) & 0o377]))
+
+
+def write_raw(file: BinaryIO, blocks: Iterable[tuple[int, bytes]]) -> None:
+    """
+    Записывает блоки как есть, с заголовком из адреса и длины перед каждым
+    :param file: файл, открытый на запись в двоичном режиме
+    :param blocks: адреса блоков и их байты
+        [(0o1000, bytearray(b'\\xc0\\x15\\x02\\x00'))]
+    """
+    file.write(RAW_MAGIC)
+    for address, data in blocks:
+        file.write(RAW_BLOCK.pack(address & 0o177777, len(data)))
+        file.write(data)
+
+
+def object_format(data: bytes | memoryview) -> str:
+    """
+    Определяет формат объектного файла по его началу
+    :param data: содержимое файла
+        b'200 000c\\n'
+    :return:
+        'text'
+    """
+    if data[: len(RAW_MAGIC)] == RAW_MAGIC:
+        return "raw"
+    if data[:2] == b"\x01\x00":
+        return "lda"
+    return "text"
+
+
+def parse_text(data: bytes | memoryview) -> list[tuple[int, bytes]]:
+    """
+    Разбирает текстовый .o файл
+    :param data: содержимое файла
+        b'200 0002\\nc0\\n15\\n'
+    :return:
+        [(0o1000, b'\\xc0\\x15')]
+    """
+    lines = bytes(data).split()
+    blocks = []
+    line_num = 0
+    while line_num < len(lines):
+        address, length = int(lines[line_num], 16), int(lines[line_num + 1], 16)
+        start = line_num + 2
+        line_num = start + length
+        blocks.append(
+            (address, bytes.fromhex(b"".join(lines[start:line_num]).decode()))
+        )
+    return blocks
+
+
+def parse_lda(data: bytes | memoryview) -> list[tuple[int, memoryview]]:
+    """
+    Разбирает блоки LDA, проверяя контрольные суммы
+    Байты блоков - срезы data без копирования
+    :param data: содержимое файла
+    :return:
+        [(0o1000, <memory>)]
+    """
+    view = memoryview(data)
+    blocks = []
+    offset = 0
+    while offset < len(view):
+        # Между блоками на ленте могут быть нули
+        if view[offset] == 0:
+            offset += 1
+            continue
+        one, zero, count, address = LDA_BLOCK.unpack_from(view, offset)
+        if one != 1 or zero != 0 or count < 6:
+            raise ValueError(f"Неверный блок LDA по смещению {offset}")
+        end = offset + count
+        if sum(view[offset : end + 1]) & 0o377:
+            raise ValueError(
+                f"Неверная контрольная сумма блока LDA по смещению {offset}"
+            )
+        if count == 6:
+            # Последний блок - адрес запуска
+            break
+        blocks.append((address, view[offset + LDA_BLOCK.size : end]))
+        offset = end + 1
+    return blocks
+
+
+def parse_raw(data: bytes | memoryview) -> list[tuple[int, memoryview]]:
+    """
+    Разбирает блоки формата raw
+    Байты блоков - срезы data без копирования
+    :param data: содержимое файла
+    :return:
+        [(0o1000, <memory>)]
+    """
+    view = memoryview(data)
+    blocks = []
+    offset = len(RAW_MAGIC)
+    while offset < len(view):
+        address, length = RAW_BLOCK.unpack_from(view, offset)
+        offset += RAW_BLOCK.size
+        blocks.append((address, view[offset : offset + length]))
+        offset += length
+    return blocks
+
+
+PARSERS = {"text": parse_text, "lda": parse_lda, "raw": parse_raw}
+
+
+def read_object(
+    filename: str | Path, use_mmap: bool = True
+) -> list[tuple[int, bytes | memoryview]]:
+    """
+    Читает объектный файл любого формата из OBJ_FORMATS
+    Двоичные файлы отображаются в память (mmap): блоки - срезы отображения,
+    которое живёт, пока на них есть ссылки
+    :param filename: имя объектного файла
+        '01_sum.pdp.o'
+    :param use_mmap: отображать файл в память, а не читать целиком
+        True
+    :return: адреса блоков и их байты
+        [(0o1000, <memory>)]
+    """
+    with open(filename, "rb") as file:
+        if use_mmap and Path(filename).stat().st_size:
+            data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        else:
+            data = file.read()
+    return PARSERS[object_format(data)](data)
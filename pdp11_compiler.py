@@ -1,148 +1,491 @@
+from array import array
+from collections.abc import Callable, Iterable, Iterator, Sequence
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import nullcontext
 from dataclasses import dataclass
+from functools import lru_cache, partial
+from itertools import accumulate
 from pathlib import Path
+from time import perf_counter
+import glob
+import os
+import sys
 import click
-from funcs import parse_line, recognize_args, code_arg, get_ascii_text
+from funcs import (
+    CodedLine,
+    Operand,
+    Reference,
+    SourceLine,
+    parse_line,
+    recognize_args,
+    get_ascii_text,
+    listing_comm,
+)
+from cache import CACHE_DIR, CACHE_SIZE, AssemblyCache
+from commands import COMMANDS, FORMAT_FIELDS
+from disasm import disassemble
+from emulator import execute, run_options
+from includes import expand_includes, included_files
+from lexer import fast_parse_line, fast_recognize_args
+from macros import MacroExpander
+from objfile import OBJ_FORMATS, read_object, write_lda, write_raw
+from profiling import append_stats, compile_with_stats, format_stats
+from server import SOCKET_PATH, handle_stream, send_jobs, serve_socket
+from symbols import Expression, SymbolTable, expression_names, parse_expression
+from symmap import MapLine, MapSymbol, write_map
+
+# Маски слова и байта
+WORD_MASK = 0o177777
+BYTE_MASK = 0o377
+# Строки .o файла для каждого значения байта
+HEX_BYTES = [f"{byte:02x}\n" for byte in range(256)]
+# Размер буфера при записи .l и .o файлов
+WRITE_BUFFER = 1 << 16
+# Длинные формы ветвлений (см. PDP11_Parser.far_line): jmp метка (режим 6, PC),
+# dec, br, bne и beq. Условия ветвлений парные, противоположное условие
+# отличается битом BRANCH_CONDITION (bne/beq, bpl/bmi, bcc/bcs, ...)
+JMP_RELATIVE = COMMANDS["jmp"].opcode | 0o67
+DEC = COMMANDS["dec"].opcode
+BR = COMMANDS["br"].opcode
+BNE = COMMANDS["bne"].opcode
+BEQ = COMMANDS["beq"].opcode
+BRANCH_CONDITION = 0o400
+# Что записывает сборка: .o и .l, только .o или только .l
+OUTPUTS = ("both", "obj", "listing")
+# По сколько строк большой программы кодируется в одном задании пула (см. code_parallel)
+CHUNK_SIZE = 20000
+# Сколько закодированных строк помнит один PDP11_Parser (одинаковые строки кодируются один раз)
+LINE_MEMO_SIZE = 4096
 
 
 @dataclass
-class Command:
-    name: str
-    opcode: str
-    has_ss: bool = False
-    has_dd: bool = False
-    has_nn: bool = False
-    has_r: bool = False
-    has_xx: bool = False
-
-    print_shift: bool = False
-
-
-COMMANDS = {
-    "mov": Command(name="mov", opcode="0001", has_ss=True, has_dd=True),
-    "movb": Command(name="movb", opcode="1001", has_ss=True, has_dd=True),
-    "add": Command(name="add", opcode="0110", has_ss=True, has_dd=True),
-    "halt": Command(name="halt", opcode="0" * 16),
-    "sob": Command(name="sob", opcode="0111111", has_nn=True, has_r=True),
-    "br": Command(name="br", opcode="00000001", has_xx=True),
-    "clr": Command(name="clr", opcode="0000101000", has_dd=True),
-    "beq": Command(name="beq", opcode="00000011", has_xx=True),
-    "tstb": Command(name="tstb", opcode="1000101111", has_dd=True),
-    "bpl": Command(name="bpl", opcode="10000000", has_xx=True),
-    "jsr": Command(
-        name="jsr", opcode="0000100", has_r=True, has_dd=True, print_shift=True
-    ),
-    "rts": Command(name="jsr", opcode="0000000010000", has_r=True),
+class Fixup:
+    """
+    Ссылка вперёд на ещё неизвестное имя (метку или переменную)
+    или выражение с ним, которую дописываем после прохода по программе
+    """
+
+    # Тип ссылки, как в patch_word
+    kind: str
+    # Имя или выражение
+    symbol: Expression
+    # Номер строки программы и номер слова в ней
+    line_num: int
+    word_num: int
+    # PC, относительно которого считается смещение
+    counter: int = 0
+
+
+@dataclass
+class AssemblyResult:
+    """
+    Результат сборки программы в памяти (см. PDP11_Parser.assemble_source)
+    """
+
+    # Непустые блоки программы: адрес блока -> байты
+    blocks: dict[int, bytes]
+    # Строки листинга (как в .l файле), None - листинг не запрашивался
+    listing: list[str] | None
+    # Метки и переменные: имя -> значение
+    symbols: dict[str, int]
+
+
+# Способы разбора строк: (разбор строки, разбор аргументов)
+LEXERS = {
+    # Регулярные выражения lexer.py, необычные записи - грамматикой
+    "fast": (fast_parse_line, fast_recognize_args),
+    # Только грамматика pyparsing из funcs.py
+    "grammar": (parse_line, recognize_args),
 }
 
 
 class PDP11_Parser:
-    def __init__(self):
-        # Список строк, прочитанных из файла
-        self.file_lines = []
-        # Список словарей полученных при парсинге строк, прочитанных из файла
-        self.parsed_lines: list[dict] = []
-        # Список для формирования .l файла, здесь [строки .l файла по порядку]
-        self.lines: list[str] = []
-        # Словарь для формирования .о файла, здесь (адрес блока): [байты блока по порядку]
-        self.object_lines = dict()
+    def __init__(
+        self,
+        lexer: str = "fast",
+        cache: AssemblyCache | None = None,
+        obj_format: str = "text",
+        outputs: str = "both",
+        workers: int | None = 1,
+        chunk_size: int = CHUNK_SIZE,
+        symbol_map: bool = False,
+    ):
+        # Функции разбора строки и аргументов (см. LEXERS)
+        self.parse_line, self.recognize_args = LEXERS[lexer]
+        # Формат .o файла (см. objfile.OBJ_FORMATS)
+        self.obj_format = obj_format
+        # Параметры, от которых зависит результат сборки (входят в ключ кэша)
+        self.options = {"lexer": lexer, "obj_format": obj_format}
+        # Записываемые файлы (см. OUTPUTS): без .l листинг не форматируется вовсе,
+        # без .o не собираются байты блоков. На результат сборки не влияют,
+        # поэтому в ключ кэша не входят
+        if outputs not in OUTPUTS:
+            raise ValueError(f"Неизвестное значение outputs: {outputs!r}")
+        self.outputs = outputs
+        # Записывать ли карту программы filename.map (см. symmap.py)
+        self.symbol_map = symbol_map
+        # Кэш сборок на диске (None - без кэша)
+        self.cache = cache
+        # Программа больше chunk_size строк кодируется по кускам в пуле из workers
+        # процессов (None - по числу ядер, 1 - без пула), см. code_parallel
+        self.workers = workers
+        self.chunk_size = chunk_size
+        # Закодированные строки прошлой сборки и текущей (для кэша) по тексту строки
+        self.line_cache: dict[str, CodedLine | tuple] = {}
+        self.coded_lines: dict[str, CodedLine] | None = None
+        # Закодированная строка зависит только от текста - повторы не кодируем заново
+        self.compile_line = lru_cache(maxsize=LINE_MEMO_SIZE)(self.compile_line)
+        # Строки расширений макросов приходят разобранными - их помним по разбору
+        self.code_expanded = lru_cache(maxsize=LINE_MEMO_SIZE)(self.code_line)
+        self.reset()
+
+    def reset(self) -> None:
+        """
+        Сбрасывает состояние сборки программы, чтобы собрать следующую тем же
+        PDP11_Parser. Закодированные строки (compile_line) не зависят от программы
+        и остаются: повторяющиеся в программах строки не кодируются заново
+        """
+        # Имя файла-исходника
+        self.filename: str | Path | None = None
+        # Строки программы, собираемой из памяти (вместо файла), и каталог для .INCLUDE
+        self.source: tuple[str, ...] | None = None
+        self.directory = Path.cwd()
+        # Строки, закодированные в пуле (см. code_parallel), вместе с self.line_cache
+        self.parallel_lines: dict[str, CodedLine | tuple] = {}
+        # Номер последней прочитанной строки файла программы, считая пустые (см. numbered_lines)
+        self.read_line = 0
+        # Строки программы после вставок и расширений в порядке кодирования
+        # (i - номер непустой строки, см. record_lines): по ним пишутся листинг и карта
+        # и заново размещается программа в relax_branches. Блоки .REPT расширяются
+        # один раз, с теми значениями имён, что были при их кодировании.
+        # Все строки держатся, только если пишутся листинг или карта, иначе - только
+        # разобранные (self.parsed_items), а строки файла читаются заново (см. program_items)
+        self.keep_items = self.outputs != "obj" or self.symbol_map
+        self.line_items: list[str | SourceLine] = []
+        self.parsed_items: dict[int, SourceLine] = {}
+        # Места строк в исходниках: номер файла в self.source_files и номер строки в нём
+        # (с 1, считая пустые). Файл 0 - сам файл программы, остальные - вставленные
+        self.line_files = array("L")
+        self.line_numbers = array("L")
+        self.source_files: list[str] = []
+        self.reset_layout()
+
+    def reset_layout(self) -> None:
+        """
+        Сбрасывает размещение программы (адреса, слова, имена), оставляя её источник
+        """
+        # Номер последней прочитанной непустой строки файла
+        self.fileline_num = -1
+        # Компактные записи программы по строкам (i - номер непустой строки файла):
+        # PC строки, адрес блока, индекс первого слова строки в self.words, ширина слов (16 или 8)
+        self.line_counters = array("L")
+        self.line_blocks = array("L")
+        self.line_starts = array("L")
+        self.line_widths = bytearray()
+        # Слова и байты всех строк программы подряд
+        self.words = array("H")
+        # Ссылки вперёд, которые дописываются после прохода по программе
+        self.fixups: list[Fixup] = []
+        # Словарь для формирования .о файла, здесь (адрес блока): байты блока по порядку
+        self.object_lines: dict[int, bytearray] = dict()
         # PC
         self.programm_counter = 0  # f'{:06o}'
         # Адрес текущего блока
         self.curr_block = 0  # f'{:04x}'
-        self.object_lines[self.curr_block] = list()
-        # Словарь для меток, собранных при прекомпиляции, здесь (имя метки): [номер строки с меткой, programm_counter]
-        self.labels = dict()
-        # Словарь для имен переменных, собранных при прекомпиляции, здесь (имя переменной): [значение]
-        self.variables = dict()
+        self.object_lines[self.curr_block] = bytearray()
+        # Метки (адреса) и переменные (значения)
+        self.symbols = SymbolTable()
+        # Для проверки и удлинения ветвлений (см. relax_branches), без новых объектов
+        # на строку: номера строк и ссылки ветвлений, номера и закодированные строки
+        # с метками, переменными и ".=", удлинённые ветвления: номер строки -> ступень
+        self.branch_lines = array("L")
+        self.branch_refs: list[Reference] = []
+        self.symbol_lines = array("L")
+        self.symbol_coded: list[CodedLine] = []
+        self.far_lines: dict[int, int] = {}
+
+    def compile(self, filename: str | Path) -> None:
+        """
+        Компилирует файл filename, записывая filename.o и filename.l - байт-код и листинг файлы
+        (или только один из них, см. self.outputs) и, если нужно, карту программы filename.map.
+        :param filename: имя файла-исходника
+            '01_sum.pdp'
+        """
+        obj_name, listing_name = filename + ".o", filename + ".l"
+        targets = {
+            "both": (obj_name, listing_name),
+            "obj": (obj_name,),
+            "listing": (listing_name,),
+        }[self.outputs]
+        map_name = filename + ".map"
+        if self.symbol_map:
+            targets = (*targets, map_name)
+        if self.cache is not None:
+            # Исходник, ассемблер и параметры не менялись - берём готовые файлы
+            key = self.cache.file_key(filename, self.options, included_files(filename))
+            if self.cache.restore(key, *targets):
+                return
+            # Иначе перекодируем только изменённые строки
+            self.line_cache = self.cache.load_lines(filename, self.options)
+            self.coded_lines = {}
+
+        self.assemble(filename)
+
+        if obj_name in targets:
+            self.write_obj(filename=obj_name)
+        if listing_name in targets:
+            self.write_listing(filename=listing_name)
+        if map_name in targets:
+            self.write_symbol_map(filename=map_name)
+
+        if self.cache is not None:
+            self.cache.store(key, *targets)
+            self.cache.store_lines(filename, self.options, self.coded_lines)
+
+    def assemble(self, filename: str | Path) -> None:
+        """
+        Компилирует файл filename в памяти, ничего не записывая на диск.
+        Программа кодируется за один проход, ссылки вперёд дописываются по таблице fixups.
+        :param filename: имя файла-исходника
+            '01_sum.pdp'
+        """
+        self.reset()
+        self.filename = filename
+        self.directory = Path(filename).parent
+        self.assemble_lines()
+
+    def assemble_source(
+        self, source: str | Iterable[str], directory: str | Path | None = None
+    ) -> AssemblyResult:
+        """
+        Собирает программу из строки или строк в памяти, не обращаясь к диску
+        (кроме файлов .INCLUDE)
+        :param source: текст программы или её строки
+            '\t.=1000\n\tmov #2, R0\n\thalt\n'
+        :param directory: каталог, от которого считаются пути .INCLUDE (None - текущий)
+        :return: блоки пусты, если self.outputs == "listing", листинг None, если "obj"
+            AssemblyResult(blocks={0o1000: b'\xc0\x15\x02\x00\x00\x00'},
+                           listing=['001000:\t\tmov #2, R0', '\t012700', ...], symbols={})
+        """
+        self.reset()
+        lines = source.splitlines() if isinstance(source, str) else source
+        self.source = tuple(map(str.rstrip, lines))
+        if directory is not None:
+            self.directory = Path(directory)
+        self.assemble_lines()
+
+        return AssemblyResult(
+            blocks={
+                address: bytes(data)
+                for address, data in self.object_lines.items()
+                if data
+            },
+            listing=None if self.outputs == "obj" else list(self.listing_lines()),
+            symbols=dict(self.symbols.values),
+        )
+
+    def assemble_lines(self) -> None:
+        """
+        Собирает строки source_lines() в компактные записи и байты блоков
+        (байты - только если нужен .o)
+        """
+        self.code_parallel()
+        self.code_programm(self.record_lines(self.source_lines()))
+        self.apply_fixups()
+        self.relax_branches()
+        self.parallel_lines = {}
+
+        if self.outputs == "listing":
+            return
+        for line_num in range(len(self.line_starts)):
+            current_counter, block, commands, width = self.line_record(line_num)
+            self.object_comm(commands, block, width)
 
-    def precompile(self, filename: str | Path) -> None:
+    @classmethod
+    def read_lines(cls, filename: str | Path) -> Iterator[str]:
         """
-        Выполняет парсинг программы из filename, сохраняет результат парсинга,
-        параллельно собирает переменные программы
+        Построчно читает непустые строки файла, не держа файл в памяти
         :param filename: имя файла-исходника
             '01_sum.pdp'
+        :return:
+            '\t.= 1000;', '\tmov \t#2, R0;', ...
         """
         with open(filename) as file:
             for file_string_ in file:
                 file_string_ = file_string_.rstrip()
-                if not file_string_:
-                    continue
-
-                # Строку полностью не теряем
-                self.file_lines.append(file_string_)
-
-                str_dict = parse_line(file_string_)
-                # Сохранили результат для использования в code_programm
-                self.parsed_lines.append(str_dict)
-
-                # Обрабатываем команды, чтобы получить верный programm_counter
-                commands = []
-                if str_dict.get("pseudo"):
-                    commands = self.code_pseudo_command(
-                        name=str_dict["pseudo"],
-                        args=str_dict["arg"],
-                        text=str_dict["text"],
-                    )
-
-                elif str_dict.get("name"):
-                    commands, arguments = self.code_command(
-                        name=str_dict["name"], args=str_dict["arg"], precompile=True
-                    )
-                    for arg_dict in arguments:
-                        bin_line, plus_PC = self.recgnz_mode(arg_dict)
-                        if plus_PC:
-                            commands.append(bin_line)
-
-                if str_dict.get("label"):
-                    # Сохраняем адрес метки для дальнейшей компиляции
-                    self.labels[str_dict["label"]] = {
-                        "fileline_num": len(self.file_lines) - 1,
-                        "programm_counter": self.programm_counter,
-                    }
-
-                if str_dict.get("variable"):
-                    # Сохраняем значение переменной для дальнейшей компиляции
-                    self.variables[str_dict["variable"]] = str_dict["arg"][0]
+                if file_string_:
+                    yield file_string_
 
-                for comm in commands:
-                    # Увеличиваем programm_counter (+2 для word, +1 для byte)
-                    self.programm_counter += len(comm) // 8
-
-        # После прекомпиляции зануляем PC для дальнейшей компиляции
-        self.programm_counter = 0
+    def code_parallel(self) -> None:
+        """
+        Заранее кодирует строки большой программы в пуле процессов кусками по chunk_size
+        строк: кодирование строки не зависит от других строк, поэтому code_programm
+        остаётся только разместить готовые строки по адресам (как строки кэша).
+        Строки, которые не кодируются сами по себе (вызовы макросов, тела блоков),
+        кодирует или отвергает последовательный проход, поэтому результат тот же.
+        Программы не больше chunk_size строк кодируются последовательно
+        """
+        workers = self.workers or os.cpu_count() or 1
+        if workers == 1:
+            return
+        lines = (
+            self.source if self.source is not None else self.read_lines(self.filename)
+        )
+        line_cache = self.line_cache
+        texts = [
+            text for text in dict.fromkeys(lines) if text and text not in line_cache
+        ]
+        if len(texts) <= self.chunk_size:
+            return
+
+        chunks = [
+            texts[start : start + self.chunk_size]
+            for start in range(0, len(texts), self.chunk_size)
+        ]
+        coded = dict(line_cache)
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            results = executor.map(
+                code_chunk, chunks, [self.options["lexer"]] * len(chunks)
+            )
+            for chunk, chunk_coded in zip(chunks, results):
+                coded.update(
+                    (text, line)
+                    for text, line in zip(chunk, chunk_coded)
+                    if line is not None
+                )
+        self.parallel_lines = coded
 
-    def compile(self, filename: str | Path) -> None:
+    def source_lines(self) -> Iterator[str | SourceLine]:
         """
-        Компилирует файл filename, записывая filename.o и filename.l - байт-код и листинг файлы.
-        :param filename: имя файла-исходника
-            '01_sum.pdp'
+        Строки файла self.filename (или self.source) после вставки файлов .INCLUDE (см. includes.py)
+        и расширения макросов и блоков .REPT, .IRP (см. macros.MacroExpander):
+        обычные строки - текстом, вставленные и расширенные - разобранными
+        :return:
+            '\t.= 1000;', SourceLine(text='\tmov R1, -(SP)', name='mov', ...), ...
         """
-        self.precompile(filename)
-        self.code_programm()
+        lines = expand_includes(self.numbered_lines(), self.directory, self.parse_line)
+        expander = MacroExpander(self.parse_read_line, self.repeat_count)
+        return expander.expand(lines)
 
-        self.write_obj(filename=filename + ".o")
-        self.write_listing(filename=filename + ".l")
+    def numbered_lines(self) -> Iterator[str]:
+        """
+        Непустые строки файла self.filename (или self.source) без пробелов в конце;
+        номер последней отданной строки в файле - в self.read_line
+        :return:
+            '\t.= 1000;', '\tmov \t#2, R0;', ...
+        """
+        if self.source is None:
+            context = open(self.filename)
+        else:
+            context = nullcontext(self.source)
+        with context as lines:
+            for self.read_line, text in enumerate(lines, 1):
+                text = text.rstrip()
+                if text:
+                    yield text
+
+    def parse_read_line(self, text: str) -> SourceLine:
+        """
+        Разбирает только что прочитанную строку файла программы вместе с её номером
+        (для строк, которые расширение макросов откладывает, см. macros.MacroExpander)
+        :param text: строка программы
+            '\t.REPT 3'
+        :return:
+            SourceLine(text='\t.REPT 3', pseudo='.REPT', args=('3',), file_line=4)
+        """
+        return self.parse_line(text)._replace(file_line=self.read_line)
 
-    @classmethod
-    def bin(cls, number: int, width: int = 6) -> str:
-        """
-        Из строки (слова) в десятичном виде возвращет
-        строчное числа в двоичной системе
-        Также отдельно обрабатывает отрицательные числа
-        :param number: число в десятичной системе
-            -3
-        :param width: длина результата
+    def record_lines(
+        self, items: Iterable[str | SourceLine]
+    ) -> Iterator[str | SourceLine]:
+        """
+        Отдаёт строки программы дальше, записывая их в self.line_items
+        (или только разобранные - в self.parsed_items, см. reset),
+        а их места в исходниках - в self.line_files и self.line_numbers
+        :param items: строки программы (см. source_lines)
+        """
+        # Имена файлов - от каталога программы
+        files = {None: 0}
+        self.source_files = ["" if self.filename is None else Path(self.filename).name]
+        keep_items, parsed_items = self.keep_items, self.parsed_items
+        for item in items:
+            if type(item) is str or not item.file_line:
+                # Строка самого файла программы, только что прочитанная
+                file, file_line = None, self.read_line
+            else:
+                file, file_line = item.file, item.file_line
+            file_num = files.get(file)
+            if file_num is None:
+                file_num = files[file] = len(self.source_files)
+                self.source_files.append(os.path.relpath(file, self.directory))
+            if keep_items:
+                self.line_items.append(item)
+            elif type(item) is not str:
+                parsed_items[len(self.line_numbers)] = item
+            self.line_files.append(file_num)
+            self.line_numbers.append(file_line)
+            yield item
+
+    def program_items(self) -> Iterator[str | SourceLine]:
+        """
+        Строки программы в порядке кодирования, записанные record_lines.
+        Если все строки не держались, строки самого файла программы читаются
+        из него заново по их номерам в self.line_numbers
+        :return:
+            '\t.= 1000;', SourceLine(text='\tmov R1, -(SP)', name='mov', ...), ...
+        """
+        if self.keep_items:
+            yield from self.line_items
+            return
+
+        parsed_items = self.parsed_items
+        if self.source is None:
+            context = open(self.filename)
+        else:
+            context = nullcontext(self.source)
+        with context as lines:
+            lines = enumerate(lines, 1)
+            for line_num, file_line in enumerate(self.line_numbers):
+                item = parsed_items.get(line_num)
+                if item is None:
+                    for read_line, text in lines:
+                        if read_line == file_line:
+                            break
+                    item = text.rstrip()
+                yield item
+
+    def repeat_count(self, text: str) -> int:
+        """
+        Вычисляет число повторений .REPT по уже определённым именам
+        :param text: выражение
+            'N*2'
+        :return:
             8
-        :return: 11111101
         """
+        count = self.symbols.evaluate(parse_expression(text), self.programm_counter)
+        if count is None:
+            raise ValueError(f"Число повторений .REPT {text!r} не определено")
+        return count
 
-        result = f"{abs(number):0{width}b}"
-
-        if number < 0:
-            number_unsigned = (1 << width) + number
-            result = f"{number_unsigned:{width}b}"
-
-        return result
+    def line_record(self, line_num: int) -> tuple[int, int, array, int]:
+        """
+        Возвращает запись строки программы с номером line_num
+        :param line_num: номер непустой строки файла
+            1
+        :return: PC строки, адрес блока, слова строки, ширина слов
+            (0o1000, 0o1000, array('H', [0o012700, 0o000002]), 16)
+        """
+        start = self.line_starts[line_num]
+        if line_num + 1 < len(self.line_starts):
+            end = self.line_starts[line_num + 1]
+        else:
+            end = len(self.words)
+        return (
+            self.line_counters[line_num],
+            self.line_blocks[line_num],
+            self.words[start:end],
+            self.line_widths[line_num],
+        )
 
     @classmethod
     def oct(cls, number: int, width: int = 6) -> str:
@@ -160,366 +503,718 @@ class PDP11_Parser:
         return f"{number:0{width}o}"
 
     @classmethod
-    def bin2hex(cls, str_binword: str) -> list[str]:
+    def reference(cls, kind: str, word_num: int, expression: Expression) -> Reference:
         """
-        Из строки (слова) в бинарном виде возвращет список hex байт (младший, старший)
-        :str_binword: бинарном число
-            0000111000111000
+        Ссылка слова word_num на значение выражения
+        :param kind: тип ссылки, как в patch_word
+            'xx'
+        :param word_num: номер слова в строке
+            0
+        :param expression: разобранное выражение
+            'LOOP'
         :return:
-            ['0e\n', '38\n']
-        """
-        if not str_binword:
-            return []
-        # Для word возвращаем два байта
-        if len(str_binword) == 16:
-            return [
-                f"{int(str_binword[8:], 2):02x}\n",
-                f"{int(str_binword[:8], 2):02x}\n",
-            ]
-        # Для byte возвращаем один байт
-        elif len(str_binword) == 8:
-            return [f"{int(str_binword[:8], 2):02x}\n"]
+            Reference(kind='xx', word_num=0, symbol='LOOP')
+        """
+        if type(expression) is int:
+            return Reference(kind, word_num, None, expression)
+        return Reference(kind, word_num, expression)
 
     @classmethod
-    def bin2oct(cls, text: str) -> str:
-        """
-        Принимает строку с двоичным 16-бит числом
-        Возвращает число, где первый символ совпадает с первоым символом text,
-        а все последующие являются восьмеричным представлением соответствующий трёх двоичных битов.
-        :param  text: строка длиной width
-            '0001010111000000'
-        :param width: длина строки
-            16
+    def code_xx(cls, target: int, counter: int) -> int:
+        """
+        Кодирует смещение ветвления с адреса counter на адрес target
+        :param target: адрес метки
+            0o1000
+        :param counter: адрес команды ветвления
+            0o1004
         :return:
-            '012700'
-        """
-
-        if text == "":
-            return ""
-
-        # Для word
-        if len(text) == 16:
-            res = text[0]
-            for i in range(1, len(text), 3):
-                res += f"{int(text[i : i + 3], 2):o}"
-            return f"{int(res):06}"
-
-        # Для byte
-        elif len(text) == 8:
-            res = f"{int(text[:2], 2):o}"
-            for i in range(2, len(text), 3):
-                res += f"{int(text[i : i + 3], 2):o}"
-            return f"{int(res):03}"
-
-    def resolve_args(self, parsed_args: list[dict], precompile: bool = False) -> None:
-        """Подставляет вмесло переменной её значение
-        :param parsed_args: список словарей, соответсвующих разобранным аргументам
-        :param precompile: флаг режима прекомпиляции
-        """
-
-        # Подставляем реальные значения только при компиляции
-        for arg in parsed_args:
-            # Проверяем константы на десятичную точку
-            if arg.get("const"):
-                if arg["const"][-1] == ".":
-                    arg["const"] = oct(int(arg["const"]))[2:]
-
-            # Обрабатываем символы ASCII
-            if arg.get("symbol"):
-                arg["const"] = oct(ord(arg["symbol"]))[2:]
-                arg.pop("symbol")
-
-            # Если в аргументе нет переменной, то он уже готов
-            if arg.get("variable") is None:
-                continue
-
-            # В прекомпиляции на этом resolve закончен
-            if precompile:
-                continue
-
-            # Если есть такая метка - заменяем на её адрес
-            elif self.labels.get(arg["variable"]):
-                value = self.labels[arg["variable"]]["programm_counter"]
-                arg["const"] = str(oct(value)[2:])
-                if arg["mode"][0] != "6":
-                    arg.pop("variable")
-
-            # Если есть такая перeменная - заменяем на её значение
-            elif self.variables.get(arg["variable"]):
-                value = self.variables[arg["variable"]]
-                arg["const"] = f"{int(value):06}"
-                arg.pop("variable")
+            0o375
+        """
+        N_shift = target - (counter + 2)
+        return (N_shift // 2) & BYTE_MASK
+
+    @classmethod
+    def code_nn(cls, target: int, counter: int) -> int:
+        """
+        Кодирует смещение sob с адреса counter назад на адрес target
+        :param target: адрес метки
+            0o1012
+        :param counter: адрес команды sob
+            0o1016
+        :return:
+            0o3
+        """
+        N_shift = counter + 2 - target
+        return (N_shift // 2) & 0o77
 
     def code_command(
         self,
         name: str,
-        args: list[str] | None = None,
-        precompile: bool = False,
+        args: Sequence[str] = (),
         **kwargs,
-    ) -> tuple[list[str], list[dict]]:
+    ) -> tuple[list[int], list[Reference]]:
         """
         Берет команду name с аргументами args.
-        Возвращает список слов в виде строк, в которые они кодируются.
+        Возвращает список слов, в которые они кодируются, и ссылки на метки,
+        переменные и адреса: на их месте в словах стоят заполнители до place_line.
+        Кодирует кодировщиком формата команды, выбранным заранее (см. ENCODERS)
         :param name: имя команды
             'mov'
         :param args:
             ['#2', 'R0']
-        :param precompile: флаг режима прекомпиляции
-            False
         :param kwargs: прочий мусор, который нам не нужен
         :return:
-            ['012700', '000002']
-        """
-        # Получили информацию о нужной команде
-        command = COMMANDS[name]
-
-        # Первично разобрали аргументы
-        args = args or []
-        parsed_args: list[dict] = recognize_args(args) if args else {}
-        # Вторично разобрали перемненные в аргументах
-        self.resolve_args(parsed_args, precompile)
-        code_n = command.opcode
-
-        # Инициировали кодировки аргументов
-        code_r = code_nn = code_ss = code_dd = code_xx = ""
-
-        # Кодируем каждый тип
-        if command.has_r:
-            # R всегда первый
-            reg = parsed_args[0]
-            code_r = code_arg(reg)[3:]
-
-        if command.has_nn:
-            # В режиме прекомпиляции вставляем заполнитель
-            if precompile:
-                code_nn = "0" * 6
-            else:
-                # NN всегда последний
-                N_shift = (
-                    self.programm_counter
-                    + 2
-                    - self.labels[args[-1]]["programm_counter"]
-                )
-                code_nn = self.bin(N_shift // 2)
-
-        if command.has_dd:
-            # DD всегда последний
-            arg_dd = parsed_args[-1]
-            code_dd = code_arg(arg_dd)
-
-        if command.has_ss:
-            # SS первый если нет R, второй если есть
-            arg_ss = parsed_args[command.has_r]
-            code_ss = code_arg(arg_ss)
-
-        if command.has_xx:
-            # В режиме прекомпиляции вставляем заполнитель
-            if precompile:
-                code_xx = "0" * 8
-            else:
-                # XX всегда одинок
-                N_shift = self.labels[args[-1]]["programm_counter"] - (
-                    self.programm_counter + 2
-                )
-                code_xx = self.bin(N_shift // 2, width=8)
-
-        # Некоторым командам необходимо дополнительно записать Сдвиг по метке,
-        # Но этот сдвиг обусловнен не модой, а спецификой команды
-        # В случаях других команд, аргумент метки выгдядит точно так же (та же мода, то же написание)
-        # Но при этом ничего не печатаем
-        # Поэтому печать сдвига обрабатываем отдельно
-        if command.print_shift:
-            mode = "2"
-
-            # В режиме прекомпиляции вставляем заполнитель
-            if precompile:
-                parsed_args.append({"const": "0", "mode": mode})
-            else:
-                shift = self.labels[args[-1]]["programm_counter"] - (
-                    self.programm_counter + 4
-                )
-
-                parsed_args.append({"const": self.oct(shift), "mode": mode})
-
-        # Возможные варианты DD, SSDD, RSS, RDD, R, RNN, XX, NN или ничего
-        code_com = code_n + code_r + code_ss + code_dd + code_nn + code_xx
+            ([0o012700, 0o000002], [])
+        """
+        if name not in ENCODERS:
+            raise ValueError(f"Неизвестная команда {name!r}")
+        encoder, opcode, counts = ENCODERS[name]
+        if len(args) not in counts:
+            expected = " или ".join(map(str, counts))
+            raise ValueError(
+                f"У команды {name} аргументов должно быть {expected}, а не {len(args)}"
+            )
+        return encoder(self, opcode, args)
 
-        return [
-            code_com,
-        ], parsed_args
+    @classmethod
+    def register(cls, operand: Operand, arg: str) -> int:
+        """
+        Номер регистра из аргумента, который должен быть регистром (jsr R, rts R, sob R)
+        :param operand: разобранный аргумент
+            Operand(mode=0, reg=5)
+        :param arg: запись аргумента
+            'R5'
+        :return:
+            5
+        """
+        if operand.mode != 0:
+            raise ValueError(f"Аргумент {arg!r} должен быть регистром")
+        return operand.reg
 
-    def code_pseudo_command(self, name: str, args: dict, text: str) -> list[str]:
+    @classmethod
+    def code_operands(
+        cls, word: int, operands: Iterable[Operand]
+    ) -> tuple[list[int], list[Reference]]:
+        """
+        Добавляет к слову команды дополнительные слова операндов (в порядке операндов)
+        :param word: слово команды
+            0o012700
+        :param operands: операнды команды
+            [Operand(mode=2, reg=7, value=2), Operand(mode=0, reg=0)]
+        :return:
+            ([0o012700, 0o000002], [])
+        """
+        words = [word]
+        refs = []
+        for operand in operands:
+            if operand.symbol is not None or (
+                operand.relative and operand.value is not None
+            ):
+                # Адрес или смещение относительно PC - заполнитель до place_line
+                kind = "rel" if operand.relative else "abs"
+                refs.append(Reference(kind, len(words), operand.symbol, operand.value))
+                words.append(0)
+            elif operand.value is not None:
+                words.append(operand.value & WORD_MASK)
+        return words, refs
+
+    # Кодировщики форматов команд (см. commands.FORMAT_FIELDS)
+
+    def encode_none(self, opcode: int, args: Sequence[str]):
+        """halt, nop, ..."""
+        return [opcode], []
+
+    def encode_ssdd(self, opcode: int, args: Sequence[str]):
+        """mov SS, DD"""
+        source, destination = self.recognize_args(args)
+        word = opcode | (source.code << 6) | destination.code
+        return self.code_operands(word, (source, destination))
+
+    def encode_dd(self, opcode: int, args: Sequence[str]):
+        """clr DD"""
+        (destination,) = self.recognize_args(args)
+        return self.code_operands(opcode | destination.code, (destination,))
+
+    def encode_rdd(self, opcode: int, args: Sequence[str]):
+        """jsr R, DD"""
+        register, destination = self.recognize_args(args)
+        word = opcode | (self.register(register, args[0]) << 6) | destination.code
+        return self.code_operands(word, (destination,))
+
+    def encode_r(self, opcode: int, args: Sequence[str]):
+        """rts R"""
+        (register,) = self.recognize_args(args)
+        return [opcode | self.register(register, args[0])], []
+
+    def encode_rnn(self, opcode: int, args: Sequence[str]):
+        """sob R, метка"""
+        (register,) = self.recognize_args(args[:1])
+        reference = self.reference("nn", 0, parse_expression(args[1]))
+        return [opcode | (self.register(register, args[0]) << 6)], [reference]
+
+    def encode_xx(self, opcode: int, args: Sequence[str]):
+        """br метка"""
+        return [opcode], [self.reference("xx", 0, parse_expression(args[0]))]
+
+    def encode_number(self, opcode: int, args: Sequence[str], kind: str):
+        """mark N, spl N, emt N, trap N (без аргумента - 0); kind - n3, n6 или n8"""
+        value = parse_expression(args[0]) if args else 0
+        if type(value) is int:
+            return [opcode | (value & FORMAT_FIELDS[kind.upper()])], []
+        return [opcode], [self.reference(kind, 0, value)]
+
+    def code_pseudo_command(
+        self, name: str, args: Sequence[str], text: str
+    ) -> tuple[list[int], int, list[Reference]]:
         """
-        Разбираем псевдокоманду и выполняем её.
-        Возвращаем необходимые дополнительные байты и слова.
+        Разбираем псевдокоманду.
+        Возвращаем необходимые дополнительные байты или слова, их ширину
+        и ссылки на имена в аргументах .WORD и .BYTE.
         :param name: имя псевдо псевдокоманды
-            '.='
+            '.WORD'
         :param args: аргументы псевдокоманды
             ['1000']
         :param text: текст строки с командой
-            '.= 1000'
+            '.WORD 1000'
         :return:
-            []
+            ([0o1000], 16, [])
         """
 
         match name:
-            case ".=":
-                address = int(args[0], 8)
-                self.programm_counter = address
-                self.curr_block = address
-                self.object_lines[address] = list()
-                return []
-
             case ".WORD" | ".BYTE":
-                number_lines = []
+                width_, kind = (16, "abs") if name == ".WORD" else (8, "byte")
+                mask = WORD_MASK if name == ".WORD" else BYTE_MASK
+                number_lines, refs = [], []
                 for arg in args:
-                    arg_ = arg
-                    if arg[-1] == ".":
-                        arg_ = oct(int(arg))[2:]
-                    elif arg[0] == "'":
-                        arg_ = oct(ord(arg))[2:]
-                    number = int(arg_, 8)
-                    width_ = 16 if name==".WORD" else 8
-                    bin_line = self.bin(number, width=width_)
-                    number_lines.append(bin_line)
-                return number_lines
+                    value = parse_expression(arg)
+                    if type(value) is int:
+                        number_lines.append(value & mask)
+                    else:
+                        refs.append(self.reference(kind, len(number_lines), value))
+                        number_lines.append(0)
+                return number_lines, width_, refs
 
             case ".ASCII" | ".ASCIZ":
-                number_lines = []
                 # Выделяем из text аргумент
                 string_arg = get_ascii_text(name=name, text=text)
                 # Кодируем посимвольно
-                for symbol in string_arg:
-                    bin_line = self.bin(ord(symbol), width=8)
-                    number_lines.append(bin_line)
+                number_lines = [ord(symbol) & BYTE_MASK for symbol in string_arg]
                 # Специфика .ASCIZ - в конце добавляем нуль
-                if name == ".ASCIZ" :
-                    number_lines.append("0" * 8)
-                return number_lines
-
-    def recgnz_mode(self, arg: dict, current_counter: int = 0) -> tuple[str, bool]:
-        """
-        Принимает словарь с ключами 'mode' и 'reg'|'const'|'symbol'|'variable'
-        Возвращает если необходимо восьмеричные данные,
-        необходимые для реализации специфичной моды
-        Для моды 2 регистра R7 вернет восьмеричное представление константы
-        :param  arg: словарь характеристик аргумента
-            {'mode': ['2'], 'const': '2'}
-        :param current_counter: PC на котором будет распологаться слово
-            001012
+                if name == ".ASCIZ":
+                    number_lines.append(0)
+                return number_lines, 8, []
+
+        raise ValueError(f"Неизвестная директива {name}")
+
+    def compile_line(self, text: str) -> CodedLine:
+        """
+        Разбирает и кодирует строку программы независимо от её адреса и значений имён
+        :param text: строка программы
+            'LOOP: sob R1, LOOP'
         :return:
-            '000002'
-        """
-        # Заполитель для режима прекомпиляции
-        if arg.get("variable") and arg["mode"][0] != "6":
-            return "0" * 16, True
-
-        if arg.get("reg") or arg.get("variable"):
-            # Обрабатываем сдвиг
-            if arg.get("shift"):
-                shift = int(arg["shift"], 8)
-                width = 16
-                result = abs(shift)
-                if shift < 0:
-                    result = (1 << width) + shift
-                return f"{result:0{width}b}", True
-            return "", False
-
-        mode = arg["mode"][0]
-
-        if arg.get("const"):
-            number = int(arg["const"], 8)
-            width = 16
-            result = abs(number)
-            if number < 0:
-                result = (1 << width) + number
-
-            # Обрабатываем сдвиг для шестой моды
-            if mode == "6":
-                result = result - (current_counter)
-                if result < 0:
-                    result = (1 << width) + result
-            return f"{result:0{width}b}", True
-
-        return "", False
-
-    def code_programm(self) -> None:
-        """
-        Формурует строки для .o и .l файлов
-        """
-        for str_dict in self.parsed_lines:
-            # Нужно зафиксировать programm_counter до его возможного изменения в code_pseudo_command
-            current_counter = self.programm_counter
-            if str_dict.get("pseudo"):
-                commands = self.code_pseudo_command(
-                    name=str_dict["pseudo"], args=str_dict["arg"], text=str_dict["text"]
-                )
-            elif str_dict.get("name"):
-                commands, arguments = self.code_command(
-                    name=str_dict["name"], args=str_dict["arg"]
-                )
+            CodedLine(label='LOOP', words=(0o077100,), refs=(Reference('nn', 0, 'LOOP'),))
+        """
+        return self.code_line(self.parse_line(text))
 
-                # Сохраняем programm_counter команды для разбора аргументов и их мод
-                argument_counter = current_counter + 2
-                for arg_dict in arguments:
-                    bin_line, plus_PC = self.recgnz_mode(arg_dict, argument_counter + 2)
-                    if plus_PC:
-                        argument_counter += 2
-                        commands.append(bin_line)
-            else:
-                commands = []
+    def code_line(self, line: SourceLine) -> CodedLine:
+        """
+        Кодирует разобранную строку программы (см. compile_line)
+        :param line: разобранная строка
+            SourceLine(text='LOOP: sob R1, LOOP', label='LOOP', name='sob', args=('R1', 'LOOP'))
+        :return:
+            CodedLine(label='LOOP', words=(0o077100,), refs=(Reference('nn', 0, 'LOOP'),))
+        """
 
-            self.listing_comm(str_dict, commands, current_counter)
-            self.object_comm(commands)
+        variable = value = origin = None
+        if line.variable:
+            variable, value = line.variable, parse_expression(line.args[0])
+
+        width = 16
+        refs = ()
+        if line.pseudo == ".=":
+            origin = parse_expression(line.args[0])
+            commands = []
+        elif line.pseudo:
+            commands, width, refs = self.code_pseudo_command(
+                name=line.pseudo, args=line.args, text=line.text
+            )
+        elif line.name:
+            commands, refs = self.code_command(name=line.name, args=line.args)
+        else:
+            commands = []
+
+        return CodedLine(
+            line.label, variable, value, origin, width, tuple(commands), tuple(refs)
+        )
 
-    def listing_comm(
-        self, str_dict: dict, commands: list[str], current_counter: int
+    @classmethod
+    def patch_word(cls, kind: str, word: int, target: int, counter: int) -> int:
+        """
+        Подставляет адрес target в слово по типу ссылки:
+        "xx" - смещение ветвления, "nn" - смещение sob,
+        "abs" - слово с адресом, "rel" - слово со смещением относительно PC,
+        "byte" - байт .BYTE, "n3", "n6", "n8" - число в поле spl, mark, emt/trap
+        :param kind: тип ссылки
+            'xx'
+        :param word: слово с заполнителем
+            0o000400
+        :param target: адрес метки, значение переменной или выражения
+            0o1000
+        :param counter: PC, относительно которого считается смещение
+            0o1004
+        :return:
+            0o000775
+        """
+        match kind:
+            case "xx":
+                return (word & ~BYTE_MASK) | cls.code_xx(target, counter)
+            case "nn":
+                return (word & ~0o77) | cls.code_nn(target, counter)
+            case "abs":
+                return target & WORD_MASK
+            case "byte":
+                return target & BYTE_MASK
+            case "n3" | "n6" | "n8":
+                mask = FORMAT_FIELDS[kind.upper()]
+                return (word & ~mask) | (target & mask)
+            case "rel":
+                return (target - counter) & WORD_MASK
+        return word
+
+    def add_fixup(
+        self, kind: str, symbol: Expression, word_num: int, counter: int = 0
     ) -> None:
         """
-        Из словаря, который описывает строку делает 1+ строк листинга
-        :param str_dict:
-            {'name': '=', 'arg': '1000', 'text': '	. = 1000;', 'pseudo': True}
-            {'name': 'mov', 'args': ['R0', 'R1'], 'text': '	mov 	#2, R0; R0 = 2'}
-        :param commands:
-            ['']
-            ['012700', '000002']
-        Добавляет для этих словарей в self.listing строки
-        000000:		. =		1000
-        001000:		mov		#2, R0
-            012700
-            000002
-        """
-        if str_dict["text"] != "":
-            # В каком адресе лежит какая команда
-            self.lines.append(self.oct(current_counter) + ":\t\t" + str_dict["text"])
-
-        # Печатаем байты "лесенкой"
-        tabulation_for_byte = 0
-        for cmd in commands:
-            tabulation_for_byte = 0 if tabulation_for_byte else 1
-            if len(cmd) == 8 and tabulation_for_byte:
-                self.lines.append(f"\t\t{self.bin2oct(cmd)}")
+        Запоминает ссылку вперёд из текущей (ещё не записанной) строки программы
+        :param kind: тип ссылки
+            'xx'
+        :param symbol: имя метки или переменной либо выражение
+            'END'
+        :param word_num: номер слова в строке
+            0
+        :param counter: PC, относительно которого считается смещение
+            1004
+        """
+        self.fixups.append(
+            Fixup(
+                kind=kind,
+                symbol=symbol,
+                line_num=len(self.line_starts),
+                word_num=word_num,
+                counter=counter,
+            )
+        )
+
+    def apply_fixups(self) -> None:
+        """
+        Дописывает все ссылки вперёд, когда адреса всех меток уже известны
+        """
+        symbols = self.symbols
+        symbols.resolve_deferred()
+        for fixup in self.fixups:
+            # "." в выражении - адрес строки со ссылкой
+            location = self.line_counters[fixup.line_num]
+            target = symbols.evaluate(fixup.symbol, location)
+            if target is None:
+                names = [
+                    name
+                    for name in expression_names(fixup.symbol)
+                    if name not in symbols
+                ]
+                file, file_line = self.line_source(fixup.line_num)
+                raise ValueError(
+                    f"{file or '<source>'}:{file_line}: "
+                    f"Неизвестное имя {', '.join(names)!r}"
+                )
+
+            word_index = self.line_starts[fixup.line_num] + fixup.word_num
+            self.words[word_index] = self.patch_word(
+                fixup.kind, self.words[word_index], target, fixup.counter
+            )
+
+    @classmethod
+    def branch_fits(cls, kind: str, target: int, counter: int) -> bool:
+        """
+        Проверяет, что смещение ветвления со слова по адресу counter достаёт до target:
+        "xx" - от -128 до 127 слов от адреса после слова, "nn" (sob) - до 63 слов назад
+        :param kind: тип ссылки
+            'xx'
+        :param target: адрес цели
+            0o2000
+        :param counter: адрес слова ветвления
+            0o1000
+        :return:
+            False
+        """
+        if kind == "xx":
+            return -256 <= target - counter - 2 <= 254
+        return 0 <= counter + 2 - target <= 126
+
+    @classmethod
+    def far_words(cls, kind: str, opcode: int, level: int) -> int:
+        """
+        Число слов длинной формы ветвления (см. far_line)
+        :param kind: тип ссылки короткой формы
+            'xx'
+        :param opcode: слово короткой формы
+            0o001000
+        :param level: ступень удлинения
+            1
+        :return:
+            3
+        """
+        if kind == "nn":
+            return 2 if level == 1 else 4
+        return 2 if opcode & ~BYTE_MASK == BR else 3
+
+    @classmethod
+    def far_line(cls, coded: CodedLine, level: int) -> CodedLine:
+        """
+        Длинная форма ветвления, до цели которого не достаёт смещение:
+        br X -> jmp X; bne X -> beq .+6, jmp X (для всех условий - противоположное);
+        sob R, X -> dec R, bne X (ступень 1) или dec R, beq .+6, jmp X (ступень 2)
+        :param coded: закодированная строка ветвления
+            CodedLine(words=(0o001000,), refs=(Reference('xx', 0, 'FAR'),))
+        :param level: ступень удлинения
+            1
+        :return:
+            CodedLine(words=(0o001402, 0o000167, 0), refs=(Reference('rel', 2, 'FAR'),))
+        """
+        # Строки из кэша на диске - простые кортежи (см. AssemblyCache.load_lines)
+        coded = CodedLine(*coded)
+        ((kind, word_num, symbol, target),) = coded.refs
+        opcode = coded.words[0]
+        jump = Reference("rel", cls.far_words(kind, opcode, level) - 1, symbol, target)
+        if kind == "nn":
+            decrement = DEC | ((opcode >> 6) & 7)
+            if level == 1:
+                words = (decrement, BNE)
+                refs = (Reference("xx", 1, symbol, target),)
             else:
-                self.lines.append(f"\t{self.bin2oct(cmd)}")
-            self.programm_counter += len(cmd) // 8
+                words, refs = (decrement, BEQ | 2, JMP_RELATIVE, 0), (jump,)
+        elif opcode & ~BYTE_MASK == BR:
+            words, refs = (JMP_RELATIVE, 0), (jump,)
+        else:
+            words, refs = ((opcode ^ BRANCH_CONDITION) | 2, JMP_RELATIVE, 0), (jump,)
+        return coded._replace(words=words, refs=refs)
+
+    def far_branches(
+        self, counters: Sequence[int], symbols: SymbolTable, far: dict[int, int]
+    ) -> dict[int, int]:
+        """
+        Ищет ветвления, до цели которых не достаёт их текущая форма
+        :param counters: PC строк
+        :param symbols: значения имён при этих PC
+        :param far: уже удлинённые ветвления: номер строки -> ступень
+        :return: ветвления, которые нужно удлинить: номер строки -> следующая ступень
+            {12: 1}
+        """
+        found = {}
+        for line_num, (kind, word_num, symbol, target) in zip(
+            self.branch_lines, self.branch_refs
+        ):
+            level = far.get(line_num, 0)
+            counter = counters[line_num] + 2 * word_num
+            if level:
+                if kind == "xx" or level == 2:
+                    # jmp достаёт до любого адреса
+                    continue
+                # sob, удлинённый до dec и bne
+                kind, counter = "xx", counter + 2
+            if symbol is not None:
+                target = symbols.evaluate(symbol, counters[line_num])
+            if not self.branch_fits(kind, target, counter):
+                found[line_num] = level + 1
+        return found
+
+    def size_lines(self, sizes: list[int]) -> tuple[list[int], SymbolTable]:
+        """
+        Пересчитывает PC строк и значения имён по размерам строк,
+        не размещая строки заново: PC внутри участка между ".=" - накопленная сумма
+        :param sizes: размеры строк в байтах
+            [0, 4, 2, ...]
+        :return: PC строк и имена с этими PC
+            ([0, 0o1000, 0o1004, ...], SymbolTable(...))
+        """
+        symbols = SymbolTable()
+        counters = [0] * len(sizes)
+        running = 0
+        start = 0
+        for line_num, coded in zip(self.symbol_lines, self.symbol_coded):
+            label, variable, value, origin = coded[:4]
+            segment = list(accumulate(sizes[start:line_num], initial=running))
+            counters[start : line_num + 1] = segment
+            current_counter = segment[-1]
+            if label:
+                symbols.values[label] = current_counter
+            if variable:
+                symbols.define(variable, value, current_counter)
+            running = current_counter
+            if origin is not None:
+                running = symbols.evaluate(origin, current_counter)
+                if running is None:
+                    raise ValueError("Адрес .= зависит от ещё не определённых имён")
+            running += sizes[line_num]
+            start = line_num + 1
+        segment = list(accumulate(sizes[start:], initial=running))
+        counters[start:] = segment[:-1]
+        symbols.resolve_deferred()
+        return counters, symbols
+
+    def relax_branches(self) -> None:
+        """
+        Удлиняет ветвления, до цели которых не достаёт смещение (см. far_line)
+        Удлинённая строка сдвигает адреса ниже, и до цели могут перестать доставать
+        другие ветвления: размеры перебираются по таблице адресов строк (size_lines),
+        пока удлинять больше нечего (ступени только растут, поэтому проходов мало),
+        затем программа один раз размещается заново с длинными формами
+        """
+        far = self.far_branches(self.line_counters, self.symbols, {})
+        if not far:
+            return
+
+        ends = self.line_starts[1:]
+        ends.append(len(self.words))
+        sizes = [
+            (end - start) * (width // 8)
+            for start, end, width in zip(self.line_starts, ends, self.line_widths)
+        ]
+        kinds = {
+            line_num: ref[0]
+            for line_num, ref in zip(self.branch_lines, self.branch_refs)
+        }
+        while True:
+            grown = sizes.copy()
+            for line_num, level in far.items():
+                opcode = self.words[self.line_starts[line_num]]
+                grown[line_num] = 2 * self.far_words(kinds[line_num], opcode, level)
+            counters, symbols = self.size_lines(grown)
+            found = self.far_branches(counters, symbols, far)
+            if not found:
+                break
+            far.update(found)
+
+        self.reset_layout()
+        self.far_lines = far
+        self.code_programm(self.program_items())
+        self.apply_fixups()
+        if self.far_branches(self.line_counters, self.symbols, {}):
+            raise ValueError("Не удалось удлинить ветвления до их целей")
+
+    def place_line(self, coded: CodedLine) -> None:
+        """
+        Размещает закодированную строку по текущему PC:
+        определяет её метку и переменную, подставляет известные имена,
+        а для ещё неизвестных запоминает ссылки вперёд
+        :param coded: закодированная строка
+            CodedLine(label='LOOP', words=(0o077100,), refs=(Reference('nn', 0, 'LOOP'),))
+        """
+        if self.far_lines and self.fileline_num in self.far_lines:
+            coded = self.far_line(coded, self.far_lines[self.fileline_num])
+        label, variable, value, origin, width, commands, refs = coded
+        symbols = self.symbols
+        # Нужно зафиксировать programm_counter до его возможного изменения в ".="
+        current_counter = self.programm_counter
+        if label or variable or origin is not None:
+            self.symbol_lines.append(self.fileline_num)
+            self.symbol_coded.append(coded)
+        if label:
+            # Сохраняем адрес метки, ссылки назад на неё кодируются сразу
+            symbols.values[label] = current_counter
+
+        if variable:
+            # Значение переменной вычисляется сразу (или после прохода, если оно
+            # зависит от меток ниже по тексту)
+            symbols.define(variable, value, current_counter)
+
+        if origin is not None:
+            origin = symbols.evaluate(origin, current_counter)
+            if origin is None:
+                raise ValueError("Адрес .= зависит от ещё не определённых имён")
+            self.programm_counter = origin
+            self.curr_block = origin
+            self.object_lines[origin] = bytearray()
+
+        if refs:
+            commands = list(commands)
+            for ref in refs:
+                kind, word_num, symbol, target = ref
+                # Смещение xx и nn считается от адреса своего слова, rel - от адреса после него
+                counter = current_counter + 2 * word_num
+                if kind == "rel":
+                    counter += 2
+                elif kind == "xx" or kind == "nn":
+                    self.branch_lines.append(self.fileline_num)
+                    self.branch_refs.append(ref)
+                if symbol is not None:
+                    target = symbols.evaluate(symbol, current_counter)
+                if target is None:
+                    # Заполнитель до apply_fixups
+                    self.add_fixup(kind, symbol, word_num, counter)
+                else:
+                    commands[word_num] = self.patch_word(
+                        kind, commands[word_num], target, counter
+                    )
 
-    def object_comm(self, commands: list[str]) -> None:
+        self.line_counters.append(current_counter)
+        self.line_blocks.append(self.curr_block)
+        self.line_starts.append(len(self.words))
+        self.line_widths.append(width)
+        self.words.extend(commands)
+
+        # Увеличиваем programm_counter (+2 для word, +1 для byte)
+        self.programm_counter += len(commands) * (width // 8)
+
+    def code_programm(self, source_lines: Iterable[str | SourceLine]) -> None:
+        """
+        За один проход разбирает программу и кодирует её по строкам в компактные записи,
+        параллельно собирая метки и переменные программы
+        Строки, уже закодированные ранее (self.line_cache) или в пуле (self.parallel_lines),
+        повторно не разбираются
+        :param source_lines: непустые строки программы (строки из расширений макросов
+            уже разобраны и кодируются без разбора)
+            '\t.= 1000;', '\tmov \t#2, R0;', ...
+        """
+        line_cache = self.parallel_lines or self.line_cache
+        coded_lines = self.coded_lines
+        for file_string_ in source_lines:
+            self.fileline_num += 1
+
+            try:
+                if type(file_string_) is not str:
+                    # Строки расширений в кэш строк не попадают: их текст может совпасть
+                    # с обычной строкой, а кодируется строка определения иначе
+                    self.place_line(self.code_expanded(file_string_))
+                    continue
+
+                coded = line_cache.get(file_string_)
+                if coded is None:
+                    coded = self.compile_line(file_string_)
+                if coded_lines is not None:
+                    coded_lines[file_string_] = coded
+
+                self.place_line(coded)
+            except ValueError as error:
+                raise self.line_error(file_string_, error) from error
+
+    def line_error(self, item: str | SourceLine, error: ValueError) -> ValueError:
+        """
+        Ошибка кодирования строки программы с её местом в исходниках и текстом
+        :param item: строка программы
+            '\tfoo R0'
+        :param error: ошибка кодирования
+            ValueError("Неизвестная команда 'foo'")
+        :return:
+            ValueError("01_sum.pdp:5: Неизвестная команда 'foo' ('foo R0')")
+        """
+        text = item if type(item) is str else item.text
+        file, file_line = self.line_source(self.fileline_num)
+        return ValueError(f"{file or '<source>'}:{file_line}: {error} ({text.strip()!r})")
+
+    # Запись листинга общая с дизассемблером (см. funcs.listing_comm),
+    # метод - чтобы её замерял profiling.PhaseStats
+    listing_comm = staticmethod(listing_comm)
+
+    def object_comm(self, commands: Iterable[int], block: int, width: int) -> None:
         """
         Из списка слов или байт делает код для объектного файла
         :param commands:
-            ['']
-            ['012700', '000002']
-        Добавляет для этих словарей в self.object_lines строки
-            с0
-            15
-            02
-            00
-        """
-        # Cчитаем, что тут всегда есть блок (как минимум - нулевой)
-        obj_bytes: list[str] = self.object_lines[self.curr_block]
-        for word in commands:
-            for byte in self.bin2hex(word):
+            []
+            [0o012700, 0o000002]
+        :param block: адрес блока, в котором лежат слова
+            0o1000
+        :param width: ширина слов строки
+            16
+        Добавляет в self.object_lines[block] байты (младший, старший)
+            0xc0 0x15 0x02 0x00
+        """
+        obj_bytes = self.object_lines[block]
+        if width == 8:
+            for byte in commands:
                 obj_bytes.append(byte)
+            return
+        for word in commands:
+            obj_bytes.append(word & BYTE_MASK)
+            obj_bytes.append(word >> 8)
+
+    def listing_lines(self) -> Iterator[str]:
+        """
+        Отдаёт строки листинга по строкам программы, записанным при кодировании
+        """
+        for line_num, item in enumerate(self.program_items()):
+            text = item if type(item) is str else item.text
+            current_counter, block, commands, width = self.line_record(line_num)
+            yield from self.listing_comm(text, commands, current_counter, width)
+
+    def map_symbols(self) -> Iterator[MapSymbol]:
+        """
+        Метки и переменные программы со строками их определений
+        (у переопределённой переменной - последнее определение)
+        :return:
+            MapSymbol(name='LOOP', value=0o1004, file='01_sum.pdp', line_num=5, label=True), ...
+        """
+        values = self.symbols.values
+        found = {}
+        for line_num, coded in zip(self.symbol_lines, self.symbol_coded):
+            label, variable = coded[:2]
+            file, file_line = self.line_source(line_num)
+            if label:
+                found[label] = MapSymbol(label, values[label], file, file_line, True)
+            if variable:
+                found[variable] = MapSymbol(
+                    variable, values[variable], file, file_line, False
+                )
+        return iter(found.values())
+
+    def map_lines(self) -> Iterator[MapLine]:
+        """
+        Строки программы, занимающие байты (по записанным строкам, как listing_lines)
+        :return:
+            MapLine(address=0o1000, size=4, file='01_sum.pdp', line_num=3, text='\tmov #2, R0'), ...
+        """
+        starts = self.line_starts
+        ends = starts[1:]
+        ends.append(len(self.words))
+        for line_num, item in enumerate(self.program_items()):
+            size = (ends[line_num] - starts[line_num]) * (
+                self.line_widths[line_num] // 8
+            )
+            if size:
+                text = item if type(item) is str else item.text
+                yield MapLine(
+                    self.line_counters[line_num],
+                    size,
+                    *self.line_source(line_num),
+                    text,
+                )
+
+    def line_source(self, line_num: int) -> tuple[str, int]:
+        """
+        Место строки программы в исходниках
+        :param line_num: номер непустой строки программы (после вставок и расширений)
+            12
+        :return: файл (от каталога программы) и номер строки в нём, считая пустые
+            ('devices.inc', 2)
+        """
+        return self.source_files[self.line_files[line_num]], self.line_numbers[line_num]
+
+    def render_listing(self) -> Iterator[str]:
+        """
+        Отдаёт текст .l файла по строкам
+        """
+        separator = ""
+        for line in self.listing_lines():
+            yield separator + line
+            separator = "\n"
+
+    def render_obj(self) -> Iterator[str]:
+        """
+        Отдаёт текст .o файла по блокам
+        """
+        for block_address, block_bytes in self.object_lines.items():
+            if len(block_bytes) != 0:
+                yield f"{block_address:x}" + " " + f"{len(block_bytes):04x}\n"
+                yield "".join(map(HEX_BYTES.__getitem__, block_bytes))
 
     def write_listing(self, filename: str | Path) -> None:
         """
@@ -527,8 +1222,17 @@ class PDP11_Parser:
         :param filename: имя файла-исходника
             '01_sum.pdp'
         """
-        with open(Path.cwd() / filename, mode="w") as file:
-            file.write("\n".join(self.lines))
+        with open(Path.cwd() / filename, mode="w", buffering=WRITE_BUFFER) as file:
+            file.writelines(self.render_listing())
+
+    def write_symbol_map(self, filename: str | Path) -> None:
+        """
+        Формируем карту программы .map: имена и таблица адрес -> строка (см. symmap.py)
+        :param filename: имя файла карты
+            '01_sum.pdp.map'
+        """
+        with open(Path.cwd() / filename, mode="wb") as file:
+            write_map(file, self.map_symbols(), self.map_lines())
 
     def write_obj(self, filename: str | Path) -> None:
         """
@@ -536,19 +1240,698 @@ class PDP11_Parser:
         :param filename: имя файла-исходника
             '01_sum.pdp'
         """
-        with open(Path.cwd() / filename, mode="w") as file:
-            for block_address, block_bytes in self.object_lines.items():
-                if len(block_bytes) != 0:
-                    file.write(f"{block_address:x}" + " " + f"{len(block_bytes):04x}\n")
-                    file.write("".join(block_bytes))
+        if self.obj_format == "text":
+            with open(Path.cwd() / filename, mode="w", buffering=WRITE_BUFFER) as file:
+                file.writelines(self.render_obj())
+            return
+
+        # Двоичные форматы пишутся прямо из байт блоков
+        blocks = [
+            (address, data) for address, data in self.object_lines.items() if data
+        ]
+        with open(Path.cwd() / filename, mode="wb") as file:
+            if self.obj_format == "lda":
+                write_lda(file, blocks)
+            else:
+                write_raw(file, blocks)
+
+
+# Кодировщики форматов команд
+FORMAT_ENCODERS = {
+    "": PDP11_Parser.encode_none,
+    "SSDD": PDP11_Parser.encode_ssdd,
+    "DD": PDP11_Parser.encode_dd,
+    "RDD": PDP11_Parser.encode_rdd,
+    "R": PDP11_Parser.encode_r,
+    "RNN": PDP11_Parser.encode_rnn,
+    "XX": PDP11_Parser.encode_xx,
+    "N3": partial(PDP11_Parser.encode_number, kind="n3"),
+    "N6": partial(PDP11_Parser.encode_number, kind="n6"),
+    "N8": partial(PDP11_Parser.encode_number, kind="n8"),
+}
+# Допустимое число аргументов команд каждого формата
+FORMAT_ARGS = {
+    "": (0,),
+    "SSDD": (2,),
+    "DD": (1,),
+    "RDD": (2,),
+    "R": (1,),
+    "RNN": (2,),
+    "XX": (1,),
+    "N3": (0, 1),
+    "N6": (0, 1),
+    "N8": (0, 1),
+}
+# Для каждой команды заранее выбраны кодировщик её формата, её код и число аргументов
+ENCODERS = {
+    name: (FORMAT_ENCODERS[command.fmt], command.opcode, FORMAT_ARGS[command.fmt])
+    for name, command in COMMANDS.items()
+}
 
 
-@click.command()
+@lru_cache(maxsize=None)
+def shared_parser(
+    lexer: str = "fast",
+    obj_format: str = "text",
+    cache_dir: str | None = None,
+    cache_size: int = CACHE_SIZE,
+    outputs: str = "both",
+    symbol_map: bool = False,
+) -> PDP11_Parser:
+    """
+    PDP11_Parser процесса с данными параметрами: между сборками он только
+    сбрасывается (assemble и assemble_source начинают с reset), поэтому
+    закодированные строки переиспользуются
+    Не для одновременного использования из нескольких потоков
+    :param lexer: способ разбора (см. LEXERS)
+        'fast'
+    :param obj_format: формат .o (см. objfile.OBJ_FORMATS)
+        'text'
+    :param cache_dir: каталог кэша сборок (None - без кэша)
+        '/home/user/.cache/pdp11'
+    :param cache_size: наибольший размер кэша, байт
+    :param outputs: что записывает сборка (см. OUTPUTS)
+        'both'
+    :param symbol_map: записывать ли карту программы (см. symmap.py)
+        False
+    """
+    cache = None if cache_dir is None else AssemblyCache(cache_dir, cache_size)
+    return PDP11_Parser(
+        lexer=lexer,
+        cache=cache,
+        obj_format=obj_format,
+        outputs=outputs,
+        symbol_map=symbol_map,
+    )
+
+
+def code_chunk(texts: list[str], lexer: str) -> list[CodedLine | None]:
+    """
+    Кодирует строки куска программы в процессе пула (см. PDP11_Parser.code_parallel)
+    :param texts: строки программы
+        ['\tmov #2, R0', 'LOOP: sob R1, LOOP', '\tPUSH R1']
+    :param lexer: способ разбора (см. LEXERS)
+        'fast'
+    :return: закодированные строки, None - строка не кодируется сама по себе
+        [CodedLine(words=(0o012700, 0o000002), ...), CodedLine(label='LOOP', ...), None]
+    """
+    parser = shared_parser(lexer)
+    coded = []
+    for text in texts:
+        try:
+            coded.append(parser.compile_line(text))
+        except Exception:
+            coded.append(None)
+    return coded
+
+
+def assemble(
+    source: str | Iterable[str],
+    lexer: str = "fast",
+    directory: str | Path | None = None,
+    outputs: str = "both",
+) -> AssemblyResult:
+    """
+    Собирает программу из строки или строк в памяти, не записывая файлов
+    :param source: текст программы или её строки
+        '\t.=1000\n\tmov #2, R0\n\thalt\n'
+    :param lexer: способ разбора (см. LEXERS)
+        'fast'
+    :param directory: каталог, от которого считаются пути .INCLUDE (None - текущий)
+    :param outputs: что нужно: блоки и листинг, только блоки ("obj") или только листинг
+        'obj'
+    :return:
+        AssemblyResult(blocks={0o1000: b'\xc0\x15\x02\x00\x00\x00'}, listing=None, symbols={})
+    """
+    return shared_parser(lexer, outputs=outputs).assemble_source(source, directory)
+
+
+class DefaultGroup(click.Group):
+    """
+    Группа команд, в которой вызов без подкоманды
+    (python pdp11_compiler.py <filename>) означает compile
+    """
+
+    def parse_args(self, ctx: click.Context, args: list[str]) -> list[str]:
+        if args and args[0] not in self.commands and not args[0].startswith("-"):
+            args.insert(0, "compile")
+        return super().parse_args(ctx, args)
+
+
+def find_sources(paths: Iterable[str]) -> list[str]:
+    """
+    Собирает файлы .pdp из перечисленных путей
+    Каталоги обходятся рекурсивно, шаблоны раскрываются через glob
+    :param paths: файлы, каталоги или шаблоны
+        ['pdp11_tests', 'extra/*.pdp']
+    :return:
+        ['pdp11_tests/01_sum/01_sum.pdp', ..., 'extra/a.pdp']
+    """
+    sources = []
+    for path in paths:
+        if Path(path).is_dir():
+            sources.extend(sorted(str(p) for p in Path(path).rglob("*.pdp")))
+        elif glob.has_magic(path):
+            sources.extend(sorted(glob.glob(path, recursive=True)))
+        else:
+            sources.append(path)
+    # Убираем повторы, сохраняя порядок
+    return list(dict.fromkeys(sources))
+
+
+def compile_file(filename: str, **options) -> tuple[str, str | None, float]:
+    """
+    Компилирует один файл PDP11_Parser-ом процесса (shared_parser), не выпуская
+    наружу исключения
+    :param filename: имя файла-исходника
+        'pdp11_tests/01_sum/01_sum.pdp'
+    :param options: параметры shared_parser
+        {'lexer': 'fast', 'cache_dir': '/home/user/.cache/pdp11'}
+    :return: имя файла, текст ошибки (None при успехе), время компиляции в секундах
+        ('pdp11_tests/01_sum/01_sum.pdp', None, 0.004)
+    """
+    start = perf_counter()
+    try:
+        shared_parser(**options).compile(filename)
+    except Exception as error:
+        return filename, f"{type(error).__name__}: {error}", perf_counter() - start
+    return filename, None, perf_counter() - start
+
+
+def serve_job(
+    job: dict, cache_dir: str | None = None, cache_size: int = CACHE_SIZE
+) -> dict:
+    """
+    Выполняет задание сервера сборки (см. server.py), не выпуская наружу исключения:
+    {"file": путь} - компилирует файл в путь.o и путь.l, как compile,
+    {"source": текст, "directory": каталог .INCLUDE} - собирает программу в памяти.
+    Необязательные поля: "id", "lexer", "outputs" (см. OUTPUTS), "obj_format" (только для "file")
+    :param job: задание
+        {'id': 1, 'source': '\tmov #1, R0\n\thalt'}
+    :param cache_dir: каталог кэша сборок для "file" (None - без кэша)
+    :param cache_size: наибольший размер кэша, байт
+    :return: ответ: блоки (адрес, байты в hex), листинг и имена либо пути файлов,
+        текст ошибки и время в секундах
+        {'id': 1, 'blocks': [[0, 'c0150100 0000']], 'listing': [...], 'symbols': {}, 'seconds': 0.001}
+    """
+    start = perf_counter()
+    response = {"id": job.get("id")}
+    lexer = job.get("lexer", "fast")
+    outputs = job.get("outputs", "both")
+    try:
+        if "file" in job:
+            filename = response["file"] = job["file"]
+            parser = shared_parser(
+                lexer, job.get("obj_format", "text"), cache_dir, cache_size, outputs
+            )
+            parser.compile(filename)
+            if outputs != "listing":
+                response["obj"] = filename + ".o"
+            if outputs != "obj":
+                response["listing"] = filename + ".l"
+        else:
+            result = shared_parser(lexer, outputs=outputs).assemble_source(
+                job["source"], job.get("directory")
+            )
+            if outputs != "listing":
+                response["blocks"] = [
+                    [address, data.hex()] for address, data in result.blocks.items()
+                ]
+            if outputs != "obj":
+                response["listing"] = result.listing
+            response["symbols"] = result.symbols
+    except Exception as error:
+        response["error"] = f"{type(error).__name__}: {error}"
+    response["seconds"] = perf_counter() - start
+    return response
+
+
+def first_difference(
+    actual: str, expected: str, kind: str
+) -> tuple[int, int | None] | None:
+    """
+    Сравнивает тексты .o или .l файлов построчно, игнорируя пробелы в конце строк
+    (как diff --ignore-trailing-space)
+    :param actual: полученный текст
+    :param expected: ожидаемый текст
+    :param kind: 'o' или 'l' - по нему определяется, как считать адрес строки
+    :return: номер первой отличающейся строки (с 1) и адрес в памяти, к которому она относится,
+        либо None, если тексты совпадают
+        (5, 0o1004)
+    """
+    actual_lines = [line.rstrip() for line in actual.splitlines()]
+    expected_lines = [line.rstrip() for line in expected.splitlines()]
+
+    address = next_address = None
+    for line_num in range(max(len(actual_lines), len(expected_lines))):
+        line = actual_lines[line_num] if line_num < len(actual_lines) else None
+        if line is not None:
+            if kind == "o":
+                # Заголовок блока: "адрес длина", остальные строки - по байту
+                if " " in line:
+                    address = next_address = int(line.split()[0], 16)
+                elif next_address is not None:
+                    address = next_address
+                    next_address += 1
+            elif line[:6].isdigit() and line[6:7] == ":":
+                address = int(line[:6], 8)
+
+        if line_num >= len(expected_lines) or line != expected_lines[line_num]:
+            return line_num + 1, address
+    return None
+
+
+def output_difference(
+    actual: dict[str, str], source: Path, where: str = ""
+) -> str | None:
+    """
+    Сверяет тексты .o и .l с exp_<имя>.o и exp_<имя>.l рядом с исходником
+    :param actual: тексты по виду файла ('o' или 'l'), какие есть
+        {'o': '3e8 0006\nc0\n...', 'l': '...'}
+    :param source: файл-исходник
+        Path('pdp11_tests/01_sum/01_sum.pdp')
+    :param where: чем получены тексты (начало описания расхождения)
+        'cache: '
+    :return: описание первого расхождения или None
+        'cache: .o: line 5, address 001004'
+    """
+    for kind, text in actual.items():
+        with open(source.with_name(f"exp_{source.name}.{kind}")) as file:
+            expected = file.read()
+        difference = first_difference(text, expected, kind)
+        if difference is not None:
+            line_num, address = difference
+            address = "?" if address is None else PDP11_Parser.oct(address)
+            return f"{where}.{kind}: line {line_num}, address {address}"
+    return None
+
+
+def verify_file(filename: str, **options) -> tuple[str, str | None, float]:
+    """
+    Компилирует файл в памяти и сверяет результат с exp_<имя>.o и exp_<имя>.l рядом с ним
+    :param filename: имя файла-исходника
+        'pdp11_tests/01_sum/01_sum.pdp'
+    :param options: параметры shared_parser
+        {'lexer': 'fast'}
+    :return: имя файла, описание первого расхождения (None при совпадении), время в секундах
+        ('pdp11_tests/01_sum/01_sum.pdp', '.o: line 5, address 001004', 0.004)
+    """
+    start = perf_counter()
+    source = Path(filename)
+    try:
+        parser = shared_parser(**options)
+        parser.assemble(filename)
+        results = {
+            "o": "".join(parser.render_obj()),
+            "l": "".join(parser.render_listing()),
+        }
+        message = output_difference(results, source)
+    except Exception as error:
+        return filename, f"{type(error).__name__}: {error}", perf_counter() - start
+    return filename, message, perf_counter() - start
+
+
+def run_many(
+    func: Callable[[str], tuple[str, str | None, float]],
+    filenames: list[str],
+    workers: int | None = None,
+) -> Iterator[tuple[str, str | None, float]]:
+    """
+    Применяет func (compile_file или verify_file) к файлам в пуле процессов,
+    отдавая результаты в порядке filenames
+    Ошибка в одном файле не прерывает обработку остальных
+    :param func: функция обработки одного файла
+    :param filenames: имена файлов-исходников
+    :param workers: число процессов (None - по числу ядер, 1 - без пула)
+    :return: результаты func
+    """
+    if workers == 1 or len(filenames) <= 1:
+        yield from map(func, filenames)
+        return
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        chunksize = max(1, len(filenames) // (4 * (workers or os.cpu_count() or 1)))
+        yield from executor.map(func, filenames, chunksize=chunksize)
+
+
+# Общие для compile, batch и verify параметры PDP11_Parser
+lexer_option = click.option(
+    "--lexer",
+    type=click.Choice(list(LEXERS)),
+    default="fast",
+    show_default=True,
+    help="Разбор строк: регулярными выражениями или только грамматикой pyparsing",
+)
+
+# Общие для compile и batch параметры записи
+format_option = click.option(
+    "--obj-format",
+    type=click.Choice(OBJ_FORMATS),
+    default="text",
+    show_default=True,
+    help="Формат .o: текстовый, блоки загрузчика LDA или блоки с заголовком (raw)",
+)
+outputs_option = click.option(
+    "--outputs",
+    type=click.Choice(OUTPUTS),
+    default="both",
+    show_default=True,
+    help="Что записывать: .o и .l, только .o или только .l (без затрат на листинг)",
+)
+map_option = click.option(
+    "--map",
+    "symbol_map",
+    is_flag=True,
+    help="Записать и карту программы FILENAME.map: имена и адреса строк (см. symmap.py)",
+)
+
+
+def cache_options(func: Callable) -> Callable:
+    """
+    Общие для compile и batch параметры кэша сборок
+    """
+    func = click.option(
+        "--cache-size",
+        type=int,
+        default=CACHE_SIZE >> 20,
+        show_default=True,
+        help="Наибольший размер кэша, МБ",
+    )(func)
+    func = click.option(
+        "--cache-dir", default=CACHE_DIR, show_default=True, help="Каталог кэша"
+    )(func)
+    return click.option("--no-cache", is_flag=True, help="Собирать без кэша сборок")(
+        func
+    )
+
+
+def make_cache(no_cache: bool, cache_dir: str, cache_size: int) -> AssemblyCache | None:
+    """
+    Создаёт кэш сборок по параметрам командной строки
+    :param no_cache: не использовать кэш
+    :param cache_dir: каталог кэша
+        '/home/user/.cache/pdp11'
+    :param cache_size: наибольший размер кэша, МБ
+        64
+    :return:
+        AssemblyCache('/home/user/.cache/pdp11', 64 << 20)
+    """
+    if no_cache:
+        return None
+    return AssemblyCache(cache_dir, max_size=cache_size << 20)
+
+
+def job_handler(
+    no_cache: bool, cache_dir: str, cache_size: int
+) -> Callable[[dict], dict]:
+    """
+    serve_job с кэшем сборок по параметрам командной строки (для serve и client)
+    :param no_cache: не использовать кэш
+    :param cache_dir: каталог кэша
+        '/home/user/.cache/pdp11'
+    :param cache_size: наибольший размер кэша, МБ
+        64
+    :return:
+        partial(serve_job, cache_dir='/home/user/.cache/pdp11', cache_size=64 << 20)
+    """
+    return partial(
+        serve_job,
+        cache_dir=None if no_cache else cache_dir,
+        cache_size=cache_size << 20,
+    )
+
+
+@click.group(cls=DefaultGroup)
+def cli():
+    """Компилятор ассемблера PDP-11"""
+
+
+@cli.command("compile")
+@click.argument("filename")
+@lexer_option
+@format_option
+@outputs_option
+@map_option
+@cache_options
+@click.option(
+    "-j",
+    "--workers",
+    type=int,
+    default=None,
+    help="Число процессов для кодирования большой программы (по числу ядер)",
+)
+@click.option(
+    "--chunk-size",
+    default=CHUNK_SIZE,
+    show_default=True,
+    help="Программа больше стольких строк кодируется кусками по столько строк в пуле",
+)
+@click.option(
+    "--stats",
+    is_flag=True,
+    help="Собрать без кэша и пула, напечатать время фаз сборки и дописать его в --stats-file",
+)
+@click.option(
+    "--stats-file",
+    default=None,
+    help="Файл истории статистики, JSON по строке на сборку  [default: FILENAME.stats.jsonl]",
+)
+@click.option(
+    "--profile",
+    is_flag=True,
+    help="То же, что --stats, и результаты cProfile в FILENAME.prof",
+)
+def compile_programm(
+    filename: str | Path,
+    lexer: str,
+    obj_format: str,
+    outputs: str,
+    symbol_map: bool,
+    workers: int | None,
+    chunk_size: int,
+    stats: bool,
+    stats_file: str | None,
+    profile: bool,
+    **cache_params,
+):
+    """Компилирует FILENAME в FILENAME.o и FILENAME.l"""
+    if not (stats or profile):
+        p = PDP11_Parser(
+            lexer=lexer,
+            cache=make_cache(**cache_params),
+            obj_format=obj_format,
+            outputs=outputs,
+            workers=workers,
+            chunk_size=chunk_size,
+            symbol_map=symbol_map,
+        )
+        p.compile(filename)
+        return
+
+    # Замеряется сама сборка в этом процессе, поэтому кэш сборок и пул (-j)
+    # не используются (см. compile_with_stats)
+    p = PDP11_Parser(
+        lexer=lexer, obj_format=obj_format, outputs=outputs, symbol_map=symbol_map
+    )
+    record = compile_with_stats(
+        p, filename, profile_file=filename + ".prof" if profile else None
+    )
+    for line in format_stats(record):
+        click.echo(line)
+    append_stats(record, stats_file or filename + ".stats.jsonl")
+
+
+@cli.command("batch")
+@click.argument("paths", nargs=-1, required=True)
+@click.option(
+    "-j", "--workers", type=int, default=None, help="Число процессов (по числу ядер)"
+)
+@lexer_option
+@format_option
+@outputs_option
+@map_option
+@cache_options
+def batch(
+    paths: tuple[str, ...],
+    workers: int | None,
+    lexer: str,
+    obj_format: str,
+    outputs: str,
+    symbol_map: bool,
+    **cache_params,
+):
+    """Компилирует все .pdp из каталогов, файлов и шаблонов PATHS в одном процессе"""
+    filenames = find_sources(paths)
+    start = perf_counter()
+
+    failed = 0
+    cache = make_cache(**cache_params)
+    func = partial(
+        compile_file,
+        lexer=lexer,
+        obj_format=obj_format,
+        cache_dir=None if cache is None else str(cache.directory),
+        cache_size=cache_params["cache_size"] << 20,
+        outputs=outputs,
+        symbol_map=symbol_map,
+    )
+    for filename, error, elapsed in run_many(func, filenames, workers):
+        if error is None:
+            click.echo(f"OK    {elapsed:.3f}s  {filename}")
+        else:
+            failed += 1
+            click.echo(f"FAIL  {elapsed:.3f}s  {filename}: {error}")
+    if cache is not None:
+        # Процессы пула считают только свои записи - размер всего кэша сверяется раз за запуск
+        cache.prune()
+
+    click.echo(
+        f"{len(filenames)} files: {len(filenames) - failed} ok, {failed} failed, "
+        f"{perf_counter() - start:.2f}s"
+    )
+    if failed:
+        sys.exit(1)
+
+
+@cli.command("serve")
+@click.option(
+    "--socket",
+    "socket_path",
+    default=SOCKET_PATH,
+    show_default=True,
+    help="Unix-сокет для заданий",
+)
+@click.option("--stdio", is_flag=True, help="Задания из stdin, ответы в stdout")
+@click.option(
+    "-j", "--workers", type=int, default=None, help="Число процессов (по числу ядер)"
+)
+@cache_options
+def serve(socket_path: str, stdio: bool, workers: int | None, **cache_params):
+    """Сервер сборки: задания JSON по строкам выполняются в пуле прогретых процессов"""
+    handle = job_handler(**cache_params)
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        if stdio:
+
+            def write(text: str) -> None:
+                sys.stdout.write(text)
+                sys.stdout.flush()
+
+            handle_stream(sys.stdin, write, executor, handle)
+        else:
+            click.echo(f"serving on {socket_path}", err=True)
+            serve_socket(socket_path, executor, handle)
+
+
+@cli.command("client")
+@click.argument("filenames", nargs=-1, required=True)
+@click.option(
+    "--socket",
+    "socket_path",
+    default=SOCKET_PATH,
+    show_default=True,
+    help="Unix-сокет сервера",
+)
+@lexer_option
+@format_option
+@outputs_option
+@cache_options
+def client(
+    filenames: tuple[str, ...],
+    socket_path: str,
+    lexer: str,
+    obj_format: str,
+    outputs: str,
+    **cache_params,
+):
+    """
+    Компилирует FILENAMES на сервере сборки (serve), как compile;
+    если сервер не запущен - в этом процессе (параметры кэша - только для этого случая,
+    сервер собирает со своим кэшем)
+    """
+    jobs = [
+        {
+            "id": job_id,
+            "file": os.path.abspath(filename),
+            "lexer": lexer,
+            "obj_format": obj_format,
+            "outputs": outputs,
+        }
+        for job_id, filename in enumerate(filenames)
+    ]
+    try:
+        responses = send_jobs(jobs, socket_path)
+    except (FileNotFoundError, ConnectionRefusedError):
+        responses = list(map(job_handler(**cache_params), jobs))
+
+    failed = 0
+    for response in sorted(responses, key=lambda response: response["id"]):
+        if "error" in response:
+            failed += 1
+            click.echo(
+                f"FAIL  {filenames[response['id']]}: {response['error']}", err=True
+            )
+    if failed or len(responses) != len(jobs):
+        sys.exit(1)
+
+
+@cli.command("verify")
+@click.argument("paths", nargs=-1, required=True)
+@click.option(
+    "-j", "--workers", type=int, default=None, help="Число процессов (по числу ядер)"
+)
+@lexer_option
+def verify(paths: tuple[str, ...], workers: int | None, lexer: str):
+    """
+    Компилирует .pdp из PATHS в памяти и сверяет с exp_*.o и exp_*.l,
+    не записывая файлов на диск
+    """
+    filenames = find_sources(paths)
+    start = perf_counter()
+
+    failed = 0
+    func = partial(verify_file, lexer=lexer)
+    for filename, difference, elapsed in run_many(func, filenames, workers):
+        if difference is not None:
+            failed += 1
+            click.echo(f"FAIL  {filename}: {difference}")
+
+    click.echo(
+        f"{len(filenames)} files: {len(filenames) - failed} passed, {failed} failed, "
+        f"{perf_counter() - start:.2f}s"
+    )
+    if failed:
+        sys.exit(1)
+
+
+@cli.command("run")
 @click.argument("filename")
-def compile_programm(filename: str | Path):
-    p = PDP11_Parser()
-    p.compile(filename)
+@lexer_option
+@run_options
+def run_programm(filename: str, lexer: str, **run_params):
+    """
+    Компилирует FILENAME в памяти и исполняет: вывод консоли - в stdout,
+    регистры и скорость - в stderr
+    """
+    parser = PDP11_Parser(lexer=lexer)
+    parser.assemble(filename)
+    execute(parser.object_lines.items(), **run_params)
+
 
 
+@cli.command("disasm")
+@click.argument("filename")
+@click.option(
+    "-o", "--output", default=None, help="Файл листинга (по умолчанию - stdout)"
+)
+def disasm(filename: str, output: str | None):
+    """Дизассемблирует объектный файл FILENAME (любого формата)"""
+    texts = disassemble(read_object(filename))
+    if output is None:
+        for text in texts:
+            click.echo(text, nl=False)
+        return
+    with open(Path.cwd() / output, mode="w") as file:
+        file.writelines(texts)
+
 if __name__ == "__main__":
-    compile_programm()
+    cli()
@@ -0,0 +1,167 @@
+from collections.abc import Callable, Iterator
+from datetime import datetime
+from inspect import isgeneratorfunction
+from pathlib import Path
+from time import perf_counter
+import cProfile
+import json
+import tracemalloc
+
+# Фазы сборки - методы PDP11_Parser, время и число вызовов которых замеряются.
+# Время фазы включает время вложенных в неё фаз: code_command - разбор аргументов,
+# write_listing - listing_comm по строкам, записанным при кодировании (см. listing_lines)
+PHASES = {
+    "parse_line": "разбор строки",
+    "recognize_args": "разбор аргументов",
+    "code_command": "кодирование команды",
+    "place_line": "размещение строки, метки и переменные",
+    "apply_fixups": "ссылки вперёд",
+    "object_comm": "байты .o",
+    "listing_comm": "строки листинга",
+    "write_obj": "запись .o",
+    "write_listing": "запись .l",
+}
+
+
+class PhaseStats:
+    """
+    Время и число вызовов фаз сборки одного PDP11_Parser
+    Замер включается подменой методов экземпляра (instrument), поэтому
+    без --stats сборка не платит за него ничего
+    """
+
+    def __init__(self):
+        self.calls = dict.fromkeys(PHASES, 0)
+        self.seconds = dict.fromkeys(PHASES, 0.0)
+
+    def instrument(self, parser) -> None:
+        """
+        Подменяет методы фаз parser обёртками с замером времени
+        :param parser: PDP11_Parser до начала сборки
+        """
+        for name in PHASES:
+            setattr(parser, name, self.timed(name, getattr(parser, name)))
+
+    def timed(self, name: str, func: Callable) -> Callable:
+        """
+        Обёртка func, которая прибавляет время вызова к фазе name
+        Генераторы (listing_comm) проходятся в обёртке целиком,
+        чтобы в фазу попало время получения строк, а не только создания генератора
+        :param name: имя фазы
+            'code_command'
+        :param func: метод фазы
+        :return: обёртка
+        """
+        calls, seconds = self.calls, self.seconds
+
+        if isgeneratorfunction(func):
+
+            def wrapper(*args, **kwargs):
+                start = perf_counter()
+                items = list(func(*args, **kwargs))
+                seconds[name] += perf_counter() - start
+                calls[name] += 1
+                return items
+
+            return wrapper
+
+        def wrapper(*args, **kwargs):
+            start = perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                seconds[name] += perf_counter() - start
+                calls[name] += 1
+
+        return wrapper
+
+
+def compile_with_stats(parser, filename: str, profile_file: str | None = None) -> dict:
+    """
+    Компилирует filename, замеряя фазы сборки, скорость и пик памяти (tracemalloc)
+    tracemalloc и cProfile замедляют сборку, поэтому сравнивать стоит
+    записи, снятые с одинаковыми флагами.
+    Фазы, память и cProfile видны только в этом процессе, поэтому на время замера
+    кодирование в пуле процессов (PDP11_Parser.code_parallel) отключается:
+    программа любого размера собирается последовательно, и записи сравнимы между собой
+    :param parser: PDP11_Parser без кэша сборок
+    :param filename: имя файла-исходника
+        '01_sum.pdp'
+    :param profile_file: файл для результатов cProfile (None - без cProfile)
+        '01_sum.pdp.prof'
+    :return: запись статистики сборки
+        {'file': '01_sum.pdp', 'total_seconds': 0.004, 'lines': 12, 'phases': {...}, ...}
+    """
+    stats = PhaseStats()
+    stats.instrument(parser)
+    profiler = cProfile.Profile() if profile_file else None
+    workers, parser.workers = parser.workers, 1
+
+    tracemalloc.start()
+    start = perf_counter()
+    try:
+        if profiler is not None:
+            profiler.enable()
+        parser.compile(filename)
+    finally:
+        if profiler is not None:
+            profiler.disable()
+        total = perf_counter() - start
+        _, peak_memory = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        parser.workers = workers
+
+    if profiler is not None:
+        profiler.dump_stats(profile_file)
+
+    lines = len(parser.line_starts)
+    return {
+        "file": str(filename),
+        "time": datetime.now().isoformat(timespec="seconds"),
+        "options": parser.options,
+        "profiled": profiler is not None,
+        "total_seconds": total,
+        "lines": lines,
+        "lines_per_second": lines / total if total else 0.0,
+        "bytes": sum(map(len, parser.object_lines.values())),
+        "peak_memory": peak_memory,
+        "phases": {
+            name: {"calls": stats.calls[name], "seconds": stats.seconds[name]}
+            for name in PHASES
+        },
+    }
+
+
+def format_stats(record: dict) -> Iterator[str]:
+    """
+    Таблица статистики сборки для печати
+    :param record: запись статистики (см. compile_with_stats)
+    :return: строки таблицы
+        'phase              calls    seconds      %', ...
+    """
+    total = record["total_seconds"]
+    yield f"{'phase':<16}{'calls':>9}{'seconds':>11}{'%':>7}  description"
+    for name, description in PHASES.items():
+        phase = record["phases"][name]
+        share = 100 * phase["seconds"] / total if total else 0.0
+        yield (
+            f"{name:<16}{phase['calls']:>9}{phase['seconds']:>11.6f}"
+            f"{share:>7.1f}  {description}"
+        )
+    yield f"{'total':<16}{'':>9}{total:>11.6f}{100:>7.1f}"
+    yield (
+        f"{record['lines']} lines, {record['lines_per_second']:.0f} lines/s, "
+        f"{record['bytes']} bytes, peak memory {record['peak_memory'] / 1024:.1f} KiB"
+    )
+
+
+def append_stats(record: dict, stats_file: str | Path) -> None:
+    """
+    Дописывает запись статистики строкой JSON в stats_file,
+    так по файлу можно следить за скоростью сборки от запуска к запуску
+    :param record: запись статистики (см. compile_with_stats)
+    :param stats_file: файл статистики
+        '01_sum.pdp.stats.jsonl'
+    """
+    with open(stats_file, mode="a") as file:
+        file.write(json.dumps(record, ensure_ascii=False) + "\n")
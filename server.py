@@ -0,0 +1,132 @@
+from collections.abc import Callable, Iterable
+from concurrent.futures import Executor, Future
+from functools import partial
+import json
+import os
+import socket
+import socketserver
+import tempfile
+import threading
+
+# Сервер сборки: задания и ответы - объекты JSON, по одному в строке.
+# Задания выполняются в пуле процессов, ответы пишутся по мере готовности
+# (не по порядку заданий), поле "id" задания повторяется в ответе.
+# Транспорт - Unix-сокет (по соединению на клиента) или stdin/stdout
+
+# Unix-сокет сервера по умолчанию
+SOCKET_PATH = os.path.join(tempfile.gettempdir(), f"pdp11-{os.getuid()}.sock")
+
+
+def handle_stream(
+    lines: Iterable[str],
+    write: Callable[[str], None],
+    executor: Executor,
+    handle: Callable[[dict], dict],
+) -> None:
+    """
+    Читает задания по строкам, отправляет их в пул и пишет ответы по мере готовности,
+    возвращаясь, когда записаны ответы на все задания
+    :param lines: строки заданий JSON
+        '{"id": 1, "file": "/src/01_sum.pdp"}', ...
+    :param write: запись строки ответа
+    :param executor: пул, в котором выполняются задания
+    :param handle: обработка задания (выполняется в пуле, должна сериализоваться pickle)
+    """
+    lock = threading.Lock()
+    done = threading.Semaphore(0)
+
+    def reply(response: dict) -> None:
+        with lock:
+            write(json.dumps(response, ensure_ascii=False) + "\n")
+
+    def finish(future: Future, job_id) -> None:
+        try:
+            reply(future.result())
+        except Exception as error:
+            reply({"id": job_id, "error": f"{type(error).__name__}: {error}"})
+        finally:
+            done.release()
+
+    submitted = 0
+    for text in lines:
+        if not text.strip():
+            continue
+        try:
+            job = json.loads(text)
+        except json.JSONDecodeError as error:
+            reply({"id": None, "error": f"JSONDecodeError: {error}"})
+            continue
+        if not isinstance(job, dict):
+            reply({"id": None, "error": "Задание должно быть объектом JSON"})
+            continue
+        future = executor.submit(handle, job)
+        future.add_done_callback(partial(finish, job_id=job.get("id")))
+        submitted += 1
+
+    for _ in range(submitted):
+        done.acquire()
+
+
+class JobHandler(socketserver.StreamRequestHandler):
+    """
+    Соединение с клиентом: задания до закрытия клиентом записи, затем ответы на все
+    """
+
+    def handle(self):
+        write = lambda text: self.wfile.write(text.encode())
+        lines = (line.decode() for line in self.rfile)
+        handle_stream(lines, write, self.server.executor, self.server.run_job)
+
+
+class JobServer(socketserver.ThreadingUnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, path: str, executor: Executor, handle: Callable[[dict], dict]):
+        self.executor = executor
+        self.run_job = handle
+        super().__init__(path, JobHandler)
+
+
+def serve_socket(path: str, executor: Executor, handle: Callable[[dict], dict]) -> None:
+    """
+    Принимает задания на Unix-сокете path, пока процесс не прервут
+    :param path: путь сокета
+        '/tmp/pdp11-1000.sock'
+    :param executor: пул, в котором выполняются задания
+    :param handle: обработка задания
+    """
+    if os.path.exists(path):
+        # Сокет остался от завершившегося сервера - или сервер ещё работает
+        try:
+            with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as connection:
+                connection.connect(path)
+        except OSError:
+            os.unlink(path)
+        else:
+            raise ValueError(f"Сервер сборки уже работает на {path}")
+
+    with JobServer(path, executor, handle) as server:
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            os.unlink(path)
+
+
+def send_jobs(jobs: list[dict], path: str = SOCKET_PATH) -> list[dict]:
+    """
+    Отправляет задания серверу сборки и ждёт ответы на все
+    :param jobs: задания
+        [{'id': 0, 'file': '/src/01_sum.pdp'}]
+    :param path: путь сокета сервера
+    :return: ответы (в порядке готовности)
+        [{'id': 0, 'file': '/src/01_sum.pdp', 'seconds': 0.004}]
+    """
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as connection:
+        connection.connect(path)
+        data = "".join(json.dumps(job, ensure_ascii=False) + "\n" for job in jobs)
+        connection.sendall(data.encode())
+        connection.shutdown(socket.SHUT_WR)
+        with connection.makefile(encoding="utf-8") as file:
+            return [json.loads(line) for line in file]
@@ -0,0 +1,323 @@
+import re
+from collections.abc import Callable, Iterator
+from functools import lru_cache
+
+# Выражения: числа (восьмеричные, десятичные с точкой на конце, 'c - код символа),
+# имена меток и переменных, "." - адрес текущей строки,
+# операторы ! (или), & (и), + -, * / по возрастанию приоритета, унарный минус и скобки.
+#
+# Разобранное выражение хранится так:
+# int - константа (константные части сворачиваются при разборе),
+# str - одно имя или ".",
+# tuple - обратная польская запись из чисел, имён и операторов.
+# Все три формы - встроенные типы, их можно хранить в кэше сборок (marshal)
+
+# Унарный минус в обратной польской записи (имена начинаются с буквы, поэтому не совпадут)
+NEGATE = "u-"
+# Адрес текущей строки
+LOCATION = "."
+
+
+def _divide(left: int, right: int) -> int:
+    if right == 0:
+        raise ValueError("Деление на ноль в выражении")
+    quotient = abs(left) // abs(right)
+    return quotient if (left < 0) == (right < 0) else -quotient
+
+
+# Бинарные операторы: приоритет и функция
+OPERATORS: dict[str, tuple[int, Callable[[int, int], int]]] = {
+    "!": (1, lambda left, right: left | right),
+    "&": (2, lambda left, right: left & right),
+    "+": (3, lambda left, right: left + right),
+    "-": (3, lambda left, right: left - right),
+    "*": (4, lambda left, right: left * right),
+    "/": (4, _divide),
+}
+
+TOKEN_RE = re.compile(
+    r"""[ \t]*(?:
+        (?P<number>[0-9]+\.?)
+        | '(?P<char>.)
+        | (?P<name>[A-Za-z][A-Za-z0-9_]*)
+        | (?P<op>[-+*/&!().])
+    )""",
+    flags=re.VERBOSE,
+)
+
+# Имена регистров: в выражениях их быть не может, регистр задаётся режимом адресации
+REGISTER_NAME_RE = re.compile(r"[rR][0-7]|pc|PC|sp|SP")
+
+# Одно число, символ или имя - такие записи разбираются и без выражений
+SIMPLE_RE = re.compile(r"-?[0-7]+|-?[0-9]+\.|'\S|[A-Za-z][A-Za-z0-9_]*")
+
+Expression = int | str | tuple
+
+
+def tokenize(text: str) -> Iterator[tuple[str, str]]:
+    """
+    Делит выражение на лексемы
+    :param text: выражение
+        'BUF+2*N'
+    :return: вид лексемы и её текст
+        ('name', 'BUF'), ('op', '+'), ('number', '2'), ...
+    """
+    position = 0
+    text = text.rstrip(" \t")
+    while position < len(text):
+        match = TOKEN_RE.match(text, position)
+        if match is None:
+            raise ValueError(f"Неверное выражение {text!r}")
+        position = match.end()
+        yield match.lastgroup, match.group(match.lastgroup)
+
+
+def _combine(operator: str, *operands: Expression) -> Expression:
+    """
+    Составляет выражение из операндов и оператора, сразу вычисляя константы
+    """
+    if all(type(operand) is int for operand in operands):
+        if operator == NEGATE:
+            return -operands[0]
+        return OPERATORS[operator][1](*operands)
+    items = []
+    for operand in operands:
+        items.extend(operand if type(operand) is tuple else (operand,))
+    return (*items, operator)
+
+
+class _ExpressionParser:
+    """
+    Разбор выражения рекурсивным спуском по приоритетам OPERATORS
+    """
+
+    def __init__(self, text: str):
+        self.text = text
+        self.tokens = list(tokenize(text))
+        self.position = 0
+
+    def peek(self) -> tuple[str, str] | None:
+        if self.position < len(self.tokens):
+            return self.tokens[self.position]
+        return None
+
+    def parse(self) -> Expression:
+        expression = self.binary(1)
+        if self.peek() is not None:
+            raise ValueError(f"Неверное выражение {self.text!r}")
+        return expression
+
+    def binary(self, priority: int) -> Expression:
+        if priority > max(level for level, _ in OPERATORS.values()):
+            return self.unary()
+        left = self.binary(priority + 1)
+        while True:
+            token = self.peek()
+            if token is None or token[1] not in OPERATORS:
+                return left
+            if token[0] != "op" or OPERATORS[token[1]][0] != priority:
+                return left
+            self.position += 1
+            left = _combine(token[1], left, self.binary(priority + 1))
+
+    def unary(self) -> Expression:
+        token = self.peek()
+        if token is None:
+            raise ValueError(f"Неверное выражение {self.text!r}")
+        kind, text = token
+        self.position += 1
+        if kind == "number":
+            return parse_number(text)
+        if kind == "char":
+            return ord(text)
+        if kind == "name":
+            check_not_register(text, self.text)
+            return text
+        if text == LOCATION:
+            return LOCATION
+        if text == "-":
+            return _combine(NEGATE, self.unary())
+        if text == "+":
+            return self.unary()
+        if text == "(":
+            expression = self.binary(1)
+            if self.peek() != ("op", ")"):
+                raise ValueError(f"Нет закрывающей скобки в выражении {self.text!r}")
+            self.position += 1
+            return expression
+        raise ValueError(f"Неверное выражение {self.text!r}")
+
+
+def parse_number(text: str) -> int:
+    """
+    Переводит запись числа в число: восьмеричное по умолчанию,
+    десятичное с точкой на конце, код символа после апострофа
+    :param  text: запись числа
+        '10.'
+    :return:
+        10
+    """
+    if text[0] == "'":
+        return ord(text[1])
+    try:
+        if text[-1] == ".":
+            return int(text[:-1])
+        return int(text, 8)
+    except ValueError:
+        raise ValueError(
+            f"Неверное число {text!r}: восьмеричное - цифры 0-7, десятичное - с точкой на конце"
+        ) from None
+
+
+def check_not_register(name: str, text: str) -> None:
+    """
+    Проверяет, что имя в выражении - не регистр: '@#(R1)' или '#R1' - ошибка
+    режима адресации, а не ссылка на неизвестное имя
+    :param name: имя из выражения
+        'R1'
+    :param text: выражение или аргумент с ним
+        '(R1)'
+    """
+    if REGISTER_NAME_RE.fullmatch(name):
+        raise ValueError(
+            f"Регистр {name} в выражении {text!r}: регистр указывается только режимом "
+            f"адресации ({name}, ({name}), ({name})+, -({name}), X({name}) или они же с @)"
+        )
+
+
+@lru_cache(maxsize=4096)
+def parse_expression(text: str) -> Expression:
+    """
+    Разбирает выражение, сворачивая его константные части
+    :param text: выражение
+        'BUF+2*10.'
+        '.+100'
+        '-1'
+    :return:
+        ('BUF', 24, '+')
+        ('.', 64, '+')
+        -1
+    """
+    return _ExpressionParser(text).parse()
+
+
+def is_simple(text: str) -> bool:
+    """
+    Проверяет, что запись - одно число, символ или имя (их разбирают лексеры сами)
+    :param text: запись аргумента
+        'BUF+2'
+    :return:
+        False
+    """
+    return SIMPLE_RE.fullmatch(text) is not None
+
+
+def expression_names(expression: Expression) -> list[str]:
+    """
+    Возвращает имена, от которых зависит выражение
+    :param expression: разобранное выражение
+        ('BUF', 'N', 2, '*', '+')
+    :return:
+        ['BUF', 'N']
+    """
+    if type(expression) is int:
+        return []
+    items = expression if type(expression) is tuple else (expression,)
+    return [
+        item
+        for item in items
+        if type(item) is str
+        and item not in OPERATORS
+        and item not in (NEGATE, LOCATION)
+    ]
+
+
+class SymbolTable:
+    """
+    Таблица меток и переменных: имя -> значение (одна хэш-таблица на все имена)
+    Значение переменной вычисляется один раз при определении;
+    если оно зависит от ещё не определённых имён, выражение откладывается
+    до resolve_deferred
+    """
+
+    def __init__(self):
+        self.values: dict[str, int] = {}
+        # Отложенные переменные: имя -> (выражение, адрес строки определения)
+        self.deferred: dict[str, tuple[Expression, int]] = {}
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.values
+
+    def get(self, name: str) -> int | None:
+        return self.values.get(name)
+
+    def define(self, name: str, value: Expression, location: int = 0) -> None:
+        """
+        Определяет имя name
+        :param name: имя метки или переменной
+            'SIZE'
+        :param value: значение или выражение
+            ('N', 2, '*')
+        :param location: адрес строки определения (значение ".")
+            0o1000
+        """
+        result = self.evaluate(value, location)
+        if result is None:
+            # Прежнее значение переопределённого имени больше не действует:
+            # строки ниже до resolve_deferred ссылаются на новое, как ссылки вперёд
+            self.values.pop(name, None)
+            self.deferred[name] = (value, location)
+            return
+        self.values[name] = result
+        self.deferred.pop(name, None)
+
+    def evaluate(self, expression: Expression, location: int) -> int | None:
+        """
+        Вычисляет выражение, None - если в нём есть неопределённые имена
+        :param expression: разобранное выражение
+            ('BUF', 2, '+')
+        :param location: значение "."
+            0o1000
+        :return:
+            0o102
+        """
+        if type(expression) is int:
+            return expression
+        values = self.values
+        if type(expression) is str:
+            return location if expression == LOCATION else values.get(expression)
+
+        stack = []
+        for item in expression:
+            if type(item) is int:
+                stack.append(item)
+            elif item in OPERATORS:
+                right = stack.pop()
+                stack.append(OPERATORS[item][1](stack.pop(), right))
+            elif item == NEGATE:
+                stack.append(-stack.pop())
+            elif item == LOCATION:
+                stack.append(location)
+            else:
+                value = values.get(item)
+                if value is None:
+                    return None
+                stack.append(value)
+        return stack[0]
+
+    def resolve_deferred(self) -> None:
+        """
+        Вычисляет отложенные переменные, когда все метки уже определены
+        (переменные могут ссылаться друг на друга в любом порядке)
+        """
+        while self.deferred:
+            resolved = False
+            for name, (expression, location) in list(self.deferred.items()):
+                value = self.evaluate(expression, location)
+                if value is not None:
+                    self.values[name] = value
+                    del self.deferred[name]
+                    resolved = True
+            if not resolved:
+                names = ", ".join(sorted(self.deferred))
+                raise ValueError(f"Не удаётся вычислить значения: {names}")
@@ -0,0 +1,304 @@
+from array import array
+from bisect import bisect_left, bisect_right
+from collections.abc import Iterable, Iterator
+from pathlib import Path
+from typing import BinaryIO, NamedTuple
+import mmap
+import struct
+import sys
+import click
+
+# Карта программы (.map): метки и переменные и таблица адрес -> строка программы.
+# Строка указывается файлом исходника (программа или вставленный в неё файл)
+# и номером строки в нём, считая пустые.
+# Двоичный формат для mmap, все числа little-endian:
+#   заголовок MAP_HEADER: MAP_MAGIC, число имён S, число меток K, число строк L,
+#   число файлов F;
+#   значения имён по возрастанию имени (S q), адреса меток по возрастанию (K q);
+#   номера файлов и строк определений имён (S I, S I), смещения имён в блоке имён (S+1 I),
+#   номера имён меток в порядке их адресов (K I);
+#   столбцы строк по возрастанию адреса: адреса, размеры в байтах, номера файлов,
+#   номера строк (L I), смещения текстов в блоке текстов (L+1 I);
+#   смещения имён файлов в блоке файлов (F+1 I);
+#   признаки меток (S B), блок имён, блок текстов и блок файлов (UTF-8).
+# Поиск по имени и по адресу - bisect по столбцам прямо в отображении файла, O(log n)
+
+MAP_MAGIC = b"PDP11MAP"
+MAP_HEADER = struct.Struct("<8sIIII")
+
+
+class MapSymbol(NamedTuple):
+    """
+    Метка или переменная программы
+    """
+
+    name: str
+    value: int
+    # Файл (от каталога программы) и номер строки в нём с определением
+    file: str
+    line_num: int
+    label: bool
+
+
+class MapLine(NamedTuple):
+    """
+    Строка программы, занимающая байты: адрес, размер, файл и номер строки в нём, текст
+    """
+
+    address: int
+    size: int
+    file: str
+    line_num: int
+    text: str
+
+
+def column(data: memoryview, offset: int, code: str, count: int) -> memoryview | array:
+    """
+    Столбец чисел из данных карты без копирования, если порядок байт машины тот же
+    :param data: содержимое файла карты
+    :param offset: смещение столбца
+        20
+    :param code: код типа чисел (как в array)
+        'I'
+    :param count: число чисел
+        3
+    :return:
+        [0o1000, 0o1004, 0o1010]
+    """
+    size = struct.calcsize(code) * count
+    view = data[offset : offset + size]
+    if sys.byteorder == "little":
+        return view.cast(code)
+    values = array(code, view)
+    values.byteswap()
+    return values
+
+
+def write_map(
+    file: BinaryIO, symbols: Iterable[MapSymbol], lines: Iterable[MapLine]
+) -> None:
+    """
+    Записывает карту программы
+    :param file: файл, открытый на запись в двоичном режиме
+    :param symbols: имена программы
+        [MapSymbol(name='LOOP', value=0o1004, file='01_sum.pdp', line_num=5, label=True)]
+    :param lines: строки программы с байтами (в любом порядке)
+        [MapLine(address=0o1000, size=4, file='01_sum.pdp', line_num=3, text='\\tmov #2, R0')]
+    """
+    symbols = sorted(symbols)
+    lines = sorted(lines)
+    names = [symbol.name.encode() for symbol in symbols]
+    labels = sorted(
+        (symbol.value, index) for index, symbol in enumerate(symbols) if symbol.label
+    )
+    texts = [line.text.encode() for line in lines]
+    # Номера файлов в порядке их появления
+    files = {}
+    for item in (*symbols, *lines):
+        files.setdefault(item.file, len(files))
+
+    file.write(
+        MAP_HEADER.pack(MAP_MAGIC, len(symbols), len(labels), len(lines), len(files))
+    )
+    columns = (
+        array("q", [symbol.value for symbol in symbols]),
+        array("q", [value for value, _ in labels]),
+        array("I", [files[symbol.file] for symbol in symbols]),
+        array("I", [symbol.line_num for symbol in symbols]),
+        array("I", [0, *accumulate_sizes(names)]),
+        array("I", [index for _, index in labels]),
+        array("I", [line.address for line in lines]),
+        array("I", [line.size for line in lines]),
+        array("I", [files[line.file] for line in lines]),
+        array("I", [line.line_num for line in lines]),
+        array("I", [0, *accumulate_sizes(texts)]),
+        array("I", [0, *accumulate_sizes(name.encode() for name in files)]),
+        array("B", [symbol.label for symbol in symbols]),
+    )
+    for values in columns:
+        if sys.byteorder != "little":
+            values.byteswap()
+        values.tofile(file)
+    file.write(b"".join(names))
+    file.write(b"".join(texts))
+    file.write("".join(files).encode())
+
+
+def accumulate_sizes(items: Iterable[bytes]) -> Iterator[int]:
+    """
+    Смещения концов строк байт, записанных подряд
+    :param items: строки байт
+        [b'LOOP', b'N']
+    :return:
+        4, 5
+    """
+    end = 0
+    for item in items:
+        end += len(item)
+        yield end
+
+
+class SymbolMap:
+    """
+    Чтение карты программы (см. write_map): файл отображается в память,
+    поиск по имени и по адресу - двоичный, без разбора всей карты
+    """
+
+    def __init__(self, filename: str | Path):
+        with open(filename, "rb") as file:
+            self.data = memoryview(mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ))
+        magic, symbols, labels, lines, files = MAP_HEADER.unpack_from(self.data)
+        if magic != MAP_MAGIC:
+            raise ValueError(f"{filename} - не карта программы")
+
+        offset = MAP_HEADER.size
+
+        def take(code: str, count: int) -> memoryview | array:
+            nonlocal offset
+            values = column(self.data, offset, code, count)
+            offset += struct.calcsize(code) * count
+            return values
+
+        # Столбцы в порядке записи (см. write_map)
+        self.values = take("q", symbols)
+        self.label_values = take("q", labels)
+        self.symbol_files = take("I", symbols)
+        self.symbol_lines = take("I", symbols)
+        self.name_offsets = take("I", symbols + 1)
+        self.labels = take("I", labels)
+        self.addresses = take("I", lines)
+        self.sizes = take("I", lines)
+        self.line_files = take("I", lines)
+        self.line_nums = take("I", lines)
+        self.text_offsets = take("I", lines + 1)
+        file_offsets = take("I", files + 1)
+        self.label_flags = take("B", symbols)
+        self.names_start = offset
+        self.texts_start = offset + self.name_offsets[-1]
+        # Файлов немного - их имена читаются сразу
+        files_start = self.texts_start + self.text_offsets[-1]
+        self.files = [
+            str(self.data[files_start + start : files_start + end], "utf-8")
+            for start, end in zip(file_offsets, file_offsets[1:])
+        ]
+
+    def __len__(self) -> int:
+        return len(self.values)
+
+    def name(self, index: int) -> str:
+        """
+        Имя с номером index (по возрастанию имени)
+        """
+        start = self.names_start
+        return str(
+            self.data[
+                start + self.name_offsets[index] : start + self.name_offsets[index + 1]
+            ],
+            "utf-8",
+        )
+
+    def entry(self, index: int) -> MapSymbol:
+        """
+        Имя с номером index со значением и строкой определения
+        """
+        return MapSymbol(
+            self.name(index),
+            self.values[index],
+            self.files[self.symbol_files[index]],
+            self.symbol_lines[index],
+            bool(self.label_flags[index]),
+        )
+
+    def symbols(self) -> Iterator[MapSymbol]:
+        """
+        Все имена по возрастанию имени
+        :return:
+            MapSymbol(name='LOOP', value=0o1004, file='01_sum.pdp', line_num=5, label=True), ...
+        """
+        return map(self.entry, range(len(self)))
+
+    def symbol(self, name: str) -> MapSymbol | None:
+        """
+        Ищет имя
+        :param name: имя метки или переменной
+            'LOOP'
+        :return: None - такого имени нет
+            MapSymbol(name='LOOP', value=0o1004, file='01_sum.pdp', line_num=5, label=True)
+        """
+        index = bisect_left(range(len(self)), name, key=self.name)
+        if index < len(self) and self.name(index) == name:
+            return self.entry(index)
+        return None
+
+    def line_at(self, address: int) -> MapLine | None:
+        """
+        Ищет строку программы, байты которой занимают адрес
+        :param address: адрес
+            0o1002
+        :return: None - адрес не занят строкой
+            MapLine(address=0o1000, size=4, file='01_sum.pdp', line_num=3, text='\\tmov #2, R0')
+        """
+        index = bisect_right(self.addresses, address) - 1
+        if index < 0 or address >= self.addresses[index] + self.sizes[index]:
+            return None
+        start = self.texts_start
+        text = self.data[
+            start + self.text_offsets[index] : start + self.text_offsets[index + 1]
+        ]
+        return MapLine(
+            self.addresses[index],
+            self.sizes[index],
+            self.files[self.line_files[index]],
+            self.line_nums[index],
+            str(text, "utf-8"),
+        )
+
+    def label_at(self, address: int) -> tuple[str, int] | None:
+        """
+        Ближайшая метка не выше адреса и смещение адреса от неё
+        :param address: адрес
+            0o1006
+        :return: None - ниже адреса меток нет
+            ('LOOP', 2)
+        """
+        index = bisect_right(self.label_values, address) - 1
+        if index < 0:
+            return None
+        return self.name(self.labels[index]), address - self.label_values[index]
+
+
+@click.command()
+@click.argument("filename")
+@click.option(
+    "-a", "--address", "addresses", multiple=True, help="Найти адрес (восьмеричный)"
+)
+@click.option("-s", "--symbol", "names", multiple=True, help="Найти имя")
+def symmap(filename: str, addresses: tuple[str, ...], names: tuple[str, ...]):
+    """Печатает имена из карты программы FILENAME (.map) или ищет в ней адреса и имена"""
+    table = SymbolMap(filename)
+    for text in addresses:
+        address = int(text, 8)
+        line, label = table.line_at(address), table.label_at(address)
+        where = "" if label is None else f"{label[0]}+{label[1]:o}"
+        if line is None:
+            click.echo(f"{address:06o}\t{where}\t-")
+        else:
+            click.echo(
+                f"{address:06o}\t{where}\t{line.file}:{line.line_num}\t{line.text}"
+            )
+    for name in names:
+        symbol = table.symbol(name)
+        if symbol is None:
+            click.echo(f"{name}\t-")
+        else:
+            click.echo(f"{name}\t{symbol.value:06o}\t{symbol.file}:{symbol.line_num}")
+    if addresses or names:
+        return
+    for symbol in table.symbols():
+        kind = "label" if symbol.label else "variable"
+        where = f"{symbol.file}:{symbol.line_num}"
+        click.echo(f"{symbol.name}\t{symbol.value:06o}\t{where}\t{kind}")
+
+
+if __name__ == "__main__":
+    symmap()
@@ -0,0 +1,23 @@
+from pathlib import Path
+import pytest
+from helpers import PROGRAMS
+from pdp11_compiler import PDP11_Parser
+
+
+@pytest.fixture(params=PROGRAMS, ids=[program.stem for program in PROGRAMS])
+def source(request) -> Path:
+    """
+    Файл-исходник программы из pdp11_tests
+        Path('.../pdp11_tests/01_sum/01_sum.pdp')
+    """
+    return request.param
+
+
+@pytest.fixture
+def parser(source: Path) -> PDP11_Parser:
+    """
+    PDP11_Parser, собравший программу source в памяти
+    """
+    parser = PDP11_Parser()
+    parser.assemble(str(source))
+    return parser
@@ -0,0 +1,51 @@
+from pathlib import Path
+import shutil
+from pdp11_compiler import find_sources
+
+# Программы с ожидаемыми exp_*.o и exp_*.l (как у verify)
+ROOT = Path(__file__).resolve().parent.parent
+PROGRAMS = [Path(name) for name in find_sources([str(ROOT / "pdp11_tests")])]
+
+
+def copy_program(source: Path, directory: Path) -> Path:
+    """
+    Копирует каталог программы (со вставляемыми файлами) в directory,
+    чтобы собирать её в файлы, не записывая их рядом с исходником
+    :param source: файл-исходник
+        Path('pdp11_tests/15_include/15_include.pdp')
+    :param directory: временный каталог
+        Path('/tmp/pytest-0/test_cache0')
+    :return: путь копии исходника
+        Path('/tmp/pytest-0/test_cache0/15_include/15_include.pdp')
+    """
+    copy = directory / source.parent.name
+    shutil.copytree(source.parent, copy)
+    return copy / source.name
+
+
+def written_outputs(filename: Path) -> dict[str, str]:
+    """
+    Тексты .o и .l, записанные сборкой filename (каких нет - тех нет в словаре)
+    :param filename: файл-исходник
+        Path('/tmp/pytest-0/test_cache0/01_sum/01_sum.pdp')
+    :return:
+        {'o': '3e8 0006\nc0\n...', 'l': '...'}
+    """
+    found = {}
+    for kind in ("o", "l"):
+        path = filename.with_name(f"{filename.name}.{kind}")
+        if path.exists():
+            found[kind] = path.read_text()
+    return found
+
+
+def blocks_of(parser) -> dict[int, bytes]:
+    """
+    Непустые блоки собранной программы
+    :param parser: PDP11_Parser после сборки
+    :return:
+        {0o1000: b'\xc0\x15\x02\x00...'}
+    """
+    return {
+        address: bytes(data) for address, data in parser.object_lines.items() if data
+    }
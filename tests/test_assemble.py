@@ -0,0 +1,38 @@
+import pytest
+from helpers import blocks_of, copy_program, written_outputs
+from pdp11_compiler import PDP11_Parser, assemble, output_difference
+
+
+@pytest.mark.parametrize("form", ["text", "lines"])
+def test_assemble(parser, source, form):
+    """
+    assemble из текста и из строк в памяти даёт листинг exp_<имя>.l
+    и те же блоки и имена, что и сборка из файла
+    """
+    text = source.read_text()
+    program = text if form == "text" else text.splitlines(keepends=True)
+    result = assemble(program, directory=source.parent)
+    assert output_difference({"l": "\n".join(result.listing)}, source) is None
+    assert result.blocks == blocks_of(parser)
+    assert result.symbols == dict(parser.symbols.values)
+
+
+@pytest.mark.parametrize("outputs, kind", [("obj", "o"), ("listing", "l")])
+def test_outputs(parser, source, tmp_path, outputs, kind):
+    """
+    С outputs "obj" и "listing" пишется только свой файл, совпадающий с exp_*,
+    а assemble возвращает только блоки или только листинг
+    """
+    copy = copy_program(source, tmp_path)
+    PDP11_Parser(outputs=outputs).compile(str(copy))
+    written = written_outputs(copy)
+    assert list(written) == [kind]
+    assert output_difference(written, source) is None
+
+    result = assemble(source.read_text(), directory=source.parent, outputs=outputs)
+    if outputs == "obj":
+        assert result.listing is None
+        assert result.blocks == blocks_of(parser)
+    else:
+        assert not result.blocks
+        assert output_difference({"l": "\n".join(result.listing)}, source) is None
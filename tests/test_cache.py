@@ -0,0 +1,28 @@
+from cache import AssemblyCache
+from helpers import copy_program, written_outputs
+from pdp11_compiler import PDP11_Parser, output_difference
+
+
+def test_hit_and_edit(source, tmp_path):
+    """
+    Первая сборка с кэшем, повторная (файлы из кэша, без сборки) и после правки
+    исходника (закодированные строки переиспользуются) дают те же .o и .l,
+    что и сборка без кэша
+    """
+    copy = copy_program(source, tmp_path)
+    cache = AssemblyCache(tmp_path / "cache")
+    for run in ("cold", "hit"):
+        cached = PDP11_Parser(cache=cache)
+        cached.compile(str(copy))
+        assert output_difference(written_outputs(copy), source, f"{run}: ") is None
+    assert cached.filename is None, "program was assembled again"
+
+    # Правка: строка в начале сдвигает номера всех строк, но не их текст
+    copy.write_text("; edited\n" + copy.read_text())
+    cached = PDP11_Parser(cache=cache)
+    cached.compile(str(copy))
+    assert cached.line_cache, "coded lines were not reused"
+    edited = written_outputs(copy)
+    PDP11_Parser().compile(str(copy))
+    assert edited == written_outputs(copy)
+
@@ -0,0 +1,47 @@
+from random import Random
+import pytest
+from commands import COMMANDS
+import disasm
+from disasm import (
+    block_words,
+    decode_block,
+    decode_block_numpy,
+    disassemble_block,
+    load_numpy,
+)
+
+
+def test_command_mnemonics(parser):
+    """
+    Байты каждой команды (кроме удлинённых ветвлений) разбираются в её мнемонику
+    (или в мнемонику с тем же кодом, bhis - bcc) и занимают ровно её слова
+    """
+    for line_num, item in enumerate(parser.program_items()):
+        line = parser.parse_line(item) if type(item) is str else item
+        if line.name not in COMMANDS or line_num in parser.far_lines:
+            continue
+        counter, block, words, width = parser.line_record(line_num)
+        offset = counter - block
+        data = parser.object_lines[block][offset : offset + 2 * len(words)]
+        text, *word_lines = disassemble_block(counter, data)
+        name = text.partition(":\t\t")[2].split()[0]
+        assert COMMANDS[name].opcode == COMMANDS[line.name].opcode, text
+        assert len(word_lines) == len(words), text
+
+
+@pytest.mark.parametrize("size", [0, 1, 2, 3, 6, 7, 4096, 20001, 1 << 18])
+def test_numpy_matches_python(size):
+    """
+    Разбор массивами numpy (decode_block_numpy) даёт те же строки, что и цикл Python,
+    в том числе для команд, которым не хватило слов до конца блока,
+    и для блоков дальше 64 КБ адресов
+    """
+    if not load_numpy():
+        pytest.skip("numpy is not installed")
+    data = Random(size).randbytes(size)
+    for address in (0o1000, 0o177000):
+        expected = decode_block(address, block_words(data).tolist())
+        text = "".join(
+            decode_block_numpy(address, disasm.np.frombuffer(data, "<u2", size // 2))
+        )
+        assert text.split("\n")[:-1] == expected
@@ -0,0 +1,50 @@
+from pathlib import Path
+import pytest
+from helpers import PROGRAMS
+from devices import Console
+from emulator import PC, START_ADDRESS, Emulator
+
+# Предел команд и задержки передатчика консоли при исполнении программ
+MAX_STEPS = 1000000
+DELAYS = (0, 50)
+# Программы с ожидаемым выводом консоли exp_<имя>.out
+CONSOLE_PROGRAMS = [
+    program
+    for program in PROGRAMS
+    if program.with_name(f"exp_{program.name}.out").exists()
+]
+
+
+def run_console(parser, delay: int, fast_forward: bool) -> tuple[bytes, int]:
+    """
+    Исполняет собранную программу с адреса START_ADDRESS до halt
+    :param parser: PDP11_Parser после сборки
+    :param delay: задержка передатчика консоли, команд
+    :param fast_forward: пропускать ли циклы опроса
+    :return: вывод консоли и число исполненных команд
+        (b'Hello, world!', 1234)
+    """
+    console = Console(delay=delay)
+    emulator = Emulator([console], fast_forward=fast_forward)
+    emulator.load(parser.object_lines.items())
+    emulator.registers[PC] = START_ADDRESS
+    steps = emulator.run(MAX_STEPS)
+    assert emulator.halted, f"no halt in {MAX_STEPS} instructions"
+    return bytes(console.buffer), steps
+
+
+@pytest.mark.parametrize(
+    "source", CONSOLE_PROGRAMS, ids=[program.stem for program in CONSOLE_PROGRAMS]
+)
+@pytest.mark.parametrize("delay", DELAYS)
+def test_console_output(parser, source: Path, delay):
+    """
+    Вывод консоли совпадает с exp_<имя>.out, с пропуском циклов опроса
+    и без него - за одно и то же число команд
+    """
+    expected = source.with_name(f"exp_{source.name}.out").read_bytes()
+
+    fast = run_console(parser, delay, fast_forward=True)
+    slow = run_console(parser, delay, fast_forward=False)
+    assert fast[0] == expected
+    assert slow == fast
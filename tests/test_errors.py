@@ -0,0 +1,29 @@
+import re
+import pytest
+from pdp11_compiler import assemble
+
+# Ошибочная строка и начало сообщения об ошибке
+ERRORS = [
+    ("\t.BLKW 4", "Неизвестная директива .BLKW"),
+    ("\t.ASCII", "У .ASCII должна быть строка между одинаковыми символами"),
+    ("\t.ASCIZ /abc", "У .ASCIZ должна быть строка между одинаковыми символами"),
+    ("\tclr 8", "Неверное число '8'"),
+    ("\tclr 8(R1)", "Неверное число '8'"),
+    ("\tmov #19, R0", "Неверное число '19'"),
+    ("\t.WORD 9", "Неверное число '9'"),
+    ("\tmov @#(R1), R0", "Регистр R1 в выражении '(R1)'"),
+    ("\tmov #SP, R0", "Регистр SP в выражении '#SP'"),
+    ("\tclr FOO", "Неизвестное имя 'FOO'"),
+]
+
+
+@pytest.mark.parametrize("lexer", ["fast", "grammar"])
+@pytest.mark.parametrize("text, message", ERRORS)
+def test_error_message(text, message, lexer):
+    """
+    Ошибка в строке программы - ValueError с местом строки и сообщением ассемблера
+    (а не исключение pyparsing или int)
+    """
+    program = f"\tmov #1, R0\n{text}\n\thalt\n"
+    with pytest.raises(ValueError, match=f"^<source>:2: {re.escape(message)}"):
+        assemble(program, lexer=lexer)
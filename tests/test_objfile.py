@@ -0,0 +1,15 @@
+import pytest
+from objfile import OBJ_FORMATS, read_object
+from helpers import blocks_of
+
+
+@pytest.mark.parametrize("obj_format", OBJ_FORMATS)
+def test_read_back(parser, source, tmp_path, obj_format):
+    """
+    .o каждого формата читается обратно (objfile.read_object) в собранные блоки
+    """
+    parser.obj_format = obj_format
+    obj_name = tmp_path / f"{source.name}.o"
+    parser.write_obj(obj_name)
+    blocks = {address: bytes(data) for address, data in read_object(obj_name)}
+    assert blocks == blocks_of(parser)
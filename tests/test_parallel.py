@@ -0,0 +1,19 @@
+from pdp11_compiler import PDP11_Parser, output_difference
+
+# Кодирование в пуле кусками по 2 строки: куски есть даже у маленьких программ
+WORKERS = 2
+CHUNK_SIZE = 2
+
+
+def test_matches_serial(source):
+    """
+    Строки, закодированные в пуле процессов (как compile -j --chunk-size),
+    дают те же .o и .l, что и последовательная сборка
+    """
+    parser = PDP11_Parser(workers=WORKERS, chunk_size=CHUNK_SIZE)
+    parser.assemble(str(source))
+    results = {
+        "o": "".join(parser.render_obj()),
+        "l": "".join(parser.render_listing()),
+    }
+    assert output_difference(results, source) is None
@@ -0,0 +1,42 @@
+from concurrent.futures import ThreadPoolExecutor
+import threading
+from helpers import blocks_of, copy_program, written_outputs
+from pdp11_compiler import output_difference, serve_job
+from server import JobServer, send_jobs
+
+
+def test_round_trip(parser, source, tmp_path):
+    """
+    Сервер на Unix-сокете компилирует копию программы в файлы и собирает её текст
+    в памяти: файлы и листинг совпадают с exp_*, блоки - с собранными из файла
+    """
+    copy = copy_program(source, tmp_path)
+    jobs = [
+        {"id": 0, "file": str(copy)},
+        {"id": 1, "source": source.read_text(), "directory": str(source.parent)},
+    ]
+    socket_path = str(tmp_path / "serve.sock")
+    # Задания одного клиента выполняются по одному: shared_parser не для потоков
+    with ThreadPoolExecutor(1) as executor:
+        with JobServer(socket_path, executor, serve_job) as server:
+            # shutdown ждёт, пока сервер заметит его, до poll_interval секунд
+            thread = threading.Thread(
+                target=server.serve_forever, kwargs={"poll_interval": 0.01}
+            )
+            thread.start()
+            try:
+                responses = send_jobs(jobs, socket_path)
+            finally:
+                server.shutdown()
+                thread.join()
+
+    responses = {response["id"]: response for response in responses}
+    assert sorted(responses) == [0, 1]
+    for response in responses.values():
+        assert "error" not in response, response["error"]
+    assert output_difference(written_outputs(copy), source) is None
+
+    listing = {"l": "\n".join(responses[1]["listing"])}
+    assert output_difference(listing, source) is None
+    blocks = [[address, data.hex()] for address, data in blocks_of(parser).items()]
+    assert responses[1]["blocks"] == blocks
@@ -0,0 +1,30 @@
+from symmap import SymbolMap
+
+
+def test_source_lines(parser):
+    """
+    Строки файлов программы стоят в них на записанных в карте местах
+    """
+    texts: dict[str, list[str]] = {}
+    for line_num, item in enumerate(parser.program_items()):
+        if type(item) is not str:
+            continue
+        file, file_line = parser.line_source(line_num)
+        if file not in texts:
+            with open(parser.directory / file) as lines:
+                texts[file] = [text.rstrip() for text in lines]
+        assert texts[file][file_line - 1] == item
+
+
+def test_lookups(parser, source, tmp_path):
+    """
+    В записанной карте находятся все имена и первый и последний адрес каждой строки
+    """
+    map_name = tmp_path / f"{source.name}.map"
+    parser.write_symbol_map(map_name)
+    table = SymbolMap(map_name)
+    for symbol in parser.map_symbols():
+        assert table.symbol(symbol.name) == symbol
+    for line in parser.map_lines():
+        assert table.line_at(line.address) == line
+        assert table.line_at(line.address + line.size - 1) == line